@@ -16,11 +16,22 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
 from alx_backend_graphql_crm.schema import schema
+from crm.async_schema import async_schema
+from crm.views import (
+    AsyncCRMGraphQLView,
+    CRMGraphQLView,
+    export_view,
+    graphql_cache_stats,
+    metrics_view,
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema))),
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True, schema=schema))),
+    path("graphql/async", csrf_exempt(AsyncCRMGraphQLView.as_view(schema=async_schema))),
+    path("graphql/cache-stats", graphql_cache_stats),
+    path("export/<str:kind>", export_view),
+    path("metrics", metrics_view),
 ]
\ No newline at end of file
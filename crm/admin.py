@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Customer, Product, Order
+from .models import Customer, Product, Order, OrderLine
 
 
 @admin.register(Customer)
@@ -16,9 +16,21 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)
 
 
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    autocomplete_fields = ('product',)
+    extra = 1
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'customer', 'total_amount', 'order_date')
     search_fields = ('customer__name', 'customer__email')
     list_filter = ('order_date',)
-    filter_horizontal = ('products',)
+    inlines = (OrderLineInline,)
+    readonly_fields = ('total_amount',)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # The total follows the lines that were just saved
+        form.instance.calculate_total()
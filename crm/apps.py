@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import instrumentation, signals, sqlite_tuning  # noqa: F401
+
+        connection_created.connect(instrumentation.install, dispatch_uid='crm.instrumentation')
+        connection_created.connect(sqlite_tuning.configure, dispatch_uid='crm.sqlite_tuning')
@@ -0,0 +1,146 @@
+"""
+Asynchronous execution of the CRM schema for the ASGI entry point.
+
+AsyncQuery resolves the single-object, list and aggregate root fields with
+Django's async ORM, so sibling root fields run concurrently on the event
+loop. Every other resolver is synchronous and is bridged by
+SyncResolverMiddleware: the remaining root fields (connections, search) run
+on a bounded thread pool, and relation fields of the model types run on the
+request's thread-sensitive thread, one at a time, so the loaders keep
+batching siblings exactly as they do in the sync view. The pooled root
+fields share the request's loaders, which the view creates before execution
+and which lock their queues (crm.loaders).
+"""
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from graphene.utils.str_converters import to_snake_case
+from graphql import get_named_type, is_composite_type
+from crm.models import Product, Customer, Order
+from .loaders import get_loaders
+from .optimizer import optimize_queryset
+from .schema import (
+    Mutation,
+    Query,
+    Schema,
+    crm_stats_aggregates,
+    crm_stats_result,
+    filter_customers_list,
+    filter_orders_list,
+    filter_products_list,
+    list_limit,
+    sales_point,
+    sales_series_queryset,
+)
+
+# Also bounds the database connections the async view opens for sync paths
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'CRM_ASYNC_THREAD_POOL_SIZE', 8),
+    thread_name_prefix='crm-graphql',
+)
+
+
+def _run_and_release(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Pool threads outlive the request; release their connection the
+        # way request_finished does for the request thread
+        close_old_connections()
+
+
+def run_in_pool(func, *args, **kwargs):
+    """Await a sync callable on the bounded pool, in parallel with siblings"""
+    return sync_to_async(
+        _run_and_release, thread_sensitive=False, executor=executor
+    )(func, *args, **kwargs)
+
+
+async def aprime_list(info, queryset, first=None):
+    """Async prime_list: evaluate a capped queryset and queue its relations"""
+    rows = [row async for row in queryset[:list_limit(first)]]
+    get_loaders(info).prime(rows)
+    return rows
+
+
+async def aget_optimized(info, model, id):
+    try:
+        instance = await optimize_queryset(model.objects.all(), info).aget(pk=id)
+    except model.DoesNotExist:
+        return None
+    get_loaders(info).prime([instance])
+    return instance
+
+
+class AsyncQuery(Query):
+    """Query with the root fields that map onto one ORM call made async"""
+
+    class Meta:
+        name = 'Query'
+
+    async def resolve_hello(self, info):
+        return Query.resolve_hello(self, info)
+
+    async def resolve_crm_stats(self, info, date_from=None, date_to=None):
+        stats = await Customer.objects.order_by().aaggregate(
+            **crm_stats_aggregates(date_from, date_to)
+        )
+        return crm_stats_result(stats)
+
+    async def resolve_sales_series(self, info, date_from, date_to, granularity='day', **kwargs):
+        queryset = sales_series_queryset(granularity, date_from, date_to, **kwargs)
+        return [sales_point(row) async for row in queryset]
+
+    async def resolve_customers_list(self, info, **kwargs):
+        queryset = optimize_queryset(Customer.objects.all(), info)
+        return await aprime_list(info, filter_customers_list(queryset, kwargs), kwargs.get('first'))
+
+    async def resolve_products_list(self, info, **kwargs):
+        queryset = optimize_queryset(Product.objects.all(), info)
+        return await aprime_list(info, filter_products_list(queryset, kwargs), kwargs.get('first'))
+
+    async def resolve_orders_list(self, info, **kwargs):
+        queryset = optimize_queryset(Order.objects.all(), info)
+        return await aprime_list(info, filter_orders_list(queryset, kwargs), kwargs.get('first'))
+
+    async def resolve_customer(self, info, id):
+        return await aget_optimized(info, Customer, id)
+
+    async def resolve_product(self, info, id):
+        return await aget_optimized(info, Product, id)
+
+    async def resolve_order(self, info, id):
+        return await aget_optimized(info, Order, id)
+
+
+ASYNC_ROOT_FIELDS = frozenset(
+    name for name in AsyncQuery._meta.fields
+    if inspect.iscoroutinefunction(getattr(AsyncQuery, f'resolve_{name}', None))
+)
+
+
+def _is_model_type(gql_type):
+    meta = getattr(getattr(gql_type, 'graphene_type', None), '_meta', None)
+    return getattr(meta, 'model', None) is not None
+
+
+class SyncResolverMiddleware:
+    """Keep synchronous resolvers off the event loop (see module docstring)"""
+
+    def resolve(self, next_, root, info, **args):
+        if info.field_name.startswith('__'):
+            return next_(root, info, **args)
+        if info.parent_type is info.schema.query_type:
+            if to_snake_case(info.field_name) in ASYNC_ROOT_FIELDS:
+                return next_(root, info, **args)
+            return run_in_pool(next_, root, info, **args)
+        if _is_model_type(info.parent_type) and is_composite_type(get_named_type(info.return_type)):
+            return sync_to_async(next_)(root, info, **args)
+        # Scalars, connection wrappers and payloads only read attributes
+        return next_(root, info, **args)
+
+
+# Mutations run synchronously in a thread, inside their transaction
+async_schema = Schema(query=AsyncQuery, mutation=Mutation)
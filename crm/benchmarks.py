@@ -0,0 +1,248 @@
+"""
+Resolver-level benchmarks: a fixed catalog of GraphQL operations run
+in-process through schema.execute.
+
+Each operation records latency percentiles and the number of SQL queries it
+issues. Results are plain dicts, written as JSON and compared against a
+stored baseline: latencies may drift within a tolerance, query counts may
+not grow at all.
+"""
+import time
+from collections import namedtuple
+from datetime import timedelta
+from types import SimpleNamespace
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Customer, Product, Order
+
+SCALES = {
+    '1k': {'customers': 200, 'products': 100, 'orders': 1_000},
+    '100k': {'customers': 20_000, 'products': 2_000, 'orders': 100_000},
+    '1m': {'customers': 200_000, 'products': 10_000, 'orders': 1_000_000},
+}
+
+# Depend on the rollback wrapper and on nesting, not on the operation
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+Operation = namedtuple('Operation', 'name root document variables')
+
+ORDER_FIELDS = """
+    id totalAmount orderDate
+    customer { name email }
+    lines { quantity unitPrice product { name } }
+"""
+
+CATALOG = (
+    Operation('hello', 'hello', "query { hello }", None),
+    Operation('allCustomers', 'allCustomers', """
+        query($name: String) {
+            allCustomers(first: 20, name: $name) {
+                edges { node { id name email orders(first: 5) { edges { node { id totalAmount } } } } }
+            }
+        }
+    """, lambda f, i: {'name': 'Customer 1'}),
+    Operation('allProducts', 'allProducts', """
+        query {
+            allProducts(first: 20, priceGte: 10) {
+                edges { node { id name price stock orders(first: 3) { edges { node { id } } } } }
+            }
+        }
+    """, None),
+    Operation('allOrders', 'allOrders', """
+        query {
+            allOrders(first: 20, totalAmountGte: 50) {
+                edges { node { %s products(first: 5) { edges { node { name } } } } }
+            }
+        }
+    """ % ORDER_FIELDS, None),
+    Operation('allCustomersKeyset', 'allCustomersKeyset', """
+        query { allCustomersKeyset(first: 20) { edges { node { id name email } } pageInfo { endCursor } } }
+    """, None),
+    Operation('allProductsKeyset', 'allProductsKeyset', """
+        query { allProductsKeyset(first: 20, lowStock: 10) { edges { node { id name stock } } } }
+    """, None),
+    Operation('allOrdersKeyset', 'allOrdersKeyset', """
+        query($since: DateTime) {
+            allOrdersKeyset(first: 20, orderDateGte: $since) { edges { node { %s } } }
+        }
+    """ % ORDER_FIELDS, lambda f, i: {'since': f.since.isoformat()}),
+    Operation('customersList', 'customersList', """
+        query { customersList(first: 20, name: "Customer") { id name orders { edges { node { id } } } } }
+    """, None),
+    Operation('productsList', 'productsList', """
+        query { productsList(first: 20, priceGte: 10) { id name price } }
+    """, None),
+    Operation('ordersList', 'ordersList', """
+        query { ordersList(first: 20, customerName: "Customer") { %s } }
+    """ % ORDER_FIELDS, None),
+    Operation('customer', 'customer', """
+        query($id: ID!) {
+            customer(id: $id) { name email orders(first: 10) { edges { node { id totalAmount } } } }
+        }
+    """, lambda f, i: {'id': f.customer_id}),
+    Operation('product', 'product', """
+        query($id: ID!) { product(id: $id) { name price stock orders(first: 10) { edges { node { id } } } } }
+    """, lambda f, i: {'id': f.product_ids[0]}),
+    Operation('order', 'order', """
+        query($id: ID!) { order(id: $id) { %s } }
+    """ % ORDER_FIELDS, lambda f, i: {'id': f.order_id}),
+    Operation('crmStats', 'crmStats', """
+        query { crmStats { totalCustomers totalOrders totalRevenue averageOrderValue } }
+    """, None),
+    Operation('crmStatsRange', 'crmStats', """
+        query($since: DateTime) {
+            crmStats(dateFrom: $since) { newCustomers totalOrders totalRevenue distinctPurchasers }
+        }
+    """, lambda f, i: {'since': f.since.isoformat()}),
+    Operation('salesSeries', 'salesSeries', """
+        query($from: Date!, $to: Date!) {
+            salesSeries(from: $from, to: $to) { period orderCount revenue }
+        }
+    """, lambda f, i: {'from': str(f.since.date()), 'to': str(f.today)}),
+    Operation('salesSeriesProduct', 'salesSeries', """
+        query($from: Date!, $to: Date!, $product: ID) {
+            salesSeries(granularity: WEEK, from: $from, to: $to, productId: $product) {
+                period quantity revenue
+            }
+        }
+    """, lambda f, i: {'from': str(f.since.date()), 'to': str(f.today), 'product': f.product_ids[0]}),
+    Operation('search', 'search', """
+        query { search(query: "Customer 1", first: 10) { __typename } }
+    """, None),
+    Operation('createCustomer', 'createCustomer', """
+        mutation($email: String!) {
+            createCustomer(input: {name: "Bench", email: $email}) { customer { id } }
+        }
+    """, lambda f, i: {'email': f"bench-create-{i}@example.com"}),
+    Operation('bulkCreateCustomers', 'bulkCreateCustomers', """
+        mutation($input: [CustomerInput]!) {
+            bulkCreateCustomers(input: $input) { successCount errors }
+        }
+    """, lambda f, i: {'input': [
+        {'name': "Bench", 'email': f"bench-bulk-{i}-{n}@example.com"} for n in range(20)
+    ]}),
+    Operation('createProduct', 'createProduct', """
+        mutation { createProduct(input: {name: "Bench product", price: "9.99", stock: 5}) { product { id } } }
+    """, None),
+    Operation('createOrder', 'createOrder', """
+        mutation($input: OrderInput!) { createOrder(input: $input) { success order { id totalAmount } } }
+    """, lambda f, i: {'input': {
+        'customerId': f.customer_id,
+        'lines': [{'productId': pid, 'quantity': 2} for pid in f.product_ids],
+    }}),
+    Operation('bulkCreateOrders', 'bulkCreateOrders', """
+        mutation($input: [OrderInput]!) { bulkCreateOrders(input: $input) { successCount errors } }
+    """, lambda f, i: {'input': [
+        {'customerId': f.customer_id, 'lines': [{'productId': pid, 'quantity': 2} for pid in f.product_ids]}
+        for _ in range(20)
+    ]}),
+    Operation('updateLowStockProducts', 'updateLowStockProducts', """
+        mutation { updateLowStockProducts(threshold: 5, increment: 1) { success updatedProducts { id } } }
+    """, None),
+)
+
+
+def uncovered_fields(schema):
+    """Root query and mutation fields that no catalog operation exercises"""
+    covered = {operation.root for operation in CATALOG}
+    graphql_schema = schema.graphql_schema
+    roots = set(graphql_schema.query_type.fields)
+    if graphql_schema.mutation_type:
+        roots.update(graphql_schema.mutation_type.fields)
+    return sorted(roots - covered)
+
+
+def fixtures():
+    """Ids and dates the catalog's variables are built from"""
+    now = timezone.now()
+    return SimpleNamespace(
+        customer_id=Customer.objects.order_by('pk').values_list('pk', flat=True).first(),
+        product_ids=list(Product.objects.order_by('pk').values_list('pk', flat=True)[:3]),
+        order_id=Order.objects.order_by('pk').values_list('pk', flat=True).first(),
+        since=now - timedelta(days=90),
+        today=timezone.localdate(now),
+    )
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _execute(schema, operation, fixture, i):
+    variables = operation.variables(fixture, i) if operation.variables else None
+    is_mutation = operation.document.lstrip().startswith('mutation')
+    # Mutations are rolled back so every run sees the same data
+    with transaction.atomic():
+        started = time.perf_counter()
+        result = schema.execute(
+            operation.document, variables=variables, context_value=SimpleNamespace()
+        )
+        seconds = time.perf_counter() - started
+        if is_mutation:
+            transaction.set_rollback(True)
+    return result, seconds
+
+
+def run_operation(schema, operation, fixture, iterations=20, warmup=2):
+    """Time one operation; the query count comes from a separate run"""
+    for i in range(warmup):
+        _execute(schema, operation, fixture, -1 - i)
+    # Counted with a wrapper: once DEBUG has filled connection.queries_log,
+    # CaptureQueriesContext sees no new queries
+    statements = []
+
+    def record(execute, sql, params, many, context):
+        statements.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        result, _ = _execute(schema, operation, fixture, 0)
+    latencies = [
+        _execute(schema, operation, fixture, i)[1] for i in range(1, iterations + 1)
+    ]
+    return {
+        'queries': sum(
+            1 for sql in statements if not sql.upper().startswith(TRANSACTION_STATEMENTS)
+        ),
+        'errors': [error.message for error in result.errors or []],
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+    }
+
+
+def run_catalog(schema, iterations=20, warmup=2, only=None):
+    fixture = fixtures()
+    return {
+        operation.name: run_operation(schema, operation, fixture, iterations, warmup)
+        for operation in CATALOG
+        if not only or operation.name in only
+    }
+
+
+def compare(results, baseline, tolerance=0.25, min_delta_ms=1.0, keys=('p50_ms', 'p95_ms')):
+    """
+    Regressions of `results` against `baseline` (both run_catalog() dicts):
+    latencies in `keys` more than `tolerance` and `min_delta_ms` slower, or
+    any extra query. The absolute floor keeps sub-millisecond noise from
+    failing runs.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['queries'] > previous['queries']:
+            regressions.append(
+                f"{name}: {current['queries']} queries (baseline {previous['queries']})"
+            )
+        for key in keys:
+            limit = max(previous[key] * (1 + tolerance), previous[key] + min_delta_ms)
+            if current[key] > limit:
+                regressions.append(
+                    f"{name}: {key} {current[key]:.2f} > {limit:.2f} "
+                    f"(baseline {previous[key]:.2f} +{tolerance:.0%})"
+                )
+    return regressions
@@ -0,0 +1,167 @@
+"""
+Static cost analysis of GraphQL operations.
+
+The cost of an operation is the number of objects it can return: an object
+field counts once per parent, and list fields and connections multiply
+everything below them by their page size (first/last, or the maximum page
+size when the client does not ask for fewer). Depth counts nested object
+levels; the edges/node wrappers of a connection do not add to it.
+
+Variables are coerced against the operation's definitions first, as
+execution does. An operation whose variables do not coerce is priced as if
+none were given and fails when it runs.
+"""
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    InlineFragmentNode,
+    OperationDefinitionNode,
+    get_named_type,
+    get_nullable_type,
+    is_composite_type,
+)
+from graphql.execution.values import get_argument_values, get_variable_values
+from graphql.validation import ValidationRule
+
+
+def max_page_size():
+    return graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+
+def page_size(field_def, node, variables):
+    """Rows a list field or connection returns at most, per parent"""
+    try:
+        args = get_argument_values(field_def, node, variables)
+    except GraphQLError:
+        args = {}
+    requested = [args[key] for key in ('first', 'last') if args.get(key) is not None]
+    if requested:
+        return max(0, min(requested + [max_page_size()]))
+    return max_page_size()
+
+
+def _is_connection(gql_type):
+    fields = getattr(gql_type, 'fields', {})
+    return 'edges' in fields and 'pageInfo' in fields
+
+
+def _is_edge(gql_type):
+    fields = getattr(gql_type, 'fields', {})
+    return 'node' in fields and 'cursor' in fields
+
+
+def _fields(schema, fragments, parent_type, selection_set, seen=()):
+    """Flatten fragments into (field node, field definition) pairs"""
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            field_def = getattr(parent_type, 'fields', {}).get(selection.name.value)
+            if field_def is not None:
+                yield selection, field_def
+        elif isinstance(selection, InlineFragmentNode):
+            condition = selection.type_condition
+            target = schema.get_type(condition.name.value) if condition else parent_type
+            yield from _fields(schema, fragments, target, selection.selection_set, seen)
+        elif isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            fragment = fragments.get(name)
+            # Fragment cycles are reported by the standard rules
+            if fragment is not None and name not in seen:
+                target = schema.get_type(fragment.type_condition.name.value)
+                yield from _fields(
+                    schema, fragments, target, fragment.selection_set, seen + (name,)
+                )
+
+
+def measure(schema, fragments, parent_type, selection_set, variables, multiplier=1, depth=0):
+    """Return (cost, depth) of a selection set resolved `multiplier` times"""
+    cost, deepest = 0, depth
+    for node, field_def in _fields(schema, fragments, parent_type, selection_set):
+        field_type = get_nullable_type(field_def.type)
+        named = get_named_type(field_type)
+        if not is_composite_type(named):
+            continue
+
+        # Connection wrappers were already counted by the connection field
+        if _is_connection(parent_type) and node.name.value in ('edges', 'pageInfo'):
+            if node.name.value == 'edges':
+                sub_cost, sub_depth = measure(
+                    schema, fragments, named, node.selection_set, variables, multiplier, depth
+                )
+                cost, deepest = cost + sub_cost, max(deepest, sub_depth)
+            continue
+        if _is_edge(parent_type) and node.name.value == 'node':
+            sub_cost, sub_depth = measure(
+                schema, fragments, named, node.selection_set, variables, multiplier, depth
+            )
+            cost, deepest = cost + sub_cost, max(deepest, sub_depth)
+            continue
+
+        if _is_connection(named) or isinstance(field_type, GraphQLList):
+            rows = multiplier * page_size(field_def, node, variables)
+        else:
+            rows = multiplier
+        sub_cost, sub_depth = measure(
+            schema, fragments, named, node.selection_set, variables, rows, depth + 1
+        )
+        cost, deepest = cost + rows + sub_cost, max(deepest, sub_depth)
+    return cost, deepest
+
+
+def coerce_variables(schema, operation, variables):
+    """Variable values as execution sees them, or a list of coercion errors"""
+    return get_variable_values(schema, operation.variable_definitions or (), variables or {})
+
+
+def operation_cost(schema, document, operation, variables=None):
+    """Return (cost, depth) of one operation of a parsed document"""
+    variables = coerce_variables(schema, operation, variables)
+    if isinstance(variables, list):
+        variables = {}
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if not isinstance(definition, OperationDefinitionNode)
+    }
+    root = schema.get_root_type(operation.operation)
+    return measure(schema, fragments, root, operation.selection_set, variables)
+
+
+def cost_limit_validator(max_cost, max_depth, variables=None, callback=None):
+    """
+    Build a validation rule rejecting operations over `max_cost` objects or
+    `max_depth` nested levels. `callback` receives {operation name: (cost, depth)}.
+    """
+
+    class CostLimitValidator(ValidationRule):
+        def enter_document(self, document, *_args):
+            costs = {}
+            for definition in document.definitions:
+                if not isinstance(definition, OperationDefinitionNode):
+                    continue
+                name = definition.name.value if definition.name else ''
+                cost, depth = operation_cost(
+                    self.context.schema, document, definition, variables
+                )
+                costs[name] = (cost, depth)
+                label = f"'{name}'" if name else "Operation"
+                if depth > max_depth:
+                    self.report_error(GraphQLError(
+                        f"{label} exceeds the maximum depth of {max_depth}.",
+                        definition,
+                        extensions={'code': 'QUERY_TOO_DEEP', 'depth': depth},
+                    ))
+                if cost > max_cost:
+                    self.report_error(GraphQLError(
+                        f"{label} has a cost of {cost}, over the budget of {max_cost}.",
+                        definition,
+                        extensions={'code': 'QUERY_TOO_COSTLY', 'cost': cost},
+                    ))
+            if callable(callback):
+                callback(costs)
+
+    return CostLimitValidator
@@ -1,9 +1,28 @@
 from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from crm import graphql_executor
 
-GRAPHQL_URL = "http://localhost:8000/graphql"
 HEARTBEAT_LOG = "/tmp/crm_heartbeat_log.txt"
+LOW_STOCK_LOG = "/tmp/low_stock_updates_log.txt"
+
+HEARTBEAT_QUERY = """
+    query {
+        hello
+    }
+"""
+
+LOW_STOCK_MUTATION = """
+    mutation {
+        updateLowStockProducts {
+            success
+            message
+            updatedProducts {
+                id
+                name
+                stock
+            }
+        }
+    }
+"""
 
 def log_crm_heartbeat():
     """
@@ -18,18 +37,9 @@ def log_crm_heartbeat():
         with open(HEARTBEAT_LOG, 'a') as f:
             f.write(heartbeat_msg)
         
-        # Optional: Query GraphQL hello field to verify endpoint is responsive
+        # Optional: Query GraphQL hello field to verify the schema is responsive
         try:
-            transport = RequestsHTTPTransport(url=GRAPHQL_URL)
-            client = Client(transport=transport, fetch_schema_from_transport=False)
-            
-            query = gql("""
-                query {
-                    hello
-                }
-            """)
-            
-            result = client.execute(query)
+            result = graphql_executor.execute(HEARTBEAT_QUERY)
             if result.get('hello'):
                 print(f"[Heartbeat] {heartbeat_msg.strip()} - GraphQL endpoint responsive")
         except Exception as e:
@@ -45,36 +55,13 @@ def update_low_stock():
     Updates products with stock < 10 by incrementing stock by 10.
     Logs updated product names and new stock levels to /tmp/low_stock_updates_log.txt
     """
-    from gql import gql, Client
-    from gql.transport.requests import RequestsHTTPTransport
-    from datetime import datetime
-    
-    GRAPHQL_URL = "http://localhost:8000/graphql"
-    LOG_FILE = "/tmp/low_stock_updates_log.txt"
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
     try:
-        transport = RequestsHTTPTransport(url=GRAPHQL_URL)
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        
-        mutation = gql("""
-            mutation {
-                updateLowStockProducts {
-                    success
-                    message
-                    updatedProducts {
-                        id
-                        name
-                        stock
-                    }
-                }
-            }
-        """)
-        
-        result = client.execute(mutation)
+        result = graphql_executor.execute(LOW_STOCK_MUTATION)
         
         # Log the results
-        with open(LOG_FILE, 'a') as f:
+        with open(LOW_STOCK_LOG, 'a') as f:
             if result.get('updateLowStockProducts', {}).get('success'):
                 f.write(f"[{timestamp}] Low stock update executed successfully\n")
                 for product in result.get('updateLowStockProducts', {}).get('updatedProducts', []):
@@ -87,5 +74,5 @@ def update_low_stock():
     
     except Exception as e:
         print(f"Error updating low stock products: {e}")
-        with open(LOG_FILE, 'a') as f:
+        with open(LOW_STOCK_LOG, 'a') as f:
             f.write(f"[{timestamp}] Error: {str(e)}\n")
\ No newline at end of file
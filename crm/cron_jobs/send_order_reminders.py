@@ -2,8 +2,6 @@
 import sys
 import os
 from datetime import datetime, timedelta
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
 
 # Add project to path
 sys.path.insert(0, '/path/to/project')
@@ -12,22 +10,17 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crm.settings')
 import django
 django.setup()
 
-# GraphQL endpoint configuration
-GRAPHQL_URL = "http://localhost:8000/graphql"
+from django.utils import timezone
+from crm import graphql_executor
+
 LOG_FILE = "/tmp/order_reminders_log.txt"
 
-def get_pending_orders():
-    """Query GraphQL endpoint for orders from the last 7 days"""
-    try:
-        transport = RequestsHTTPTransport(url=GRAPHQL_URL)
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        
-        # Calculate date 7 days ago
-        seven_days_ago = (datetime.now() - timedelta(days=7)).isoformat()
-        
-        query = gql("""
-            query {
-                orders(orderDateAfter: "%s") {
+# Keyset pages of recent orders; no COUNT(*) and no OFFSET per page
+PENDING_ORDERS_QUERY = """
+    query($since: DateTime!, $after: String) {
+        allOrdersKeyset(orderDateGte: $since, first: 100, after: $after) {
+            edges {
+                node {
                     id
                     orderDate
                     customer {
@@ -36,10 +29,30 @@ def get_pending_orders():
                     }
                 }
             }
-        """ % seven_days_ago)
-        
-        result = client.execute(query)
-        return result.get('orders', [])
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+        }
+    }
+"""
+
+def get_pending_orders():
+    """Query the CRM schema for orders from the last 7 days"""
+    try:
+        # Calculate date 7 days ago
+        seven_days_ago = (timezone.now() - timedelta(days=7)).isoformat()
+
+        orders, after = [], None
+        while True:
+            result = graphql_executor.execute(
+                PENDING_ORDERS_QUERY, {'since': seven_days_ago, 'after': after}
+            )
+            connection = result['allOrdersKeyset']
+            orders.extend(edge['node'] for edge in connection['edges'])
+            if not connection['pageInfo']['hasNextPage']:
+                return orders
+            after = connection['pageInfo']['endCursor']
     
     except Exception as e:
         print(f"Error querying GraphQL endpoint: {e}")
@@ -0,0 +1,210 @@
+"""
+Read replicas for the CRM: reads go to a weighted, healthy replica and
+everything else to the primary (the 'default' alias).
+
+Reads also go to the primary when they are
+- inside transaction.atomic on the primary,
+- part of a mutation (the views wrap mutations in use_primary()),
+- in a request that has already written, or whose client wrote less than
+  CRM_PRIMARY_STICKY_SECONDS ago, so clients read their own writes.
+
+DatabaseRoutingMiddleware keeps the per-request state: every read of one
+request uses the same replica, and a request that wrote sets a short-lived
+cookie that pins the client's next requests to the primary. The state lives
+in a context variable, which asgiref copies into sync_to_async threads.
+
+With CRM_DATABASE_REPLICAS empty the router returns None everywhere and
+Django's default routing applies.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import monotonic
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.decorators import sync_and_async_middleware
+
+PRIMARY = DEFAULT_DB_ALIAS
+
+_state = ContextVar('crm_db_routing', default=None)
+
+
+def replicas():
+    """Replica aliases and their weights"""
+    return getattr(settings, 'CRM_DATABASE_REPLICAS', None) or {}
+
+
+class RoutingState:
+    __slots__ = ('pinned', 'wrote', 'replica')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        # The replica this request reads from, chosen on its first read
+        self.replica = None
+
+
+class ReplicaHealth:
+    """Per-process health of each replica, checked at most every CRM_REPLICA_HEALTH_INTERVAL seconds"""
+
+    def __init__(self):
+        self._checked = {}
+        self._lock = Lock()
+
+    def is_healthy(self, alias):
+        interval = getattr(settings, 'CRM_REPLICA_HEALTH_INTERVAL', 5)
+        entry = self._checked.get(alias)
+        now = monotonic()
+        if entry is not None and now - entry[1] < interval:
+            return entry[0]
+        healthy = self.check(alias)
+        with self._lock:
+            self._checked[alias] = (healthy, now)
+        return healthy
+
+    def check(self, alias):
+        """The replica answers, has the schema and, on PostgreSQL, is not lagging too far"""
+        connection = connections[alias]
+        max_lag = getattr(settings, 'CRM_REPLICA_MAX_LAG_SECONDS', None)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM django_migrations LIMIT 1")
+                if max_lag is not None and connection.vendor == 'postgresql':
+                    cursor.execute(
+                        "SELECT pg_is_in_recovery(), "
+                        "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+                    )
+                    in_recovery, lag = cursor.fetchone()
+                    if in_recovery and lag is not None and lag > max_lag:
+                        return False
+        except DatabaseError:
+            return False
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._checked.clear()
+
+
+health = ReplicaHealth()
+
+
+def choose_replica():
+    """A healthy replica drawn by weight, or the primary when none is healthy"""
+    candidates = [
+        (alias, weight) for alias, weight in replicas().items()
+        if weight > 0 and health.is_healthy(alias)
+    ]
+    if not candidates:
+        return PRIMARY
+    aliases, weights = zip(*candidates)
+    return random.choices(aliases, weights)[0]
+
+
+@contextmanager
+def routing(pinned=False):
+    """Routing state for one request; yields it"""
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Send every read in the block to the primary"""
+    state = _state.get()
+    if state is None:
+        with routing(pinned=True):
+            yield
+        return
+    previous = state.pinned
+    state.pinned = True
+    try:
+        yield
+    finally:
+        state.pinned = previous
+
+
+def read_from_replica():
+    """Whether the current request's reads may have come from a replica"""
+    if not replicas():
+        return False
+    state = _state.get()
+    if state is None:
+        # Outside a request every read picks a replica
+        return True
+    if state.pinned or state.wrote:
+        return False
+    return state.replica not in (None, PRIMARY)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not replicas():
+            return None
+        state = _state.get()
+        if state is not None and (state.pinned or state.wrote):
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        if state is None:
+            return choose_replica()
+        if state.replica is None:
+            state.replica = choose_replica()
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        if not replicas():
+            return None
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not replicas():
+            return None
+        # Replicas hold the same rows as the primary
+        databases = {PRIMARY, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication (or as a copy locally)
+        if db in replicas():
+            return False
+        return None
+
+
+def _pin(state, response):
+    if state.wrote:
+        response.set_cookie(
+            getattr(settings, 'CRM_PRIMARY_STICKY_COOKIE', 'crm_primary'), '1',
+            max_age=getattr(settings, 'CRM_PRIMARY_STICKY_SECONDS', 5),
+            httponly=True, samesite='Lax',
+        )
+    return response
+
+
+@sync_and_async_middleware
+def DatabaseRoutingMiddleware(get_response):
+    """Hold the routing state of each request and pin clients that wrote"""
+    cookie = getattr(settings, 'CRM_PRIMARY_STICKY_COOKIE', 'crm_primary')
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with routing(pinned=cookie in request.COOKIES) as state:
+                response = await get_response(request)
+            return _pin(state, response)
+    else:
+        def middleware(request):
+            with routing(pinned=cookie in request.COOKIES) as state:
+                response = get_response(request)
+            return _pin(state, response)
+    return middleware
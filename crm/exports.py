@@ -0,0 +1,142 @@
+"""
+Streaming exports of customers, products and orders as NDJSON or CSV.
+
+Rows are read with QuerySet.iterator() (a server-side cursor on PostgreSQL)
+and written as they are produced, so memory use does not grow with the
+number of rows exported. Order lines are loaded with one query per chunk.
+
+Orders carry their lines as objects with product_id, quantity and
+unit_price; in CSV each line is written as product_id:quantity:unit_price
+and lines are separated by ';'.
+"""
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .models import Customer, Product, Order, OrderLine
+
+FORMATS = ('ndjson', 'csv')
+
+EXPORTS = {
+    # kind: (model, filterset, columns)
+    'customers': (Customer, CustomerFilter, (
+        ('id', lambda c: c.pk),
+        ('name', lambda c: c.name),
+        ('email', lambda c: c.email),
+        ('phone', lambda c: c.phone),
+        ('created_at', lambda c: c.created_at),
+    )),
+    'products': (Product, ProductFilter, (
+        ('id', lambda p: p.pk),
+        ('name', lambda p: p.name),
+        ('price', lambda p: p.price),
+        ('stock', lambda p: p.stock),
+        ('created_at', lambda p: p.created_at),
+    )),
+    'orders': (Order, OrderFilter, (
+        ('id', lambda o: o.pk),
+        ('customer_id', lambda o: o.customer_id),
+        ('customer_email', lambda o: o.customer.email),
+        ('order_date', lambda o: o.order_date),
+        ('total_amount', lambda o: o.total_amount),
+        ('product_ids', lambda o: list(dict.fromkeys(
+            line.product_id for line in o.lines.all()
+        ))),
+        ('lines', lambda o: [
+            {
+                'product_id': line.product_id,
+                'quantity': line.quantity,
+                'unit_price': line.unit_price,
+            }
+            for line in o.lines.all()
+        ]),
+    )),
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def get_chunk_size():
+    return getattr(settings, 'CRM_EXPORT_CHUNK_SIZE', 2000)
+
+
+def export_queryset(kind, params):
+    """Filter a kind's rows with the same arguments as its GraphQL filterset"""
+    try:
+        model, filterset_class, _ = EXPORTS[kind]
+    except KeyError:
+        raise ExportError(f"Unknown export '{kind}'; choose from {', '.join(EXPORTS)}")
+
+    unknown = set(params) - set(filterset_class.base_filters)
+    if unknown:
+        raise ExportError(f"Unknown filter(s) for {kind}: {', '.join(sorted(unknown))}")
+
+    filterset = filterset_class(data=params, queryset=model._default_manager.all())
+    if not filterset.is_valid():
+        raise ExportError(
+            '; '.join(f"{name}: {' '.join(errors)}" for name, errors in filterset.errors.items())
+        )
+
+    queryset = filterset.qs
+    if kind == 'orders':
+        queryset = queryset.select_related('customer').prefetch_related(
+            Prefetch('lines', queryset=OrderLine.objects.only(
+                'order_id', 'product_id', 'quantity', 'unit_price'
+            ).order_by('pk'))
+        )
+    return queryset
+
+
+def export_rows(kind, queryset, chunk_size=None):
+    """Yield one dict per row; prefetches run once per chunk"""
+    columns = EXPORTS[kind][2]
+    for instance in queryset.iterator(chunk_size=chunk_size or get_chunk_size()):
+        yield {name: getter(instance) for name, getter in columns}
+
+
+def _plain(value, encoder=DjangoJSONEncoder()):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ';'.join(str(_plain(item)) for item in value)
+    if isinstance(value, dict):
+        return ':'.join(str(_plain(item)) for item in value.values())
+    if isinstance(value, (date, datetime, Decimal)):
+        return encoder.default(value)
+    return value
+
+
+class _Echo:
+    """File-like object whose write() returns the text, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def render(kind, rows, fmt, chunk_size=None):
+    """Yield the export as text, one chunk of rows at a time"""
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format '{fmt}'; choose from {', '.join(FORMATS)}")
+    chunk_size = chunk_size or get_chunk_size()
+
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow([name for name, _ in EXPORTS[kind][2]])
+        encode = lambda row: writer.writerow([_plain(value) for value in row.values()])
+    else:
+        encode = lambda row: json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+    buffer = []
+    for row in rows:
+        buffer.append(encode(row))
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
@@ -0,0 +1,188 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from decimal import Decimal
+from django.db.models import Q
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphql import GraphQLError
+from .loaders import get_loaders
+from .optimizer import optimize_queryset
+
+KEYSET_CURSOR_PREFIX = 'keyset:'
+
+
+class BatchedFilterConnectionField(DjangoFilterConnectionField):
+    """
+    DjangoFilterConnectionField that cooperates with the request loaders.
+
+    A resolver may return a list that was already batch-loaded or prefetched,
+    in which case filtering is skipped; querysets are filtered and then
+    shaped by the selection-set optimizer. The nodes of every page are primed
+    into the loaders so their relations resolve in one query per level.
+    """
+
+    @classmethod
+    def resolve_queryset(
+        cls, connection, iterable, info, args, filtering_args, filterset_class
+    ):
+        if isinstance(iterable, list):
+            return iterable
+        queryset = super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+        return optimize_queryset(queryset, info)
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager,
+                            queryset_resolver, max_limit, enforce_first_or_last,
+                            root, info, **args):
+        result = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        get_loaders(info).prime(edge.node for edge in result.edges)
+        return result
+
+
+def keyset_ordering(model):
+    """The model's declared ordering plus a primary-key tiebreaker"""
+    keys = list(model._meta.ordering)
+    descending = bool(keys) and keys[-1].startswith('-')
+    keys.append('-pk' if descending else 'pk')
+    return keys
+
+
+def _key_field(model, key):
+    name = key.lstrip('-')
+    return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+
+def encode_keyset_cursor(instance, keys):
+    values = []
+    for key in keys:
+        value = getattr(instance, _key_field(type(instance), key).attname)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        values.append(value)
+    payload = KEYSET_CURSOR_PREFIX + json.dumps(values)
+    return urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_keyset_cursor(cursor, model, keys):
+    try:
+        payload = urlsafe_b64decode(cursor.encode()).decode()
+        if not payload.startswith(KEYSET_CURSOR_PREFIX):
+            raise ValueError
+        values = json.loads(payload[len(KEYSET_CURSOR_PREFIX):])
+        if len(values) != len(keys):
+            raise ValueError
+        return [
+            _key_field(model, key).to_python(value)
+            for key, value in zip(keys, values)
+        ]
+    except Exception:
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+
+
+def keyset_filter(keys, values, forward=True):
+    """
+    Rows strictly after (or before) the given sort key, as the expanded form
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ... so indexes on the keys apply.
+    """
+    condition = Q()
+    equal = {}
+    for key, value in zip(keys, values):
+        name = key.lstrip('-')
+        ascending = not key.startswith('-')
+        lookup = 'gt' if ascending == forward else 'lt'
+        condition |= Q(**equal, **{f"{name}__{lookup}": value})
+        equal[name] = value
+    return condition
+
+
+class KeysetFilterConnectionField(BatchedFilterConnectionField):
+    """
+    Opt-in connection that pages by the model's ordering instead of OFFSET.
+
+    Cursors encode the sort key of their edge, so page N costs the same
+    range query as page 1 and no COUNT(*) is issued. Filters still apply.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Keyset pagination cannot jump to an arbitrary offset
+        self._base_args.pop('offset', None)
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager,
+                            queryset_resolver, max_limit, enforce_first_or_last,
+                            root, info, **args):
+        first = args.get('first')
+        last = args.get('last')
+        after = args.get('after')
+        before = args.get('before')
+
+        if enforce_first_or_last and not (first or last):
+            raise GraphQLError(
+                f"You must provide a `first` or `last` value to properly "
+                f"paginate the `{info.field_name}` connection."
+            )
+        for name, limit in (('first', first), ('last', last)):
+            if limit is None:
+                continue
+            if limit < 0:
+                raise GraphQLError(f"Argument `{name}` must be non-negative.")
+            if max_limit and limit > max_limit:
+                raise GraphQLError(
+                    f"Requesting {limit} records on the `{info.field_name}` "
+                    f"connection exceeds the `{name}` limit of {max_limit} records."
+                )
+        if first is None and last is None:
+            first = max_limit
+
+        iterable = resolver(root, info, **args)
+        if iterable is None:
+            iterable = default_manager
+        queryset = queryset_resolver(connection, iterable, info, args)
+
+        model = queryset.model
+        keys = keyset_ordering(model)
+        queryset = queryset.order_by(*keys)
+        if after:
+            values = decode_keyset_cursor(after, model, keys)
+            queryset = queryset.filter(keyset_filter(keys, values, forward=True))
+        if before:
+            values = decode_keyset_cursor(before, model, keys)
+            queryset = queryset.filter(keyset_filter(keys, values, forward=False))
+
+        # Fetch one extra row to learn whether another page exists
+        if first is not None:
+            rows = list(queryset[:first + 1])
+            has_next_page = len(rows) > first
+            has_previous_page = bool(after)
+            rows = rows[:first]
+            if last is not None and len(rows) > last:
+                rows = rows[len(rows) - last:]
+                has_previous_page = True
+        else:
+            rows = list(queryset.reverse()[:last + 1])
+            has_previous_page = len(rows) > last
+            has_next_page = bool(before)
+            rows = rows[:last][::-1]
+
+        get_loaders(info).prime(rows)
+        edges = [
+            connection.Edge(node=row, cursor=encode_keyset_cursor(row, keys))
+            for row in rows
+        ]
+        return connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous_page,
+                has_next_page=has_next_page,
+            ),
+        )
@@ -1,7 +1,18 @@
 import django_filters
+from django.db import connections
+from django.db.models import Q
 from .models import Customer, Product, Order
 
 
+def filter_phone_prefix(queryset, prefix):
+    """Prefix match on phone that can use the phone index on every backend"""
+    if connections[queryset.db].vendor == 'sqlite':
+        # SQLite's LIKE is case-insensitive and never uses a BINARY index;
+        # the equivalent range does (phones only hold digits, '+' and '-')
+        return queryset.filter(phone__gte=prefix, phone__lt=prefix + '\U0010ffff')
+    return queryset.filter(phone__startswith=prefix)
+
+
 class CustomerFilter(django_filters.FilterSet):
     """Filter for Customer model with custom filters"""
     
@@ -34,8 +45,7 @@ class CustomerFilter(django_filters.FilterSet):
     
     # Custom filter: Match phone numbers starting with a pattern
     phone_starts_with = django_filters.CharFilter(
-        field_name='phone',
-        lookup_expr='startswith',
+        method='filter_phone_starts_with',
         label='Phone starts with (e.g., +1)'
     )
     
@@ -46,6 +56,12 @@ class CustomerFilter(django_filters.FilterSet):
         label='Phone (contains)'
     )
 
+    def filter_phone_starts_with(self, queryset, name, value):
+        """Custom method to match a phone prefix through the phone index"""
+        if value:
+            return filter_phone_prefix(queryset, value)
+        return queryset
+
     class Meta:
         model = Customer
         fields = {
@@ -115,7 +131,8 @@ class ProductFilter(django_filters.FilterSet):
         """Custom method to filter out-of-stock products"""
         if value:
             return queryset.filter(stock=0)
-        return queryset.exclude(stock=0)
+        # Two ranges instead of stock != 0, which no index can answer
+        return queryset.filter(Q(stock__gt=0) | Q(stock__lt=0))
 
     class Meta:
         model = Product
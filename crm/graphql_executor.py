@@ -0,0 +1,97 @@
+"""
+Shared GraphQL executor for cron jobs and Celery tasks.
+
+In-process mode (the default) runs each job's document directly against the
+CRM schema. Documents are parsed and validated once per process, so a run
+costs only the database work of the operation itself. HTTP mode posts to
+CRM_GRAPHQL_URL through one long-lived gql session (a keep-alive connection
+pool) that validates against the local schema instead of introspecting the
+server before every query.
+"""
+from functools import lru_cache
+from threading import Lock
+from types import SimpleNamespace
+from django.conf import settings
+from gql import Client, GraphQLRequest
+from gql.transport.exceptions import TransportQueryError
+from graphql import execute_sync, parse, validate
+from crm.schema import schema
+
+MODES = ('inprocess', 'http')
+
+
+class GraphQLJobError(Exception):
+    pass
+
+
+@lru_cache(maxsize=64)
+def prepare(query):
+    """Parse and validate a document once per process"""
+    document = parse(query)
+    errors = validate(schema.graphql_schema, document)
+    if errors:
+        raise GraphQLJobError('; '.join(error.message for error in errors))
+    return document
+
+
+class InProcessExecutor:
+    def execute(self, query, variables=None):
+        result = execute_sync(
+            schema.graphql_schema,
+            prepare(query),
+            variable_values=variables,
+            # A fresh context per run, like a request, for the loaders
+            context_value=SimpleNamespace(),
+        )
+        if result.errors:
+            raise GraphQLJobError('; '.join(error.message for error in result.errors))
+        return result.data
+
+
+class HTTPExecutor:
+    def __init__(self, url):
+        self.url = url
+        self._session = None
+        self._lock = Lock()
+
+    def get_session(self):
+        with self._lock:
+            if self._session is None:
+                # Only the HTTP fallback needs requests-toolbelt
+                from gql.transport.requests import RequestsHTTPTransport
+
+                client = Client(
+                    transport=RequestsHTTPTransport(url=self.url, retries=3),
+                    schema=schema.graphql_schema,
+                    fetch_schema_from_transport=False,
+                )
+                self._session = client.connect_sync()
+            return self._session
+
+    def execute(self, query, variables=None):
+        request = GraphQLRequest(prepare(query), variable_values=variables)
+        try:
+            return self.get_session().execute(request)
+        except TransportQueryError as e:
+            raise GraphQLJobError(str(e))
+
+
+_executors = {}
+
+
+def get_executor(mode=None):
+    mode = mode or getattr(settings, 'CRM_JOB_GRAPHQL_MODE', 'inprocess')
+    if mode not in MODES:
+        raise GraphQLJobError(f"Unknown GraphQL job mode '{mode}'; choose from {', '.join(MODES)}")
+    if mode not in _executors:
+        if mode == 'http':
+            url = getattr(settings, 'CRM_GRAPHQL_URL', 'http://localhost:8000/graphql')
+            _executors[mode] = HTTPExecutor(url)
+        else:
+            _executors[mode] = InProcessExecutor()
+    return _executors[mode]
+
+
+def execute(query, variables=None):
+    """Run a job's document and return its data; raises GraphQLJobError"""
+    return get_executor().execute(query, variables)
@@ -0,0 +1,213 @@
+"""
+Idempotency keys for mutations that clients retry.
+
+A mutation decorated with idempotent() accepts an idempotencyKey. The first
+request with a key runs the mutation, and the serialized response of its
+field is stored in the cache (CRM_IDEMPOTENCY_CACHE_ALIAS) for
+CRM_IDEMPOTENCY_TTL seconds. Later requests with the same key get that
+response back as it was, without running the mutation or resolving any of
+its fields again. The store is bounded by the cache backend: entries expire
+after the TTL and the cache evicts the oldest when it is full.
+
+A request that arrives while the first one is still running waits up to
+CRM_IDEMPOTENCY_WAIT seconds for its response instead of running in
+parallel; the running request holds a lock in the same cache. That only
+works across processes with a shared cache such as Redis (CRM_CACHE_URL).
+Keys are refused on a process-local cache unless
+CRM_IDEMPOTENCY_ALLOW_LOCAL_CACHE is set, as it is for a single DEBUG
+process.
+
+The decorated mutate() returns a Pending or a Replay instead of its
+payload, so the schema has to execute with IdempotentExecutionContext,
+which serializes the Pending payload and stores it, and returns a Replay's
+stored response as the field's value.
+
+Responses are stored once the surrounding transaction commits. If it rolls
+back nothing is stored and the key can be used again once the lock expires
+after CRM_IDEMPOTENCY_LOCK_TIMEOUT seconds.
+
+Keys are scoped to the mutation and the authenticated user, and remember a
+fingerprint of the arguments and selection: reusing a key for a different
+request is an error rather than a replay.
+"""
+import json
+import time
+from functools import wraps
+from hashlib import sha256
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from graphql import ExecutionContext, GraphQLError, print_ast
+
+RESULT_PREFIX = 'crm:idempotency:result:'
+LOCK_PREFIX = 'crm:idempotency:lock:'
+
+# Backends whose entries only the current process can see
+LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+class Pending:
+    """A payload whose serialized response is stored once its field completes"""
+    __slots__ = ('payload', 'store')
+
+    def __init__(self, payload, store):
+        self.payload = payload
+        self.store = store
+
+
+class Replay:
+    """The stored response of an earlier request with the same key"""
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+class IdempotentExecutionContext(ExecutionContext):
+    """Complete Pending payloads as usual and store them; return Replay data as is"""
+
+    def complete_value(self, return_type, field_nodes, info, path, result):
+        if isinstance(result, Replay):
+            return result.data
+        if not isinstance(result, Pending):
+            return super().complete_value(return_type, field_nodes, info, path, result)
+
+        # A response with field errors is not stored, the retry runs again
+        errors = len(self.errors)
+        try:
+            completed = super().complete_value(
+                return_type, field_nodes, info, path, result.payload
+            )
+        except BaseException:
+            result.store(None)
+            raise
+
+        if self.is_awaitable(completed):
+            async def await_completed():
+                try:
+                    value = await completed
+                except BaseException:
+                    result.store(None)
+                    raise
+                result.store(value if len(self.errors) == errors else None)
+                return value
+            return await_completed()
+
+        result.store(completed if len(self.errors) == errors else None)
+        return completed
+
+
+def get_cache():
+    return caches[getattr(settings, 'CRM_IDEMPOTENCY_CACHE_ALIAS', 'default')]
+
+
+def request_fingerprint(arguments, info):
+    """Hash of the arguments and of the selection the response is built from"""
+    selection = [print_ast(node) for node in getattr(info, 'field_nodes', ())]
+    fragments = getattr(info, 'fragments', {}).values()
+    selection += sorted(print_ast(fragment) for fragment in fragments)
+    encoded = json.dumps(
+        [arguments, selection], sort_keys=True, separators=(',', ':'), default=str
+    )
+    return sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def make_key(mutation, idempotency_key, info):
+    user = getattr(info.context, 'user', None)
+    owner = user.pk if user is not None and user.is_authenticated else ''
+    raw = f"{mutation}:{owner}:{idempotency_key}"
+    return sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _release(cache, key, token):
+    if cache.get(LOCK_PREFIX + key) == token:
+        cache.delete(LOCK_PREFIX + key)
+
+
+def _replay(stored, fingerprint, idempotency_key):
+    stored_fingerprint, data = stored
+    if stored_fingerprint != fingerprint:
+        raise GraphQLError(
+            f"idempotencyKey '{idempotency_key}' was already used for a different request"
+        )
+    return Replay(data)
+
+
+def run(mutation, idempotency_key, info, execute, arguments, replayable=None):
+    """
+    Run execute() once per key. Returns a Pending wrapping its payload, or a
+    Replay of the response stored by an earlier request with the same key
+    """
+    cache = get_cache()
+    if isinstance(cache, LOCAL_CACHES) and not getattr(
+        settings, 'CRM_IDEMPOTENCY_ALLOW_LOCAL_CACHE', False
+    ):
+        raise GraphQLError(
+            "idempotencyKey needs a cache shared by every worker; set CRM_CACHE_URL "
+            "or point CRM_IDEMPOTENCY_CACHE_ALIAS at a shared cache"
+        )
+    key = make_key(mutation, idempotency_key, info)
+    fingerprint = request_fingerprint(arguments, info)
+    lock_timeout = getattr(settings, 'CRM_IDEMPOTENCY_LOCK_TIMEOUT', 30)
+    deadline = time.monotonic() + getattr(settings, 'CRM_IDEMPOTENCY_WAIT', 10)
+    token = uuid4().hex
+    delay = 0.005
+
+    while True:
+        stored = cache.get(RESULT_PREFIX + key)
+        if stored is not None:
+            return _replay(stored, fingerprint, idempotency_key)
+        if cache.add(LOCK_PREFIX + key, token, timeout=lock_timeout):
+            break
+        if time.monotonic() >= deadline:
+            raise GraphQLError(
+                f"A request with idempotencyKey '{idempotency_key}' is still in progress"
+            )
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+
+    # The first request may have finished between the read and the lock
+    stored = cache.get(RESULT_PREFIX + key)
+    if stored is not None:
+        _release(cache, key, token)
+        return _replay(stored, fingerprint, idempotency_key)
+
+    try:
+        payload = execute()
+    except BaseException:
+        _release(cache, key, token)
+        raise
+
+    def store(response):
+        def save():
+            if response is not None and (replayable is None or replayable(payload)):
+                ttl = getattr(settings, 'CRM_IDEMPOTENCY_TTL', 24 * 60 * 60)
+                cache.set(RESULT_PREFIX + key, (fingerprint, response), timeout=ttl)
+            _release(cache, key, token)
+        transaction.on_commit(save)
+
+    return Pending(payload, store)
+
+
+def idempotent(replayable=None):
+    """
+    Decorate a mutate() that takes an idempotency_key argument. replayable,
+    given the payload, says whether to store its response; payloads it
+    rejects leave the key free for a retry
+    """
+    def decorator(mutate):
+        mutation = mutate.__qualname__.split('.')[0]
+
+        @wraps(mutate)
+        def wrapper(root, info, idempotency_key=None, **arguments):
+            if not idempotency_key:
+                return mutate(root, info, **arguments)
+            return run(
+                mutation, idempotency_key, info,
+                lambda: mutate(root, info, **arguments), arguments, replayable,
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,401 @@
+"""
+Timing and SQL accounting of GraphQL operations, published for Prometheus.
+
+The views start an OperationTrace around execution. InstrumentationMiddleware
+times each resolver call and sql_wrapper, installed on every connection as
+it opens, charges each query to the resolver that issued it. Both find the
+trace and the current field through context variables, which asgiref copies
+into sync_to_async threads, so the async view is covered as well.
+
+A field's time is the time spent in its own resolver calls; graphql-core
+resolves the children after the parent resolver returns, so nothing is
+counted twice. Scalars read by graphene's default resolvers are skipped.
+
+When CRM_INSTRUMENTATION_ENABLED is off the views add no middleware and
+start no trace; the SQL wrapper is then one context variable lookup per
+query.
+"""
+import inspect
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from heapq import heappush, heapreplace
+from itertools import count
+from threading import Lock
+from time import perf_counter
+from django.conf import settings
+from graphql import OperationType, get_named_type, is_leaf_type
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250)
+
+_trace = ContextVar('crm_graphql_trace', default=None)
+_field = ContextVar('crm_graphql_field', default=None)
+
+
+def is_enabled():
+    return getattr(settings, 'CRM_INSTRUMENTATION_ENABLED', True)
+
+
+def debug_requested(request):
+    """Whether the request asked for extensions.timing and may see it"""
+    header = getattr(settings, 'CRM_INSTRUMENTATION_DEBUG_HEADER', 'X-CRM-Debug')
+    if not header or not request.headers.get(header):
+        return False
+    user = getattr(request, 'user', None)
+    return settings.DEBUG or bool(user and user.is_staff)
+
+
+class FieldStats:
+    __slots__ = ('path', 'label', 'calls', 'seconds', 'queries', 'sql_seconds', 'errors')
+
+    def __init__(self, path, label):
+        self.path = path
+        # Parent type and field name
+        self.label = label
+        self.calls = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.errors = 0
+
+
+class OperationTrace:
+    """Wall time, SQL and errors of one operation, in total and per field path"""
+
+    def __init__(self, name, kind, document_hash=None, variables=None, keep_sql=0):
+        self.name = name or 'anonymous'
+        self.kind = kind
+        self.document_hash = document_hash
+        self.variables = variables
+        self.started = perf_counter()
+        self.seconds = None
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.errors = 0
+        self.fields = {}
+        # The keep_sql slowest statements as a min-heap of
+        # (seconds, sequence, sql, field path)
+        self.keep_sql = keep_sql
+        self.slowest_sql = []
+        self._sequence = count()
+        # Resolvers of the async view run on several threads at once
+        self._lock = Lock()
+
+    def field(self, info):
+        # List indices are dropped so every item shares its field's entry
+        path = '.'.join(key for key in info.path.as_list() if isinstance(key, str))
+        stats = self.fields.get(path)
+        if stats is None:
+            with self._lock:
+                stats = self.fields.setdefault(
+                    path, FieldStats(path, f"{info.parent_type.name}.{info.field_name}")
+                )
+        return stats
+
+    def add_call(self, stats, seconds, failed=False):
+        with self._lock:
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.errors += failed
+
+    def add_query(self, stats, seconds, sql=None):
+        with self._lock:
+            self.queries += 1
+            self.sql_seconds += seconds
+            if stats is not None:
+                stats.queries += 1
+                stats.sql_seconds += seconds
+            if self.keep_sql:
+                entry = (seconds, next(self._sequence), sql, stats.path if stats else None)
+                if len(self.slowest_sql) < self.keep_sql:
+                    heappush(self.slowest_sql, entry)
+                elif seconds > self.slowest_sql[0][0]:
+                    heapreplace(self.slowest_sql, entry)
+
+    def finish(self, result):
+        self.seconds = perf_counter() - self.started
+        self.errors = len(result.errors or ()) if result is not None else 1
+        registry.record(self)
+
+    def as_extension(self):
+        fields = sorted(self.fields.items(), key=lambda item: -item[1].seconds)
+        return {
+            'operation': self.name,
+            'type': self.kind,
+            'durationMs': round(self.seconds * 1000, 3),
+            'sqlQueries': self.queries,
+            'sqlMs': round(self.sql_seconds * 1000, 3),
+            'errors': self.errors,
+            'fields': [
+                {
+                    'path': path,
+                    'calls': stats.calls,
+                    'durationMs': round(stats.seconds * 1000, 3),
+                    'sqlQueries': stats.queries,
+                    'sqlMs': round(stats.sql_seconds * 1000, 3),
+                    'errors': stats.errors,
+                }
+                for path, stats in fields
+            ],
+        }
+
+
+def start(operation_ast, document_hash=None, variables=None):
+    """An OperationTrace for the operation, or None when disabled"""
+    if not is_enabled():
+        return None
+    # Statements are only kept for the slow operation log
+    keep_sql = 0
+    if getattr(settings, 'CRM_SLOW_OPERATION_MS', None) is not None:
+        keep_sql = getattr(settings, 'CRM_SLOW_OPERATION_TOP_SQL', 5)
+    if operation_ast is None:
+        name, kind = None, OperationType.QUERY.value
+    else:
+        name = operation_ast.name.value if operation_ast.name else None
+        kind = operation_ast.operation.value
+    return OperationTrace(name, kind, document_hash, variables, keep_sql)
+
+
+@contextmanager
+def tracing(trace):
+    """Make `trace` current for the block; None does nothing"""
+    if trace is None:
+        yield None
+        return
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def _is_plain(field, return_type):
+    """A scalar field read by one of graphene's own resolvers (an attribute or the id)"""
+    resolver = getattr(field.resolve, 'func', field.resolve)
+    return is_leaf_type(get_named_type(return_type)) and (
+        resolver is None or getattr(resolver, '__module__', '').startswith('graphene.')
+    )
+
+
+class InstrumentationMiddleware:
+    """
+    Time each resolver call and mark it as the owner of its SQL. Plain
+    attribute reads are not timed; they are most of the fields of a
+    response and take microseconds.
+    """
+
+    def __init__(self):
+        # (parent type, field name) -> whether the field is plain
+        self.plain = {}
+
+    def resolve(self, next_, root, info, **args):
+        trace = _trace.get()
+        if trace is None or info.field_name.startswith('__'):
+            return next_(root, info, **args)
+        key = (info.parent_type, info.field_name)
+        plain = self.plain.get(key)
+        if plain is None:
+            plain = self.plain[key] = _is_plain(
+                info.parent_type.fields[info.field_name], info.return_type
+            )
+        if plain:
+            return next_(root, info, **args)
+        stats = trace.field(info)
+        token = _field.set(stats)
+        started = perf_counter()
+        try:
+            result = next_(root, info, **args)
+        except Exception:
+            trace.add_call(stats, perf_counter() - started, failed=True)
+            raise
+        finally:
+            _field.reset(token)
+        if inspect.isawaitable(result):
+            return self.await_result(trace, stats, result, started)
+        # Some middleware (DjangoDebugMiddleware) returns errors instead of raising
+        trace.add_call(stats, perf_counter() - started, failed=isinstance(result, Exception))
+        return result
+
+    async def await_result(self, trace, stats, awaitable, started):
+        token = _field.set(stats)
+        try:
+            result = await awaitable
+        except Exception:
+            trace.add_call(stats, perf_counter() - started, failed=True)
+            raise
+        finally:
+            _field.reset(token)
+        trace.add_call(stats, perf_counter() - started)
+        return result
+
+
+middleware = InstrumentationMiddleware()
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    trace = _trace.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        trace.add_query(_field.get(), perf_counter() - started, sql)
+
+
+def install(sender=None, connection=None, **kwargs):
+    """connection_created receiver: add sql_wrapper to the connection once"""
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # Label values -> per-bucket counts (last one is +Inf), sum, count
+        self.series = {}
+
+    def observe(self, values, value):
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for values, (counts, total, observations) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket
+                le = _labels(self.labels, values, f'le="{bound}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, values)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, values)} {observations}"
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, values, amount=1):
+        self.series[values] = self.series.get(values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for values, total in sorted(self.series.items()):
+            yield f"{self.name}{_labels(self.labels, values)} {total}"
+
+
+class Registry:
+    """Per-process metrics of finished operations, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.operation_names = set()
+            self.operation_seconds = Histogram(
+                'crm_graphql_operation_duration_seconds',
+                "Wall time of executed GraphQL operations",
+                ('operation', 'type'), DURATION_BUCKETS,
+            )
+            self.operation_queries = Histogram(
+                'crm_graphql_operation_sql_queries',
+                "SQL queries issued per GraphQL operation",
+                ('operation', 'type'), QUERY_BUCKETS,
+            )
+            self.operation_sql_seconds = Histogram(
+                'crm_graphql_operation_sql_duration_seconds',
+                "Time spent in SQL per GraphQL operation",
+                ('operation', 'type'), DURATION_BUCKETS,
+            )
+            self.operation_errors = Counter(
+                'crm_graphql_operation_errors_total',
+                "Errors returned by GraphQL operations",
+                ('operation', 'type'),
+            )
+            self.field_seconds = Histogram(
+                'crm_graphql_field_duration_seconds',
+                "Time spent in a field's resolvers per operation",
+                ('field',), DURATION_BUCKETS,
+            )
+            self.field_queries = Counter(
+                'crm_graphql_field_sql_queries_total',
+                "SQL queries issued by a field's resolvers",
+                ('field',),
+            )
+            self.field_errors = Counter(
+                'crm_graphql_field_errors_total',
+                "Exceptions raised by a field's resolvers",
+                ('field',),
+            )
+
+    def record(self, trace):
+        with self._lock:
+            # Operation names come from clients; cap how many become label values
+            name = trace.name
+            if name not in self.operation_names:
+                if len(self.operation_names) < getattr(settings, 'CRM_METRICS_MAX_OPERATIONS', 200):
+                    self.operation_names.add(name)
+                else:
+                    name = 'other'
+            labels = (name, trace.kind)
+            self.operation_seconds.observe(labels, trace.seconds)
+            self.operation_queries.observe(labels, trace.queries)
+            self.operation_sql_seconds.observe(labels, trace.sql_seconds)
+            if trace.errors:
+                self.operation_errors.inc(labels, trace.errors)
+
+            # Field labels are schema coordinates, so their number is bounded
+            fields = {}
+            for stats in trace.fields.values():
+                totals = fields.setdefault(stats.label, [0.0, 0, 0])
+                totals[0] += stats.seconds
+                totals[1] += stats.queries
+                totals[2] += stats.errors
+            for label, (seconds, queries, errors) in fields.items():
+                self.field_seconds.observe((label,), seconds)
+                if queries:
+                    self.field_queries.inc((label,), queries)
+                if errors:
+                    self.field_errors.inc((label,), errors)
+
+    def render(self):
+        with self._lock:
+            lines = [
+                line
+                for metric in (
+                    self.operation_seconds, self.operation_queries,
+                    self.operation_sql_seconds, self.operation_errors,
+                    self.field_seconds, self.field_queries, self.field_errors,
+                )
+                for line in metric.render()
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,148 @@
+from collections import defaultdict
+from threading import Lock
+from django.db.models import F
+from crm.models import Customer, Product, Order, OrderLine
+
+
+class RelationLoader:
+    """
+    Request-scoped loader for a single relation.
+
+    Keys are queued as parent rows are resolved; the first load() that
+    misses the cache fetches every queued key with one IN (...) query.
+
+    The async view resolves sibling root fields on pool threads that share
+    one request's loaders. _lock serializes loads, so a key is fetched once;
+    _queue_lock only guards the queue and is never held while taking another
+    lock, so fetches that queue keys on other loaders cannot deadlock.
+    """
+
+    def __init__(self, fetch, default_factory=None):
+        self.fetch = fetch
+        # Called once per key without rows, so no two keys share a result
+        self.default_factory = default_factory
+        self._queue = set()
+        self._cache = {}
+        self._lock = Lock()
+        self._queue_lock = Lock()
+
+    def queue(self, keys):
+        with self._queue_lock:
+            self._queue.update(key for key in keys if key not in self._cache)
+
+    def load(self, key):
+        with self._lock:
+            if key not in self._cache:
+                with self._queue_lock:
+                    self._queue.add(key)
+                    keys = list(self._queue)
+                    self._queue.clear()
+                results = self.fetch(keys)
+                for k in keys:
+                    if k in results:
+                        self._cache[k] = results[k]
+                    else:
+                        self._cache[k] = self.default_factory() if self.default_factory else None
+            return self._cache[key]
+
+
+class CRMLoaders:
+    """All relation loaders for one GraphQL request"""
+
+    def __init__(self):
+        self.customer = RelationLoader(self._fetch_customers)
+        self.product = RelationLoader(self._fetch_products)
+        self.lines_by_order = RelationLoader(
+            self._fetch_lines_by_order, default_factory=list
+        )
+        self.orders_by_customer = RelationLoader(
+            self._fetch_orders_by_customer, default_factory=list
+        )
+        self.products_by_order = RelationLoader(
+            self._fetch_products_by_order, default_factory=list
+        )
+        self.orders_by_product = RelationLoader(
+            self._fetch_orders_by_product, default_factory=list
+        )
+
+    def prime(self, instances):
+        """Queue the relation keys of freshly fetched rows for the next level"""
+        for instance in instances:
+            if isinstance(instance, Order):
+                self.customer.queue([instance.customer_id])
+                self.products_by_order.queue([instance.pk])
+                self.lines_by_order.queue([instance.pk])
+            elif isinstance(instance, OrderLine):
+                self.product.queue([instance.product_id])
+            elif isinstance(instance, Customer):
+                self.orders_by_customer.queue([instance.pk])
+            elif isinstance(instance, Product):
+                self.orders_by_product.queue([instance.pk])
+
+    def _fetch_customers(self, keys):
+        customers = Customer.objects.in_bulk(keys)
+        self.prime(customers.values())
+        return customers
+
+    def _fetch_products(self, keys):
+        products = Product.objects.in_bulk(keys)
+        self.prime(products.values())
+        return products
+
+    def _fetch_lines_by_order(self, keys):
+        grouped = defaultdict(list)
+        lines = list(OrderLine.objects.filter(order_id__in=keys))
+        for line in lines:
+            grouped[line.order_id].append(line)
+        self.prime(lines)
+        return grouped
+
+    def _fetch_orders_by_customer(self, keys):
+        grouped = defaultdict(list)
+        orders = list(Order.objects.filter(customer_id__in=keys))
+        for order in orders:
+            grouped[order.customer_id].append(order)
+        self.prime(orders)
+        return grouped
+
+    def _fetch_products_by_order(self, keys):
+        grouped = defaultdict(list)
+        products = list(
+            Product.objects.filter(orders__in=keys).annotate(order_key=F('orders'))
+        )
+        for product in products:
+            grouped[product.order_key].append(product)
+        self.prime(products)
+        return grouped
+
+    def _fetch_orders_by_product(self, keys):
+        grouped = defaultdict(list)
+        orders = list(
+            Order.objects.filter(products__in=keys).annotate(product_key=F('products'))
+        )
+        for order in orders:
+            grouped[order.product_key].append(order)
+        self.prime(orders)
+        return grouped
+
+
+_create_lock = Lock()
+
+
+def get_loaders(info):
+    """
+    Return the loaders bound to the current request, creating them once.
+    The views create them before execution; contexts without them get
+    theirs here, under a lock so concurrent resolvers agree on one set.
+    """
+    context = info.context
+    if context is None:
+        return CRMLoaders()
+    loaders = getattr(context, 'crm_loaders', None)
+    if loaders is None:
+        with _create_lock:
+            loaders = getattr(context, 'crm_loaders', None)
+            if loaders is None:
+                loaders = CRMLoaders()
+                context.crm_loaders = loaders
+    return loaders
@@ -0,0 +1,95 @@
+import os
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from crm.benchmarks import percentile
+from crm.slow_operations import read_records
+
+SORT_KEYS = {
+    'total': lambda group: sum(group['durations']),
+    'count': lambda group: len(group['durations']),
+    'p95': lambda group: percentile(group['durations'], 0.95),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Group slow GraphQL operation records by document and print their "
+        "latency percentiles and most expensive SQL"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help="Log files to read (default: CRM_SLOW_OPERATION_LOG and its rotated backups)"
+        )
+        parser.add_argument('--top', type=int, default=20, help="Documents to show")
+        parser.add_argument('--sort', choices=SORT_KEYS, default='total')
+        parser.add_argument(
+            '--sql', type=int, default=3,
+            help="Most expensive statements to show per document"
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self.default_paths()
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            raise CommandError(f"No such file: {', '.join(missing)}")
+
+        groups = defaultdict(lambda: {
+            'operations': set(), 'durations': [], 'queries': [], 'errors': 0,
+            'variables': set(), 'sql': defaultdict(lambda: [0.0, 0]),
+        })
+        records = 0
+        for record in read_records(paths):
+            records += 1
+            group = groups[record.get('document')]
+            group['operations'].add(f"{record.get('operation')} ({record.get('type')})")
+            group['durations'].append(record['duration_ms'])
+            group['queries'].append(record.get('sql_queries', 0))
+            group['errors'] += bool(record.get('errors'))
+            group['variables'].add(record.get('variables'))
+            for statement in record.get('slowest_sql', ()):
+                entry = group['sql'][(statement.get('path'), statement.get('sql'))]
+                entry[0] += statement['duration_ms']
+                entry[1] += 1
+
+        if not records:
+            self.stdout.write("No slow operations recorded")
+            return
+        self.stdout.write(f"{records} slow operations, {len(groups)} documents")
+
+        ranked = sorted(groups.items(), key=lambda item: -SORT_KEYS[options['sort']](item[1]))
+        for document, group in ranked[:options['top']]:
+            durations = group['durations']
+            self.stdout.write(
+                f"\n{(document or '-')[:12]}  {', '.join(sorted(group['operations']))}\n"
+                f"  {len(durations)} runs, {len(group['variables'])} variable sets, "
+                f"{group['errors']} with errors, "
+                f"{sum(group['queries']) / len(durations):.1f} queries/run\n"
+                f"  p50 {percentile(durations, 0.50):.1f}ms  "
+                f"p95 {percentile(durations, 0.95):.1f}ms  "
+                f"p99 {percentile(durations, 0.99):.1f}ms  "
+                f"max {max(durations):.1f}ms  "
+                f"total {sum(durations) / 1000:.1f}s"
+            )
+            statements = sorted(group['sql'].items(), key=lambda item: -item[1][0])
+            for (path, sql), (total_ms, seen) in statements[:options['sql']]:
+                self.stdout.write(
+                    f"    {total_ms:>9.1f}ms in {seen:>4} runs  {path or '(outside resolvers)'}\n"
+                    f"        {sql[:160]}"
+                )
+
+    def default_paths(self):
+        path = getattr(settings, 'CRM_SLOW_OPERATION_LOG', None)
+        if not path:
+            raise CommandError("Pass log files or set CRM_SLOW_OPERATION_LOG")
+        # Oldest backup first, the live file last
+        backups = sorted(
+            (name for name in os.listdir(os.path.dirname(path) or '.')
+             if name.startswith(os.path.basename(path) + '.')
+             and name.rsplit('.', 1)[1].isdigit()),
+            key=lambda name: -int(name.rsplit('.', 1)[1]),
+        )
+        paths = [os.path.join(os.path.dirname(path), name) for name in backups]
+        return paths + [path] if os.path.exists(path) else paths
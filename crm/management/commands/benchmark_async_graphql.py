@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from asgiref.sync import ThreadSensitiveContext, async_to_sync, sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import AsyncRequestFactory, RequestFactory
+from django.test.utils import override_settings
+from crm.async_schema import async_schema
+from crm.benchmarks import percentile
+from crm.models import Customer, Product, Order, OrderLine
+from crm.schema import schema
+from crm.views import AsyncCRMGraphQLView, CRMGraphQLView
+
+# Independent root fields, the case the async view runs concurrently
+QUERY = """
+    query {
+        crmStats { totalCustomers totalOrders totalRevenue }
+        customersList(first: 20) { name email }
+        productsList(first: 20) { name stock }
+        allOrders(first: 20) { edges { node { id totalAmount customer { name } } } }
+        search(query: "bench", first: 10) { __typename }
+    }
+"""
+
+
+class Command(BaseCommand):
+    help = "Compare requests/s of the sync and async GraphQL views under concurrent load"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument(
+            '--seed', type=int, default=200,
+            help="Temporary customers/products/orders to create (0 uses existing data)"
+        )
+
+    def handle(self, *args, **options):
+        prefix = f"bench-async-{time.time_ns()}-"
+        if options['seed']:
+            self.seed(prefix, options['seed'])
+        body = json.dumps({'query': QUERY})
+        try:
+            # Every request must execute; cached results would hide the difference
+            with override_settings(CRM_RESULT_CACHE_ENABLED=False):
+                results = [
+                    ('sync view (threads)', *self.run_sync(body, options)),
+                    ('async view (ASGI)', *async_to_sync(self.run_async)(body, options)),
+                ]
+        finally:
+            if options['seed']:
+                Order.objects.filter(customer__email__startswith=prefix).delete()
+                Customer.objects.filter(email__startswith=prefix).delete()
+                Product.objects.filter(name__startswith=prefix).delete()
+
+        for label, seconds, latencies in results:
+            self.stdout.write(
+                f"{label:<22} {options['requests'] / seconds:>8.1f} req/s "
+                f"p50 {percentile(latencies, 0.5) * 1000:>7.1f}ms "
+                f"p95 {percentile(latencies, 0.95) * 1000:>7.1f}ms"
+            )
+        self.stdout.write(f"speedup: {results[0][1] / results[1][1]:.2f}x")
+
+    def seed(self, prefix, count):
+        customers = Customer.objects.bulk_create(
+            Customer(name=f"Bench {i}", email=f"{prefix}{i}@example.com") for i in range(count)
+        )
+        products = Product.objects.bulk_create(
+            Product(name=f"{prefix}{i}", price=Decimal('10.00'), stock=i % 20)
+            for i in range(count)
+        )
+        orders = Order.objects.bulk_create(
+            Order(customer=customers[i], total_amount=Decimal('30.00')) for i in range(count)
+        )
+        OrderLine.objects.bulk_create(
+            OrderLine(
+                order_id=order.pk, product_id=products[(i + k) % count].pk,
+                unit_price=Decimal('10.00'),
+            )
+            for i, order in enumerate(orders)
+            for k in range(3)
+        )
+
+    def check(self, content):
+        result = json.loads(content)
+        if result.get('errors'):
+            raise RuntimeError(result['errors'][0]['message'])
+
+    def run_sync(self, body, options):
+        view = CRMGraphQLView.as_view(schema=schema)
+        factory = RequestFactory()
+
+        def one(_):
+            started = time.perf_counter()
+            try:
+                request = factory.post('/graphql', data=body, content_type='application/json')
+                self.check(view(request).content)
+            finally:
+                close_old_connections()
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            latencies = list(pool.map(one, range(options['requests'])))
+        return time.perf_counter() - started, latencies
+
+    async def run_async(self, body, options):
+        view = AsyncCRMGraphQLView.as_view(schema=async_schema)
+        factory = AsyncRequestFactory()
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                # As under an ASGI server, each request gets its own sync thread
+                async with ThreadSensitiveContext():
+                    request = factory.post('/graphql/async', data=body, content_type='application/json')
+                    response = await view(request)
+                    await sync_to_async(close_old_connections)()
+                self.check(response.content)
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(one() for _ in range(options['requests'])))
+        return time.perf_counter() - started, latencies
@@ -0,0 +1,65 @@
+import time
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from crm.models import Customer
+from crm.schema import schema
+
+MUTATION = """
+    mutation($input: [CustomerInput]!) {
+        bulkCreateCustomers(input: $input) { successCount errors }
+    }
+"""
+
+
+class Command(BaseCommand):
+    help = "Compare row-by-row and set-based customer imports"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        results = [
+            self.measure('row-by-row', rows, self.row_by_row),
+            self.measure('bulkCreateCustomers', rows, self.bulk_mutation),
+        ]
+
+        for label, seconds, queries in results:
+            self.stdout.write(
+                f"{label:<22} {rows / seconds:>10.0f} rows/s "
+                f"{seconds:>8.3f}s {queries:>7} queries"
+            )
+        self.stdout.write(f"speedup: {results[0][1] / results[1][1]:.1f}x")
+
+    def measure(self, label, rows, run):
+        prefix = f"bench-{label.lower()}-{time.time_ns()}-"
+        data = [
+            {'name': f"Bench {i}", 'email': f"{prefix}{i}@example.com", 'phone': '+1234567890'}
+            for i in range(rows)
+        ]
+        try:
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                run(data)
+                seconds = time.perf_counter() - started
+        finally:
+            Customer.objects.filter(email__startswith=prefix).delete()
+        return label, seconds, len(captured)
+
+    def row_by_row(self, data):
+        """The per-row path the mutation used before the set-based rewrite"""
+        for row in data:
+            if Customer.objects.filter(email=row['email']).exists():
+                continue
+            customer = Customer(**row)
+            customer.full_clean()
+            customer.save()
+
+    def bulk_mutation(self, data):
+        result = schema.execute(
+            MUTATION, variables={'input': data}, context_value=SimpleNamespace()
+        )
+        if result.errors:
+            raise result.errors[0]
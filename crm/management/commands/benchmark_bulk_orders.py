@@ -0,0 +1,93 @@
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from django.db import connection
+from crm.models import Customer, Product, Order
+from crm.schema import schema
+
+CREATE_ORDER = """
+    mutation($input: OrderInput!) {
+        createOrder(input: $input) { success message }
+    }
+"""
+
+BULK_CREATE_ORDERS = """
+    mutation($input: [OrderInput]!) {
+        bulkCreateOrders(input: $input) { successCount errors }
+    }
+"""
+
+
+class Command(BaseCommand):
+    help = "Compare createOrder called in a loop with one bulkCreateOrders call"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--lines', type=int, default=3, help="Lines per order")
+
+    def handle(self, *args, **options):
+        prefix = f"bench-orders-{time.time_ns()}-"
+        customers = Customer.objects.bulk_create(
+            Customer(name=f"Bench {i}", email=f"{prefix}{i}@example.com") for i in range(100)
+        )
+        products = Product.objects.bulk_create(
+            Product(name=f"{prefix}{i}", price=Decimal('10.00') + i, stock=100)
+            for i in range(50)
+        )
+        data = [
+            {
+                'customerId': customers[i % len(customers)].pk,
+                'lines': [
+                    {'productId': products[(i + k) % len(products)].pk, 'quantity': k + 1}
+                    for k in range(options['lines'])
+                ],
+            }
+            for i in range(options['orders'])
+        ]
+        try:
+            results = [
+                self.measure('createOrder loop', data, self.loop),
+                self.measure('bulkCreateOrders', data, self.bulk_mutation),
+            ]
+        finally:
+            Order.objects.filter(customer__email__startswith=prefix).delete()
+            Customer.objects.filter(email__startswith=prefix).delete()
+            Product.objects.filter(name__startswith=prefix).delete()
+
+        for label, seconds, queries in results:
+            self.stdout.write(
+                f"{label:<18} {len(data) / seconds:>10.0f} orders/s "
+                f"{seconds:>8.3f}s {queries:>7} queries"
+            )
+        self.stdout.write(f"speedup: {results[0][1] / results[1][1]:.1f}x")
+
+    def measure(self, label, data, run):
+        # Counted with a wrapper; the loop outgrows CaptureQueriesContext's log
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            run(data)
+            seconds = time.perf_counter() - started
+        return label, seconds, queries
+
+    def loop(self, data):
+        for row in data:
+            result = schema.execute(
+                CREATE_ORDER, variables={'input': row}, context_value=SimpleNamespace()
+            )
+            if result.errors or not result.data['createOrder']['success']:
+                raise RuntimeError(result.errors or result.data['createOrder']['message'])
+
+    def bulk_mutation(self, data):
+        result = schema.execute(
+            BULK_CREATE_ORDERS, variables={'input': data}, context_value=SimpleNamespace()
+        )
+        if result.errors or result.data['bulkCreateOrders']['errors']:
+            raise RuntimeError(result.errors or result.data['bulkCreateOrders']['errors'])
@@ -0,0 +1,150 @@
+import json
+import os
+import time
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from crm import benchmarks, seeding
+from crm.models import Order
+from crm.schema import schema
+
+# Committed baselines, one per database vendor and scale
+BASELINE_DIR = os.path.join(os.path.dirname(benchmarks.__file__), 'benchmark_baselines')
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the GraphQL operation catalog in-process on seeded data and compare "
+        "latency percentiles and query counts with a baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=benchmarks.SCALES, default='1k')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--operation', action='append', dest='operations',
+            help="Only run this catalog operation (repeatable)"
+        )
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument(
+            '--baseline',
+            help="Results JSON to compare against (default: the committed baseline for "
+                 "this database vendor and scale, in crm/benchmark_baselines/)"
+        )
+        parser.add_argument(
+            '--no-baseline', action='store_true', help="Do not compare against any baseline"
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help="Allowed latency slowdown against the baseline (0.25 = 25%%)"
+        )
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=2.0,
+            help="Slowdowns smaller than this never count as regressions"
+        )
+        parser.add_argument(
+            '--percentile', action='append', dest='percentiles', choices=('p50', 'p95'),
+            help="Latency percentile compared against the baseline (repeatable, default: "
+                 "p50; the p95 of a short run is too noisy to gate on)"
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help="Keep the benchmark database, and its data, for the next run"
+        )
+        parser.add_argument(
+            '--use-existing', action='store_true',
+            help="Run against the configured database as it is, without seeding"
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['operations'] or ()) - {op.name for op in benchmarks.CATALOG}
+        if unknown:
+            raise CommandError(f"Unknown operation(s): {', '.join(sorted(unknown))}")
+        uncovered = benchmarks.uncovered_fields(schema)
+        if uncovered:
+            self.stderr.write(f"Not in the catalog: {', '.join(uncovered)}")
+
+        if options['use_existing']:
+            results = self.run(options)
+        else:
+            # Seed a separate database so the configured one is never touched
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, keepdb=options['keepdb']
+            )
+            try:
+                counts = benchmarks.SCALES[options['scale']]
+                if Order.objects.count() != counts['orders']:
+                    started = time.perf_counter()
+                    # A kept database from another scale is emptied first
+                    call_command('flush', interactive=False, verbosity=0)
+                    seeding.seed(**counts, seed=options['seed'])
+                    self.stdout.write(
+                        f"seeded {options['scale']} in {time.perf_counter() - started:.1f}s"
+                    )
+                results = self.run(options)
+            finally:
+                connection.creation.destroy_test_db(
+                    old_name, verbosity=0, keepdb=options['keepdb']
+                )
+
+        report = {
+            'scale': 'existing' if options['use_existing'] else options['scale'],
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'operations': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<24} {result['queries']:>4} queries "
+                f"p50 {result['p50_ms']:>8.2f}ms p95 {result['p95_ms']:>8.2f}ms "
+                f"p99 {result['p99_ms']:>8.2f}ms"
+                + (f"  ERROR {result['errors'][0]}" if result['errors'] else "")
+            )
+
+        failed = [name for name, result in results.items() if result['errors']]
+        if failed:
+            raise CommandError(f"Operations returned errors: {', '.join(failed)}")
+
+        baseline_path = self.baseline_path(options, report)
+        if baseline_path:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+            if baseline.get('scale') != report['scale']:
+                self.stderr.write(
+                    f"Baseline was recorded at scale {baseline.get('scale')}, not {report['scale']}"
+                )
+            regressions = benchmarks.compare(
+                results, baseline['operations'], options['tolerance'], options['min_delta_ms'],
+                keys=[f"{p}_ms" for p in options['percentiles'] or ['p50']],
+            )
+            if regressions:
+                raise CommandError("Regressions:\n  " + "\n  ".join(regressions))
+            self.stdout.write(f"No regressions against {baseline_path}")
+
+    def baseline_path(self, options, report):
+        if options['no_baseline']:
+            return None
+        if options['baseline']:
+            return options['baseline']
+        path = os.path.join(BASELINE_DIR, f"{report['database']}-{report['scale']}.json")
+        if not os.path.exists(path):
+            self.stderr.write(
+                f"No committed baseline for {report['database']} at scale {report['scale']}"
+            )
+            return None
+        return path
+
+    def run(self, options):
+        return benchmarks.run_catalog(
+            schema,
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            only=options['operations'],
+        )
@@ -0,0 +1,129 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, close_old_connections
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from crm.benchmarks import percentile
+from crm.models import Customer, Product, Order
+from crm.schema import schema
+from crm.views import CRMGraphQLView
+
+CREATE_ORDER = """
+    mutation($customerId: ID!, $lines: [OrderLineInput!]) {
+        createOrder(input: {customerId: $customerId, lines: $lines}) { success message }
+    }
+"""
+
+RESTOCK = """
+    mutation { updateLowStockProducts(threshold: 5, increment: 1) { success message } }
+"""
+
+# What SQLite does without crm.sqlite_tuning; journal_mode is stored in the
+# database file, so it is reset explicitly
+DEFAULTS = {'journal_mode': 'delete', 'synchronous': 'full'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent order-creation throughput on SQLite with its default "
+        "pragmas and with CRM_SQLITE_PRAGMAS / CRM_SQLITE_TRANSACTION_MODE"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=400, help="Orders per run")
+        parser.add_argument(
+            '--restock-every', type=int, default=10,
+            help="Run the low-stock restock mutation every N requests (0 disables)"
+        )
+        parser.add_argument(
+            '--atomic', action='store_true',
+            help="Run each mutation in one transaction, as with ATOMIC_MUTATIONS"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The default database is not SQLite")
+        prefix = f"bench-sqlite-{time.time_ns()}-"
+        customers = Customer.objects.bulk_create(
+            Customer(name=f"Bench {i}", email=f"{prefix}{i}@example.com") for i in range(50)
+        )
+        products = Product.objects.bulk_create(
+            Product(name=f"{prefix}{i}", price=Decimal('10.00'), stock=i % 10)
+            for i in range(20)
+        )
+        profiles = [
+            ('SQLite defaults', DEFAULTS, None),
+            ('tuned', settings.CRM_SQLITE_PRAGMAS, settings.CRM_SQLITE_TRANSACTION_MODE),
+        ]
+        results = []
+        try:
+            for label, pragmas, mode in profiles:
+                # Connections opened from here on get the profile's pragmas
+                connections.close_all()
+                with override_settings(
+                    CRM_SQLITE_PRAGMAS=pragmas, CRM_SQLITE_TRANSACTION_MODE=mode,
+                    CRM_RESULT_CACHE_ENABLED=False,
+                    GRAPHENE={**settings.GRAPHENE, 'ATOMIC_MUTATIONS': options['atomic']},
+                ):
+                    results.append((label, *self.run(customers, products, options)))
+                connections.close_all()
+        finally:
+            Order.objects.filter(customer__email__startswith=prefix).delete()
+            Customer.objects.filter(email__startswith=prefix).delete()
+            Product.objects.filter(name__startswith=prefix).delete()
+
+        # Failed requests return early, so only created orders count
+        for label, seconds, latencies, failures in results:
+            self.stdout.write(
+                f"{label:<16} {(len(latencies) - failures) / seconds:>8.1f} orders/s "
+                f"p50 {percentile(latencies, 0.5) * 1000:>7.1f}ms "
+                f"p95 {percentile(latencies, 0.95) * 1000:>7.1f}ms "
+                f"{failures:>5} failed"
+            )
+        (_, before, latencies, failed_before), (_, after, _, failed_after) = results
+        if failed_before < len(latencies):
+            speedup = (len(latencies) - failed_after) / after
+            speedup /= (len(latencies) - failed_before) / before
+            self.stdout.write(f"speedup: {speedup:.2f}x")
+
+    def run(self, customers, products, options):
+        view = CRMGraphQLView.as_view(schema=schema)
+        factory = RequestFactory()
+        restock_every = options['restock_every']
+
+        def post(query, variables=None):
+            request = factory.post(
+                '/graphql', content_type='application/json',
+                data=json.dumps({'query': query, 'variables': variables}),
+            )
+            result = json.loads(view(request).content)
+            if result.get('errors'):
+                return False
+            return next(iter(result['data'].values()))['success']
+
+        def one(i):
+            started = time.perf_counter()
+            try:
+                if restock_every and i % restock_every == 0:
+                    post(RESTOCK)
+                ok = post(CREATE_ORDER, {
+                    'customerId': customers[i % len(customers)].pk,
+                    'lines': [
+                        {'productId': products[(i + k) % len(products)].pk, 'quantity': k + 1}
+                        for k in range(3)
+                    ],
+                })
+            finally:
+                close_old_connections()
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as pool:
+            outcomes = list(pool.map(one, range(options['orders'])))
+        seconds = time.perf_counter() - started
+        return seconds, [latency for latency, _ in outcomes], sum(not ok for _, ok in outcomes)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from crm.exports import EXPORTS, FORMATS, ExportError, export_queryset, export_rows, render
+
+
+class Command(BaseCommand):
+    help = "Stream customers, products or orders to stdout or a file as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--output', help="File to write (default: stdout)")
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument(
+            '--filter', action='append', default=[], metavar='NAME=VALUE',
+            help="Filterset argument, e.g. --filter total_amount_gte=100 (repeatable)"
+        )
+
+    def handle(self, *args, **options):
+        params = {}
+        for item in options['filter']:
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f"Filters must be NAME=VALUE, got '{item}'")
+            params[name] = value
+
+        kind, chunk_size = options['kind'], options['chunk_size']
+        try:
+            queryset = export_queryset(kind, params)
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        chunks = render(kind, export_rows(kind, queryset, chunk_size), options['format'], chunk_size)
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from crm.search import SearchNotSupported, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the customer and product full-text search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        try:
+            rebuild(using=options['database'])
+        except SearchNotSupported as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
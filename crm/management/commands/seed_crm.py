@@ -0,0 +1,79 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from crm import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic customers, products and orders with realistic "
+        "distributions; the same --seed always produces the same rows"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1_000)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help="Spread orders over this many days before now"
+        )
+        parser.add_argument('--chunk-size', type=int, default=10_000)
+        parser.add_argument(
+            '--zipf', type=float, default=1.1, dest='product_exponent',
+            help="Zipf exponent of product popularity (higher is more skewed)"
+        )
+        parser.add_argument(
+            '--customer-zipf', type=float, default=0.6, dest='customer_exponent',
+            help="Zipf exponent of how often each customer orders"
+        )
+        parser.add_argument(
+            '--basket-mean', type=float, default=2.5,
+            help="Average number of distinct products per order"
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help="Delete all CRM data before seeding"
+        )
+
+    def handle(self, *args, **options):
+        for name in ('customers', 'products', 'orders', 'days', 'chunk_size'):
+            if options[name] < 0 or (name in ('days', 'chunk_size') and not options[name]):
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+        if options['basket_mean'] < 1:
+            raise CommandError("--basket-mean must be at least 1")
+
+        if options['clear']:
+            seeding.clear()
+            self.stdout.write("Cleared existing data")
+
+        started = time.perf_counter()
+
+        def progress(label, done, total):
+            if options['verbosity'] > 1 or done == total:
+                self.stdout.write(
+                    f"{label:<12} {done:>10,}/{total:,} "
+                    f"({time.perf_counter() - started:.1f}s)"
+                )
+
+        try:
+            lines = seeding.seed(
+                options['customers'], options['products'], options['orders'],
+                seed=options['seed'],
+                days=options['days'],
+                chunk_size=options['chunk_size'],
+                progress=progress,
+                product_exponent=options['product_exponent'],
+                customer_exponent=options['customer_exponent'],
+                basket_mean=options['basket_mean'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        seconds = time.perf_counter() - started
+        rows = options['customers'] + options['products'] + options['orders'] + lines
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {options['customers']:,} customers, {options['products']:,} products, "
+            f"{options['orders']:,} orders and {lines:,} order lines in {seconds:.1f}s "
+            f"({rows / seconds:,.0f} rows/s)"
+        ))
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def install_search(apps, schema_editor):
+    from crm.search import install
+    install(schema_editor)
+
+
+def uninstall_search(apps, schema_editor):
+    from crm.search import uninstall
+    uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_filter_indexes'),
+    ]
+
+    operations = [
+        # FTS5 tables + triggers on SQLite, GIN expression indexes on PostgreSQL
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,68 @@
+from decimal import Decimal
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_products_to_lines(apps, schema_editor):
+    """One line per existing order/product pair, at the product's current price"""
+    Order = apps.get_model('crm', 'Order')
+    OrderLine = apps.get_model('crm', 'OrderLine')
+    Product = apps.get_model('crm', 'Product')
+    through = Order._meta.get_field('products').remote_field.through
+    qn = schema_editor.connection.ops.quote_name
+    # INSERT ... SELECT keeps the copy in the database, whatever the row count
+    schema_editor.execute(
+        f"INSERT INTO {qn(OrderLine._meta.db_table)} "
+        f"({qn('order_id')}, {qn('product_id')}, {qn('quantity')}, {qn('unit_price')}) "
+        f"SELECT t.{qn('order_id')}, t.{qn('product_id')}, 1, p.{qn('price')} "
+        f"FROM {qn(through._meta.db_table)} t "
+        f"JOIN {qn(Product._meta.db_table)} p ON p.{qn('id')} = t.{qn('product_id')}"
+    )
+
+
+def copy_lines_to_products(apps, schema_editor):
+    Order = apps.get_model('crm', 'Order')
+    OrderLine = apps.get_model('crm', 'OrderLine')
+    through = Order._meta.get_field('products').remote_field.through
+    qn = schema_editor.connection.ops.quote_name
+    schema_editor.execute(
+        f"INSERT INTO {qn(through._meta.db_table)} ({qn('order_id')}, {qn('product_id')}) "
+        f"SELECT {qn('order_id')}, {qn('product_id')} FROM {qn(OrderLine._meta.db_table)}"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))])),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='crm.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_lines', to='crm.product')),
+            ],
+            options={
+                'ordering': ['id'],
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='crm_orderline_order_product_uniq')],
+            },
+        ),
+        # Existing totals are kept as they were charged; only the links move
+        migrations.RunPython(copy_products_to_lines, copy_lines_to_products),
+        # A through model cannot be added to an existing M2M in place
+        migrations.RemoveField(
+            model_name='order',
+            name='products',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='products',
+            field=models.ManyToManyField(related_name='orders', through='crm.OrderLine', to='crm.product'),
+        ),
+    ]
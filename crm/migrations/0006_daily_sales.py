@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:18
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_orderline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('product_key', models.PositiveBigIntegerField(default=0)),
+                ('customer_key', models.PositiveBigIntegerField(default=0)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveBigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+            ],
+            options={
+                'ordering': ['day'],
+                'indexes': [models.Index(fields=['day'], name='crm_dailysales_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product_key', 'customer_key', 'day'), name='crm_dailysales_key_day_uniq')],
+            },
+        ),
+    ]
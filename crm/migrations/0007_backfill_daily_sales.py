@@ -0,0 +1,54 @@
+from django.db import migrations
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import TruncDate
+
+# DailySales.ALL: the row covers every product or every customer
+ALL = 0
+
+
+def backfill_daily_sales(apps, schema_editor):
+    """Rollups for every existing order, built as crm.rollups.rebuild() does"""
+    OrderLine = apps.get_model('crm', 'OrderLine')
+    DailySales = apps.get_model('crm', 'DailySales')
+    using = schema_editor.connection.alias
+    qn = schema_editor.connection.ops.quote_name
+    lines = OrderLine.objects.using(using).order_by()
+    if not lines.exists():
+        return
+    # Orders created since 0006 already added themselves; start over
+    DailySales.objects.using(using).all().delete()
+    columns = ', '.join(
+        qn(name) for name in
+        ('day', 'product_key', 'customer_key', 'order_count', 'quantity', 'revenue')
+    )
+    # INSERT ... SELECT ... GROUP BY keeps the backfill in the database
+    for product_key, customer_key in ((Value(ALL), Value(ALL)),
+                                      (F('product_id'), Value(ALL)),
+                                      (Value(ALL), F('order__customer_id')),
+                                      (F('product_id'), F('order__customer_id'))):
+        grouped = lines.values(
+            day=TruncDate('order__order_date'),
+            product_key=product_key,
+            customer_key=customer_key,
+        ).annotate(
+            orders=Count('order', distinct=True),
+            units=Sum('quantity'),
+            total=Sum(F('quantity') * F('unit_price')),
+        )
+        sql, params = grouped.query.sql_with_params()
+        schema_editor.execute(
+            f"INSERT INTO {qn(DailySales._meta.db_table)} ({columns}) {sql}", params
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_daily_sales'),
+    ]
+
+    operations = [
+        # Without it salesSeries has no history before the migration; the
+        # rows go away with the table when 0006 is reversed
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import connections, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
 from django.core.validators import RegexValidator, MinValueValidator
 from decimal import Decimal
+from .result_cache import invalidate
 
 
 class Customer(models.Model):
@@ -23,6 +26,56 @@ class Customer(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Default ordering / keyset pagination and created_at ranges
+            models.Index(fields=['-created_at', '-id'], name='crm_customer_created_idx'),
+            # phone_starts_with prefix lookups (pattern ops on PostgreSQL)
+            models.Index(
+                fields=['phone'], name='crm_customer_phone_idx',
+                opclasses=['varchar_pattern_ops']
+            ),
+        ]
+
+
+def supports_update_returning(connection):
+    """UPDATE ... RETURNING is available on PostgreSQL and SQLite 3.35+"""
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+
+
+class ProductQuerySet(models.QuerySet):
+    def restock(self, increment):
+        """
+        Add `increment` to the stock of every product in this queryset with a
+        single UPDATE and return the changed rows as (id, name, stock).
+        """
+        connection = connections[self.db]
+        if supports_update_returning(connection):
+            qn = connection.ops.quote_name
+            subquery, params = self.values('pk').query.sql_with_params()
+            sql = (
+                f"UPDATE {qn(Product._meta.db_table)} "
+                f"SET {qn('stock')} = {qn('stock')} + %s "
+                f"WHERE {qn('id')} IN ({subquery}) "
+                f"RETURNING {qn('id')}, {qn('name')}, {qn('stock')}"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, (increment, *params))
+                rows = cursor.fetchall()
+            if rows:
+                invalidate(Product, using=self.db)
+            return rows
+
+        # Lock the rows, update them in one statement, then read them back once
+        ids = list(self.select_for_update().values_list('pk', flat=True))
+        if not ids:
+            return []
+        Product.objects.filter(pk__in=ids).update(stock=F('stock') + increment)
+        invalidate(Product, using=self.db)
+        return list(
+            Product.objects.filter(pk__in=ids).values_list('id', 'name', 'stock')
+        )
 
 
 class Product(models.Model):
@@ -38,11 +91,61 @@ class Product(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} (${self.price})"
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='crm_product_name_idx'),
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            models.Index(fields=['stock'], name='crm_product_stock_idx'),
+            # Hot restock predicate; skipped on backends without partial indexes
+            models.Index(
+                fields=['stock'], name='crm_product_low_stock_idx',
+                condition=models.Q(stock__lt=10)
+            ),
+        ]
+
+
+# Value of one order line; totals are the Sum of this over an order's lines
+LINE_TOTAL = F('quantity') * F('unit_price')
+
+
+class OrderQuerySet(models.QuerySet):
+    @staticmethod
+    def line_total():
+        """
+        Sum of the outer order's lines as a correlated subquery, 0 without
+        lines. Rounded to cents: SQLite sums decimals as floats.
+        """
+        totals = (
+            OrderLine.objects.filter(order=OuterRef('pk'))
+            .order_by()
+            .values('order')
+            .annotate(total=Sum(LINE_TOTAL))
+            .values('total')
+        )
+        return Round(Coalesce(
+            Subquery(totals, output_field=models.DecimalField(max_digits=10, decimal_places=2)),
+            Value(Decimal('0.00')),
+        ), 2)
+
+    def stale_totals(self):
+        """Orders whose stored total_amount no longer matches their lines"""
+        return self.alias(line_total=self.line_total()).exclude(total_amount=F('line_total'))
+
+    def recalculate_totals(self):
+        """
+        Set total_amount of every order in this queryset to the sum of its
+        lines with a single UPDATE; returns the number of orders updated.
+        """
+        updated = self.update(total_amount=self.line_total())
+        if updated:
+            invalidate(Order, using=self.db)
+        return updated
 
 
 class Order(models.Model):
@@ -51,7 +154,7 @@ class Order(models.Model):
         on_delete=models.CASCADE,
         related_name='orders'
     )
-    products = models.ManyToManyField(Product, related_name='orders')
+    products = models.ManyToManyField(Product, through='OrderLine', related_name='orders')
     total_amount = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -59,16 +162,87 @@ class Order(models.Model):
     )
     order_date = models.DateTimeField(auto_now_add=True)
 
+    objects = OrderQuerySet.as_manager()
+
     def __str__(self):
         return f"Order #{self.id} - {self.customer.name}"
 
     class Meta:
         ordering = ['-order_date']
+        indexes = [
+            # Default ordering / keyset pagination and order_date ranges
+            models.Index(fields=['-order_date', '-id'], name='crm_order_date_idx'),
+            # Orders of one customer, newest first
+            models.Index(fields=['customer', '-order_date'], name='crm_order_cust_date_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+        ]
 
     def calculate_total(self):
-        """Calculate total amount from associated products"""
-        total = sum(product.price for product in self.products.all())
-        self.total_amount = total
-        self.save()
-        return total
+        """Recalculate total_amount from the order lines in the database"""
+        Order.objects.filter(pk=self.pk).recalculate_totals()
+        self.refresh_from_db(fields=['total_amount'])
+        return self.total_amount
 
+
+class OrderLine(models.Model):
+    """One product on an order, with the price it was sold at"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_lines')
+    quantity = models.PositiveIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)]
+    )
+    # Snapshot of product.price when the line was added
+    unit_price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(Decimal('0.00'))]
+    )
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} @ {self.unit_price}"
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='crm_orderline_order_product_uniq'),
+        ]
+
+
+class DailySales(models.Model):
+    """
+    Sales per day, maintained from order lines by crm.rollups.
+
+    Each day has a row per product, per customer and per product/customer
+    pair, plus a day total; ALL in product_key or customer_key marks the
+    rows summed over that dimension, so any series reads one row per day.
+    """
+    ALL = 0
+
+    day = models.DateField()
+    product_key = models.PositiveBigIntegerField(default=ALL)
+    customer_key = models.PositiveBigIntegerField(default=ALL)
+    order_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveBigIntegerField(default=0)
+    revenue = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00')
+    )
+
+    def __str__(self):
+        return f"{self.day} product={self.product_key} customer={self.customer_key}: {self.revenue}"
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            # Keys first: series filter on both keys and range over days
+            models.UniqueConstraint(
+                fields=['product_key', 'customer_key', 'day'],
+                name='crm_dailysales_key_day_uniq'
+            ),
+        ]
+        indexes = [
+            # Repairs delete and rebuild whole days
+            models.Index(fields=['day'], name='crm_dailysales_day_idx'),
+        ]
@@ -0,0 +1,152 @@
+from functools import lru_cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.filter.utils import get_filterset_class
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode, get_named_type
+from graphql.execution.values import get_argument_values
+
+PREFETCH_PREFIX = '_gql_'
+PAGINATION_ARGS = ('first', 'last', 'before', 'after', 'offset')
+
+
+def has_filter_args(args):
+    """True when a connection was called with anything besides pagination"""
+    return any(
+        value is not None
+        for key, value in args.items()
+        if key not in PAGINATION_ARGS
+    )
+
+
+def get_prefetched(instance, info):
+    """Return the list the optimizer prefetched for this field, if any"""
+    return getattr(instance, PREFETCH_PREFIX + str(info.path.key), None)
+
+
+def optimize_queryset(queryset, info):
+    """
+    Shape a root queryset after the selection set of the field being resolved.
+
+    Forward relations become select_related, reverse and M2M relations become
+    Prefetch objects (filtered by the nested connection's arguments), and
+    only the selected columns are loaded.
+    """
+    object_type, selection_sets = _node_selections(
+        info, info.return_type, [node.selection_set for node in info.field_nodes]
+    )
+    return _optimize(queryset, info, object_type, selection_sets)
+
+
+@lru_cache(maxsize=None)
+def _filterset_for(graphene_type):
+    return get_filterset_class(graphene_type._meta.filterset_class)
+
+
+def _collect(info, parent_type, selection_sets):
+    """Flatten fragments into (field node, field definition) pairs"""
+    for selection_set in selection_sets:
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_def = parent_type.fields.get(selection.name.value)
+                if field_def is not None:
+                    yield selection, field_def
+            elif isinstance(selection, InlineFragmentNode):
+                yield from _collect(info, parent_type, [selection.selection_set])
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = info.fragments[selection.name.value]
+                yield from _collect(info, parent_type, [fragment.selection_set])
+
+
+def _node_selections(info, gql_type, selection_sets):
+    """Unwrap Relay connections down to the node type and its selections"""
+    object_type = get_named_type(gql_type)
+    if 'edges' not in object_type.fields:
+        return object_type, selection_sets
+
+    edge_sets = [
+        node.selection_set
+        for node, _ in _collect(info, object_type, selection_sets)
+        if node.name.value == 'edges'
+    ]
+    edge_type = get_named_type(object_type.fields['edges'].type)
+    node_sets = [
+        node.selection_set
+        for node, _ in _collect(info, edge_type, edge_sets)
+        if node.name.value == 'node'
+    ]
+    return get_named_type(edge_type.fields['node'].type), node_sets
+
+
+def _optimize(queryset, info, object_type, selection_sets):
+    only, select, prefetch = _plan(
+        info, queryset.model, object_type, selection_sets, prefix=''
+    )
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.only(*only)
+
+
+def _plan(info, model, object_type, selection_sets, prefix):
+    # The pk, every FK column and the ordering columns are always kept:
+    # relay ids, the loaders, prefetch joins and keyset cursors read them.
+    only = {prefix + model._meta.pk.name}
+    only.update(
+        prefix + field.name
+        for field in model._meta.concrete_fields
+        if field.is_relation
+    )
+    only.update(
+        prefix + key.lstrip('-')
+        for key in model._meta.ordering
+        if isinstance(key, str)
+    )
+    select, prefetch = [], []
+
+    for node, field_def in _collect(info, object_type, selection_sets):
+        try:
+            field = model._meta.get_field(to_snake_case(node.name.value))
+        except FieldDoesNotExist:
+            continue
+
+        if not field.is_relation:
+            only.add(prefix + field.name)
+            continue
+
+        sub_type, sub_sets = _node_selections(info, field_def.type, [node.selection_set])
+
+        if field.many_to_one or field.one_to_one:
+            select.append(prefix + field.name)
+            sub_only, sub_select, sub_prefetch = _plan(
+                info, field.related_model, sub_type, sub_sets,
+                prefix=prefix + field.name + '__'
+            )
+            only.update(sub_only)
+            select.extend(sub_select)
+            prefetch.extend(sub_prefetch)
+            continue
+
+        related = field.related_model._default_manager.all()
+        args = get_argument_values(field_def, node, info.variable_values)
+        if has_filter_args(args):
+            filterset = _filterset_for(sub_type.graphene_type)(
+                data={k: v for k, v in args.items() if k not in PAGINATION_ARGS},
+                queryset=related,
+            )
+            if not filterset.is_valid():
+                # Leave it to the resolver so the error is reported as usual
+                continue
+            related = filterset.qs
+
+        key = node.alias.value if node.alias else node.name.value
+        prefetch.append(Prefetch(
+            prefix + field.name,
+            queryset=_optimize(related, info, sub_type, sub_sets),
+            to_attr=PREFETCH_PREFIX + key,
+        ))
+
+    return only, select, prefetch
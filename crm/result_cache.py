@@ -0,0 +1,182 @@
+"""
+Query result cache invalidated by per-model version counters.
+
+A cached result is keyed by the document hash, the normalized variables,
+the operation name and the current version of every model the document can
+read. Writes bump the version of the model they touch (see crm.signals), so
+only results that read that model stop matching.
+"""
+import json
+import time
+from hashlib import sha256
+from threading import Lock
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLObjectType,
+    GraphQLUnionType,
+    InlineFragmentNode,
+    get_named_type,
+    get_operation_ast,
+)
+
+VERSION_PREFIX = 'crm:version:'
+RESULT_PREFIX = 'crm:result:'
+
+# Root fields that read models without returning their object types
+ROOT_FIELD_MODELS = {
+    'crmStats': ('crm.customer', 'crm.order'),
+    'salesSeries': ('crm.dailysales',),
+}
+
+
+class ResultCacheStats:
+    def __init__(self):
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+result_stats = ResultCacheStats()
+
+
+def get_cache():
+    return caches[getattr(settings, 'CRM_RESULT_CACHE_ALIAS', 'default')]
+
+
+def is_enabled():
+    return getattr(settings, 'CRM_RESULT_CACHE_ENABLED', True)
+
+
+def model_label(model):
+    return model._meta.label_lower
+
+
+def invalidate(*models, using=None):
+    """
+    Invalidate every cached result that reads one of these models, now and
+    again once the surrounding transaction commits, so a result computed
+    from the pre-commit rows in the meantime is not served afterwards.
+    """
+    bump_versions(*models)
+    transaction.on_commit(lambda: bump_versions(*models), using=using)
+
+
+def bump_versions(*models):
+    cache = get_cache()
+    for model in models:
+        key = VERSION_PREFIX + model_label(model)
+        # A counter that was evicted restarts from a fresh value, never from
+        # one an older cached result could still be keyed with
+        cache.add(key, time.time_ns(), timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_versions(labels):
+    cache = get_cache()
+    keys = [VERSION_PREFIX + label for label in sorted(labels)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def touched_models(schema, document, operation_name=None):
+    """Labels of every model an operation can read, from its selection set"""
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return None
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    root = schema.get_root_type(operation.operation)
+    labels = set()
+    for node in operation.selection_set.selections:
+        if isinstance(node, FieldNode):
+            labels.update(ROOT_FIELD_MODELS.get(node.name.value, ()))
+    _walk(schema, fragments, root, operation.selection_set, labels)
+    return labels
+
+
+def _model_of(gql_type):
+    meta = getattr(getattr(gql_type, 'graphene_type', None), '_meta', None)
+    model = getattr(meta, 'model', None)
+    return model_label(model) if model is not None else None
+
+
+def _walk(schema, fragments, gql_type, selection_set, labels):
+    named = get_named_type(gql_type)
+    if isinstance(named, GraphQLUnionType):
+        for member in named.types:
+            labels.add(_model_of(member))
+    elif isinstance(named, GraphQLObjectType):
+        labels.add(_model_of(named))
+    labels.discard(None)
+
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            fields = getattr(named, 'fields', {})
+            field_def = fields.get(selection.name.value)
+            if field_def is not None:
+                _walk(schema, fragments, field_def.type, selection.selection_set, labels)
+        elif isinstance(selection, InlineFragmentNode):
+            condition = selection.type_condition
+            target = schema.get_type(condition.name.value) if condition else named
+            _walk(schema, fragments, target, selection.selection_set, labels)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                target = schema.get_type(fragment.type_condition.name.value)
+                _walk(schema, fragments, target, fragment.selection_set, labels)
+
+
+def result_key(digest, variables, operation_name, labels):
+    normalized = json.dumps(variables or {}, sort_keys=True, separators=(',', ':'), default=str)
+    versions = get_versions(labels)
+    raw = json.dumps(
+        [digest, normalized, operation_name, sorted(labels), versions], default=str
+    )
+    return RESULT_PREFIX + sha256(raw.encode('utf-8')).hexdigest()
+
+
+def get_result(key):
+    data = get_cache().get(key)
+    result_stats.record(data is not None)
+    return data
+
+
+def set_result(key, data):
+    get_cache().set(key, data, getattr(settings, 'CRM_RESULT_CACHE_TIMEOUT', 300))
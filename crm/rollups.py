@@ -0,0 +1,193 @@
+"""
+Incremental maintenance of the DailySales rollups.
+
+New orders add their lines with one upsert (add_orders). Edits and deletions
+only mark the order's day; every marked day is rebuilt from the order lines
+once the transaction commits (rebuild_on_commit). rebuild() repairs or
+backfills any range of days the same way.
+
+bulk_create() and queryset.update() send no signals; code paths that write
+lines that way call add_orders() or rebuild_on_commit() themselves.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from functools import partial
+from threading import local
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import LINE_TOTAL, DailySales, Order, OrderLine
+from .result_cache import invalidate
+
+ALL = DailySales.ALL
+CENTS = Decimal('0.01')
+COUNTERS = ('order_count', 'quantity', 'revenue')
+
+# Days (and orders whose day is looked up at commit) waiting for a rebuild
+_pending = local()
+
+
+def day_bounds(first, last):
+    """Aware datetimes [start, end) covering the days first..last"""
+    start = timezone.make_aware(datetime.combine(first, time.min))
+    end = timezone.make_aware(datetime.combine(last + timedelta(days=1), time.min))
+    return start, end
+
+
+def add_orders(orders, using=None):
+    """Add new orders, given as (order, lines) pairs, to their day's rollups"""
+    totals = defaultdict(lambda: [0, 0, Decimal('0.00')])
+    for order, lines in orders:
+        day = timezone.localdate(order.order_date)
+        keys = defaultdict(lambda: [0, Decimal('0.00')])
+        for line in lines:
+            revenue = line.quantity * line.unit_price
+            for product_key in (ALL, line.product_id):
+                for customer_key in (ALL, order.customer_id):
+                    entry = keys[(day, product_key, customer_key)]
+                    entry[0] += line.quantity
+                    entry[1] += revenue
+        # The order counts once in every row it touches
+        for key, (quantity, revenue) in keys.items():
+            total = totals[key]
+            total[0] += 1
+            total[1] += quantity
+            total[2] += revenue
+    if totals:
+        _increment(totals, using or router.db_for_write(DailySales))
+
+
+def _increment(totals, using, batch_size=500):
+    connection = connections[using]
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        with transaction.atomic(using=using):
+            for (day, product_key, customer_key), values in totals.items():
+                rows = DailySales.objects.using(using).filter(
+                    day=day, product_key=product_key, customer_key=customer_key
+                )
+                if not rows.update(**{
+                    name: F(name) + value for name, value in zip(COUNTERS, values)
+                }):
+                    rows.create(**dict(zip(COUNTERS, values)))
+        invalidate(DailySales, using=using)
+        return
+
+    # INSERT ... ON CONFLICT DO UPDATE adds to existing rows in one statement
+    qn = connection.ops.quote_name
+    table = qn(DailySales._meta.db_table)
+    columns = ('day', 'product_key', 'customer_key') + COUNTERS
+    fields = [DailySales._meta.get_field(name) for name in columns]
+    increments = ', '.join(
+        f"{qn(name)} = {table}.{qn(name)} + excluded.{qn(name)}" for name in COUNTERS
+    )
+    rows = [(*key, *values) for key, values in totals.items()]
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(batch))
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(qn(name) for name in columns)}) "
+                f"VALUES {placeholders} "
+                f"ON CONFLICT ({qn('product_key')}, {qn('customer_key')}, {qn('day')}) "
+                f"DO UPDATE SET {increments}",
+                [
+                    field.get_db_prep_save(value, connection)
+                    for row in batch
+                    for field, value in zip(fields, row)
+                ],
+            )
+    invalidate(DailySales, using=using)
+
+
+def rebuild(first, last, using=None):
+    """
+    Recompute the rollups of the days first..last from the order lines.
+
+    Each level is one INSERT ... SELECT ... GROUP BY, so no row passes
+    through Python however many orders the days hold.
+    """
+    using = using or router.db_for_write(DailySales)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    start, end = day_bounds(first, last)
+    lines = (
+        OrderLine.objects.using(using)
+        .filter(order__order_date__gte=start, order__order_date__lt=end)
+        .order_by()
+    )
+    columns = ', '.join(
+        qn(name) for name in ('day', 'product_key', 'customer_key') + COUNTERS
+    )
+    with transaction.atomic(using=using):
+        DailySales.objects.using(using).filter(day__gte=first, day__lte=last).delete()
+        rows = 0
+        for product_key, customer_key in ((Value(ALL), Value(ALL)),
+                                          (F('product_id'), Value(ALL)),
+                                          (Value(ALL), F('order__customer_id')),
+                                          (F('product_id'), F('order__customer_id'))):
+            # SELECT columns follow the values()/annotate() order
+            grouped = lines.values(
+                day=TruncDate('order__order_date'),
+                product_key=product_key,
+                customer_key=customer_key,
+            ).annotate(
+                orders=Count('order', distinct=True),
+                units=Sum('quantity'),
+                total=Sum(LINE_TOTAL),
+            )
+            sql, params = grouped.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {qn(DailySales._meta.db_table)} ({columns}) {sql}", params
+                )
+                rows += cursor.rowcount
+    invalidate(DailySales, using=using)
+    return rows
+
+
+def rebuild_range(first, last, chunk_days=None, using=None):
+    """rebuild() first..last in transactions of CRM_SALES_REBUILD_CHUNK_DAYS days"""
+    chunk = timedelta(days=chunk_days or getattr(settings, 'CRM_SALES_REBUILD_CHUNK_DAYS', 31))
+    rows = 0
+    start = first
+    while start <= last:
+        end = min(last, start + chunk - timedelta(days=1))
+        rows += rebuild(start, end, using=using)
+        start = end + timedelta(days=1)
+    return rows
+
+
+def _runs(days):
+    """Group sorted days into (first, last) ranges of consecutive days"""
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+def rebuild_on_commit(days=(), order_ids=(), using=None):
+    """Rebuild the given days, and the days of these orders, after commit"""
+    using = using or router.db_for_write(DailySales)
+    pending = _pending.__dict__.setdefault(using, (set(), set()))
+    pending[0].update(days)
+    pending[1].update(order_ids)
+    # Every call schedules a flush; the first one to run takes all the days
+    transaction.on_commit(partial(_flush, using), using=using)
+
+
+def _flush(using):
+    days, order_ids = _pending.__dict__.pop(using, (set(), set()))
+    if order_ids:
+        days.update(
+            timezone.localdate(order_date)
+            for order_date in Order.objects.using(using)
+            .filter(pk__in=order_ids).values_list('order_date', flat=True)
+        )
+    for first, last in _runs(sorted(days)):
+        rebuild(first, last, using=using)
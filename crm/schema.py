@@ -1,37 +1,125 @@
 import graphene
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Avg, Count, DateField, Q, Sum
+from django.db.models.functions import Trunc
 from decimal import Decimal
 from datetime import datetime
-from crm.models import Product, Customer, Order
-from .filters import CustomerFilter, ProductFilter, OrderFilter
+from crm.models import Product, Customer, Order, OrderLine, DailySales
+from crm import rollups, search as crm_search
+from .idempotency import IdempotentExecutionContext, idempotent
+from .filters import CustomerFilter, ProductFilter, OrderFilter, filter_phone_prefix
+from .fields import BatchedFilterConnectionField, KeysetFilterConnectionField
+from .loaders import get_loaders
+from .optimizer import get_prefetched, has_filter_args, optimize_queryset
+from .result_cache import invalidate
+
+
+def list_limit(first=None):
+    """Rows a list field returns: first, capped like a connection page"""
+    limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    if first is not None:
+        limit = max(0, min(first, limit))
+    return limit
+
+
+def prime_list(info, queryset, first=None):
+    """
+    Evaluate a list resolver's queryset, capped like a connection page, and
+    queue its relations for batching
+    """
+    rows = list(queryset[:list_limit(first)])
+    get_loaders(info).prime(rows)
+    return rows
+
 
 # Object Types
 class CustomerType(DjangoObjectType):
+    orders = BatchedFilterConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Customer
         fields = '__all__'
         filterset_class = CustomerFilter
         interfaces = (graphene.relay.Node,)
 
+    def resolve_orders(self, info, **kwargs):
+        prefetched = get_prefetched(self, info)
+        if prefetched is not None:
+            return prefetched
+        if has_filter_args(kwargs):
+            return self.orders.all()
+        return get_loaders(info).orders_by_customer.load(self.pk)
+
 
 class ProductType(DjangoObjectType):
+    orders = BatchedFilterConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Product
-        fields = '__all__'
+        # Lines are reached through their order, not listed per product
+        exclude = ('order_lines',)
         filterset_class = ProductFilter
         interfaces = (graphene.relay.Node,)
 
+    def resolve_orders(self, info, **kwargs):
+        prefetched = get_prefetched(self, info)
+        if prefetched is not None:
+            return prefetched
+        if has_filter_args(kwargs):
+            return self.orders.all()
+        return get_loaders(info).orders_by_product.load(self.pk)
+
+
+class OrderLineType(DjangoObjectType):
+    class Meta:
+        model = OrderLine
+        fields = ('id', 'product', 'quantity', 'unit_price')
+
+    def resolve_product(self, info):
+        if OrderLine.product.is_cached(self):
+            return self.product
+        return get_loaders(info).product.load(self.product_id)
+
 
 class OrderType(DjangoObjectType):
+    products = BatchedFilterConnectionField(ProductType, required=True)
+    lines = graphene.List(graphene.NonNull(OrderLineType), required=True)
+
     class Meta:
         model = Order
         fields = '__all__'
         filterset_class = OrderFilter
         interfaces = (graphene.relay.Node,)
 
+    def resolve_customer(self, info):
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loaders(info).customer.load(self.customer_id)
+
+    def resolve_products(self, info, **kwargs):
+        prefetched = get_prefetched(self, info)
+        if prefetched is not None:
+            return prefetched
+        if has_filter_args(kwargs):
+            return self.products.all()
+        return get_loaders(info).products_by_order.load(self.pk)
+
+    def resolve_lines(self, info):
+        prefetched = get_prefetched(self, info)
+        if prefetched is not None:
+            return prefetched
+        return get_loaders(info).lines_by_order.load(self.pk)
+
+
+class SearchResult(graphene.Union):
+    class Meta:
+        types = (CustomerType, ProductType)
+
 
 # Input Types
 class CustomerInput(graphene.InputObjectType):
@@ -46,9 +134,16 @@ class ProductInput(graphene.InputObjectType):
     stock = graphene.Int()
 
 
+class OrderLineInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    quantity = graphene.Int(default_value=1)
+
+
 class OrderInput(graphene.InputObjectType):
     customer_id = graphene.ID(required=True)
-    product_ids = graphene.List(graphene.ID, required=True)
+    # One unit of each product; use lines for quantities
+    product_ids = graphene.List(graphene.ID)
+    lines = graphene.List(graphene.NonNull(OrderLineInput))
     order_date = graphene.DateTime()
 
 
@@ -59,6 +154,105 @@ class UpdatedProductType(graphene.ObjectType):
     stock = graphene.Int()
 
 
+class CRMStatsType(graphene.ObjectType):
+    """Aggregate CRM figures, computed in the database"""
+    total_customers = graphene.Int()
+    new_customers = graphene.Int()
+    total_orders = graphene.Int()
+    total_revenue = graphene.Decimal()
+    average_order_value = graphene.Decimal()
+    distinct_purchasers = graphene.Int()
+
+
+def crm_stats_aggregates(date_from=None, date_to=None):
+    """Aggregate expressions over customers LEFT JOIN orders for crmStats"""
+    in_range = Q()
+    created_in_range = Q()
+    if date_from:
+        in_range &= Q(orders__order_date__gte=date_from)
+        created_in_range &= Q(created_at__gte=date_from)
+    if date_to:
+        in_range &= Q(orders__order_date__lte=date_to)
+        created_in_range &= Q(created_at__lte=date_to)
+
+    return {
+        'total_customers': Count('id', distinct=True),
+        'new_customers': Count('id', filter=created_in_range or None, distinct=True),
+        'total_orders': Count('orders', filter=in_range or None),
+        'total_revenue': Sum('orders__total_amount', filter=in_range or None),
+        'average_order_value': Avg('orders__total_amount', filter=in_range or None),
+        'distinct_purchasers': Count(
+            'id', filter=in_range & Q(orders__isnull=False), distinct=True
+        ),
+    }
+
+
+def crm_stats_result(stats):
+    """CRMStatsType from the aggregate() result, money rounded to cents"""
+    cents = Decimal('0.01')
+    return CRMStatsType(
+        total_customers=stats['total_customers'],
+        new_customers=stats['new_customers'],
+        total_orders=stats['total_orders'],
+        total_revenue=(stats['total_revenue'] or Decimal('0')).quantize(cents),
+        average_order_value=(stats['average_order_value'] or Decimal('0')).quantize(cents),
+        distinct_purchasers=stats['distinct_purchasers'],
+    )
+
+
+def filter_customers_list(queryset, kwargs):
+    """Apply the customersList arguments to a queryset"""
+    if 'name' in kwargs:
+        queryset = queryset.filter(name__icontains=kwargs['name'])
+    if 'email' in kwargs:
+        queryset = queryset.filter(email__icontains=kwargs['email'])
+    if 'phone_starts_with' in kwargs:
+        queryset = filter_phone_prefix(queryset, kwargs['phone_starts_with'])
+    if 'created_at_gte' in kwargs:
+        queryset = queryset.filter(created_at__gte=kwargs['created_at_gte'])
+    if 'created_at_lte' in kwargs:
+        queryset = queryset.filter(created_at__lte=kwargs['created_at_lte'])
+    return queryset
+
+
+def filter_products_list(queryset, kwargs):
+    """Apply the productsList arguments to a queryset"""
+    if 'name' in kwargs:
+        queryset = queryset.filter(name__icontains=kwargs['name'])
+    if 'price_gte' in kwargs:
+        queryset = queryset.filter(price__gte=kwargs['price_gte'])
+    if 'price_lte' in kwargs:
+        queryset = queryset.filter(price__lte=kwargs['price_lte'])
+    if 'stock_gte' in kwargs:
+        queryset = queryset.filter(stock__gte=kwargs['stock_gte'])
+    if 'stock_lte' in kwargs:
+        queryset = queryset.filter(stock__lte=kwargs['stock_lte'])
+    if 'low_stock' in kwargs:
+        queryset = queryset.filter(stock__lt=kwargs['low_stock'])
+    return queryset
+
+
+def filter_orders_list(queryset, kwargs):
+    """Apply the ordersList arguments to a queryset"""
+    if 'customer_name' in kwargs:
+        queryset = queryset.filter(customer__name__icontains=kwargs['customer_name'])
+    if 'customer_email' in kwargs:
+        queryset = queryset.filter(customer__email__icontains=kwargs['customer_email'])
+    if 'product_name' in kwargs:
+        queryset = queryset.filter(products__name__icontains=kwargs['product_name']).distinct()
+    if 'product_id' in kwargs:
+        queryset = queryset.filter(products__id=kwargs['product_id']).distinct()
+    if 'total_amount_gte' in kwargs:
+        queryset = queryset.filter(total_amount__gte=kwargs['total_amount_gte'])
+    if 'total_amount_lte' in kwargs:
+        queryset = queryset.filter(total_amount__lte=kwargs['total_amount_lte'])
+    if 'order_date_gte' in kwargs:
+        queryset = queryset.filter(order_date__gte=kwargs['order_date_gte'])
+    if 'order_date_lte' in kwargs:
+        queryset = queryset.filter(order_date__lte=kwargs['order_date_lte'])
+    return queryset
+
+
 # Mutations
 class CreateCustomer(graphene.Mutation):
     class Arguments:
@@ -110,43 +304,87 @@ class CreateCustomer(graphene.Mutation):
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
         input = graphene.List(CustomerInput, required=True)
+        # Retries with the same key get the first response back
+        idempotency_key = graphene.String()
 
     customers = graphene.List(CustomerType)
     errors = graphene.List(graphene.String)
     success_count = graphene.Int()
 
+    @idempotent()
     def mutate(self, info, input):
         customers = []
         errors = []
 
+        # [CustomerInput] allows null rows; they fail alone
+        rows = []
         for idx, customer_data in enumerate(input):
+            if customer_data is None:
+                errors.append((idx, f"Row {idx + 1}: Error - Row is null"))
+                continue
+            rows.append((idx, customer_data))
+
+        # One query for every email that is already taken
+        emails = {customer_data.email for _, customer_data in rows}
+        taken = set(
+            Customer.objects.filter(email__in=emails).values_list('email', flat=True)
+        )
+
+        # Validate all rows in memory; duplicates inside the batch are
+        # reported the same way as duplicates against the database
+        for idx, customer_data in rows:
             try:
-                # Check if email already exists
-                if Customer.objects.filter(email=customer_data.email).exists():
+                if customer_data.email in taken:
                     errors.append(
-                        f"Row {idx + 1}: Email '{customer_data.email}' already exists"
+                        (idx, f"Row {idx + 1}: Email '{customer_data.email}' already exists")
                     )
                     continue
 
-                # Create customer
                 customer = Customer(
                     name=customer_data.name,
                     email=customer_data.email,
                     phone=customer_data.get('phone', '')
                 )
-                customer.full_clean()
-                customer.save()
-                customers.append(customer)
+                customer.full_clean(validate_unique=False)
+                taken.add(customer.email)
+                customers.append((idx, customer))
 
             except ValidationError as e:
-                errors.append(f"Row {idx + 1}: {str(e)}")
+                errors.append((idx, f"Row {idx + 1}: {str(e)}"))
             except Exception as e:
-                errors.append(f"Row {idx + 1}: Error - {str(e)}")
+                errors.append((idx, f"Row {idx + 1}: Error - {str(e)}"))
 
+        chunk_size = getattr(settings, 'CRM_BULK_CREATE_CHUNK_SIZE', 500)
+        try:
+            with transaction.atomic():
+                Customer.objects.bulk_create(
+                    [customer for _, customer in customers], batch_size=chunk_size
+                )
+            created = customers
+        except IntegrityError:
+            # A concurrent writer took one of the emails; insert row by row
+            # so only the conflicting rows are rejected
+            created = []
+            for idx, customer in customers:
+                customer.pk = None
+                try:
+                    with transaction.atomic():
+                        customer.save()
+                    created.append((idx, customer))
+                except IntegrityError:
+                    errors.append(
+                        (idx, f"Row {idx + 1}: Email '{customer.email}' already exists")
+                    )
+
+        if created:
+            # bulk_create() sends no post_save signals
+            invalidate(Customer)
+
+        errors.sort(key=lambda error: error[0])
         return BulkCreateCustomers(
-            customers=customers,
-            errors=errors if errors else None,
-            success_count=len(customers)
+            customers=[customer for _, customer in created],
+            errors=[message for _, message in errors] or None,
+            success_count=len(created)
         )
 
 
@@ -206,14 +444,62 @@ class CreateProduct(graphene.Mutation):
             )
 
 
+def order_quantities(input):
+    """
+    Quantity per product id of an OrderInput, with repeated products merged,
+    or an error message
+    """
+    # Each line is (product id, quantity); product_ids count once each
+    requested = [
+        (int(line.product_id), line.quantity) for line in input.lines or []
+    ] + [(int(product_id), 1) for product_id in input.product_ids or []]
+
+    # Validate at least one product
+    if not requested:
+        return None, "At least one product must be selected"
+
+    if any(quantity is None or quantity < 1 for _, quantity in requested):
+        return None, "Quantity must be at least 1"
+
+    # Merge repeated products into one line
+    quantities = {}
+    for product_id, quantity in requested:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities, None
+
+
+def missing_products_message(quantities, products):
+    missing = [str(pid) for pid in quantities if pid not in products]
+    if not missing:
+        return None
+    if len(missing) == 1:
+        return f"Product with ID {missing[0]} does not exist"
+    return f"Products with IDs {', '.join(missing)} do not exist"
+
+
+def order_lines(quantities, products):
+    """Unsaved lines for the quantities and the order total"""
+    # Lines snapshot the current prices; the total is taken from those same
+    # values, so it equals the Sum over the stored lines
+    lines = [
+        OrderLine(product_id=pid, quantity=quantity, unit_price=products[pid].price)
+        for pid, quantity in quantities.items()
+    ]
+    return lines, sum(line.quantity * line.unit_price for line in lines)
+
+
 class CreateOrder(graphene.Mutation):
     class Arguments:
         input = OrderInput(required=True)
+        # Retries with the same key get the first created order back
+        idempotency_key = graphene.String()
 
     order = graphene.Field(OrderType)
     message = graphene.String()
     success = graphene.Boolean()
 
+    # Failed attempts created nothing, so a retry may run them again
+    @idempotent(replayable=lambda payload: payload.success)
     def mutate(self, info, input):
         try:
             # Validate customer exists
@@ -226,41 +512,40 @@ class CreateOrder(graphene.Mutation):
                     success=False
                 )
 
-            # Validate at least one product
-            if not input.product_ids or len(input.product_ids) == 0:
+            quantities, message = order_quantities(input)
+            if message:
                 return CreateOrder(
                     order=None,
-                    message="At least one product must be selected",
+                    message=message,
                     success=False
                 )
 
-            # Validate all products exist
-            products = []
-            for product_id in input.product_ids:
-                try:
-                    product = Product.objects.get(pk=product_id)
-                    products.append(product)
-                except Product.DoesNotExist:
-                    return CreateOrder(
-                        order=None,
-                        message=f"Product with ID {product_id} does not exist",
-                        success=False
-                    )
+            # Validate all products exist with a single query
+            products = Product.objects.only('id', 'price').in_bulk(list(quantities))
+            message = missing_products_message(quantities, products)
+            if message:
+                return CreateOrder(
+                    order=None,
+                    message=message,
+                    success=False
+                )
+
+            lines, total = order_lines(quantities, products)
 
-            # Create order in a transaction
+            # Create order and its lines in a transaction
             with transaction.atomic():
-                order = Order(customer=customer)
+                order = Order(customer=customer, total_amount=total)
                 if hasattr(input, 'order_date') and input.order_date:
                     order.order_date = input.order_date
                 order.save()
 
-                # Add products
-                order.products.set(products)
-
-                # Calculate total amount
-                total = sum(product.price for product in products)
-                order.total_amount = total
-                order.save()
+                # Add every line with one INSERT
+                for line in lines:
+                    line.order_id = order.pk
+                OrderLine.objects.bulk_create(lines)
+                # bulk_create sends no signals
+                invalidate(OrderLine, Product)
+                rollups.add_orders([(order, lines)])
 
             return CreateOrder(
                 order=order,
@@ -276,37 +561,161 @@ class CreateOrder(graphene.Mutation):
             )
 
 
+def insert_orders(orders, chunk_size):
+    """Insert (row, order, lines) triples with their rollups, inside a transaction"""
+    created = [order for _, order, _ in orders]
+    if connection.features.can_return_rows_from_bulk_insert:
+        Order.objects.bulk_create(created, batch_size=chunk_size)
+    else:
+        # The lines need the primary keys of their orders
+        for order in created:
+            order.save()
+    for _, order, lines in orders:
+        for line in lines:
+            line.order_id = order.pk
+    OrderLine.objects.bulk_create(
+        [line for _, _, lines in orders for line in lines], batch_size=chunk_size
+    )
+    # bulk_create sends no signals
+    invalidate(Order, OrderLine, Product)
+    rollups.add_orders([(order, lines) for _, order, lines in orders])
+
+
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(OrderInput, required=True)
+        # Retries with the same key get the first response back
+        idempotency_key = graphene.String()
+
+    orders = graphene.List(OrderType)
+    errors = graphene.List(graphene.String)
+    success_count = graphene.Int()
+
+    @idempotent()
+    def mutate(self, info, input):
+        rows = []
+        errors = []
+
+        for idx, order_data in enumerate(input):
+            try:
+                quantities, message = order_quantities(order_data)
+                if message:
+                    errors.append((idx, f"Row {idx + 1}: {message}"))
+                    continue
+                rows.append((idx, order_data, int(order_data.customer_id), quantities))
+            except Exception as e:
+                errors.append((idx, f"Row {idx + 1}: Error - {str(e)}"))
+
+        # One query for every customer and one for every product of the batch
+        customers = Customer.objects.in_bulk({row[2] for row in rows})
+        products = Product.objects.only('id', 'price').in_bulk(
+            {pid for row in rows for pid in row[3]}
+        )
+
+        orders = []
+        for idx, order_data, customer_id, quantities in rows:
+            if customer_id not in customers:
+                errors.append(
+                    (idx, f"Row {idx + 1}: Customer with ID {customer_id} does not exist")
+                )
+                continue
+            message = missing_products_message(quantities, products)
+            if message:
+                errors.append((idx, f"Row {idx + 1}: {message}"))
+                continue
+
+            lines, total = order_lines(quantities, products)
+            order = Order(customer=customers[customer_id], total_amount=total)
+            if order_data.order_date:
+                order.order_date = order_data.order_date
+            orders.append((idx, order, lines))
+
+        created = []
+        if orders:
+            chunk_size = getattr(settings, 'CRM_BULK_CREATE_CHUNK_SIZE', 500)
+            try:
+                with transaction.atomic():
+                    insert_orders(orders, chunk_size)
+                created = orders
+            except IntegrityError:
+                # A customer or product was deleted since it was looked up;
+                # insert row by row so only the affected rows are rejected
+                for idx, order, lines in orders:
+                    order.pk = None
+                    order._state.adding = True
+                    for line in lines:
+                        line.pk = None
+                        line._state.adding = True
+                    try:
+                        with transaction.atomic():
+                            insert_orders([(idx, order, lines)], chunk_size)
+                        created.append((idx, order, lines))
+                    except IntegrityError as e:
+                        errors.append((idx, f"Row {idx + 1}: Error - {str(e)}"))
+
+        errors.sort(key=lambda error: error[0])
+        return BulkCreateOrders(
+            orders=[order for _, order, _ in created],
+            errors=[message for _, message in errors] or None,
+            success_count=len(created)
+        )
+
+
 class UpdateLowStockProducts(graphene.Mutation):
-    """Mutation to update low-stock products (stock < 10)"""
+    """Mutation to update low-stock products (stock < threshold)"""
     success = graphene.Boolean()
     message = graphene.String()
     updated_products = graphene.List(UpdatedProductType)
     
     class Arguments:
-        pass
+        threshold = graphene.Int(default_value=10)
+        increment = graphene.Int(default_value=10)
+        batch_size = graphene.Int()
     
-    def mutate(self, info):
+    def mutate(self, info, threshold=10, increment=10, batch_size=None):
         """
-        Updates products with stock < 10 by incrementing stock by 10.
-        Returns list of updated products with new stock levels.
+        Increments the stock of products below `threshold` by `increment`
+        (10 and 10 by default) with set-based UPDATEs of at most `batch_size`
+        rows each. Returns list of updated products with new stock levels.
         """
+        if increment <= 0:
+            return UpdateLowStockProducts(
+                success=False,
+                message="Increment must be positive",
+                updated_products=[]
+            )
+        if batch_size is not None and batch_size <= 0:
+            return UpdateLowStockProducts(
+                success=False,
+                message="Batch size must be positive",
+                updated_products=[]
+            )
+
         try:
-            # Find all products with stock < 10
-            low_stock_products = Product.objects.filter(stock__lt=10)
-            updated_products = []
-            
-            for product in low_stock_products:
-                # Increment stock by 10 (simulate restocking)
-                product.stock += 10
-                product.save()
-                
-                updated_products.append(
-                    UpdatedProductType(
-                        id=product.id,
-                        name=product.name,
-                        stock=product.stock
-                    )
-                )
+            rows = []
+            last_id = 0
+            while True:
+                # Walk the catalog by primary key so every batch is bounded
+                # and a product is never restocked twice in one run
+                batch = Product.objects.filter(
+                    stock__lt=threshold, pk__gt=last_id
+                ).order_by('pk')
+                if batch_size:
+                    batch = batch[:batch_size]
+
+                with transaction.atomic():
+                    restocked = batch.restock(increment)
+                rows.extend(restocked)
+
+                if not batch_size or len(restocked) < batch_size:
+                    break
+                last_id = max(row[0] for row in restocked)
+
+            rows.sort(key=lambda row: row[1])
+            updated_products = [
+                UpdatedProductType(id=id, name=name, stock=stock)
+                for id, name, stock in rows
+            ]
             
             return UpdateLowStockProducts(
                 success=True,
@@ -323,15 +732,75 @@ class UpdateLowStockProducts(graphene.Mutation):
 
 
 # Query with Filters
+class SalesGranularity(graphene.Enum):
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+
+
+class SalesPointType(graphene.ObjectType):
+    """Sales of one day, week (starting Monday) or month"""
+    period = graphene.Date()
+    order_count = graphene.Int()
+    quantity = graphene.Int()
+    revenue = graphene.Decimal()
+
+
+def sales_series_queryset(granularity, date_from, date_to, product_id=None, customer_id=None):
+    """One row per period, summed from the DailySales rows of the series only"""
+    if date_from > date_to:
+        raise GraphQLError("'from' must not be after 'to'")
+    max_days = getattr(settings, 'CRM_SALES_SERIES_MAX_DAYS', 731)
+    if (date_to - date_from).days >= max_days:
+        raise GraphQLError(f"salesSeries covers at most {max_days} days")
+
+    try:
+        product_key = int(product_id) if product_id else DailySales.ALL
+        customer_key = int(customer_id) if customer_id else DailySales.ALL
+    except ValueError:
+        raise GraphQLError("productId and customerId must be numeric IDs")
+
+    return (
+        DailySales.objects
+        .filter(
+            product_key=product_key,
+            customer_key=customer_key,
+            day__gte=date_from,
+            day__lte=date_to,
+        )
+        .annotate(period=Trunc('day', getattr(granularity, 'value', granularity),
+                               output_field=DateField()))
+        .order_by('period')
+        .values('period')
+        .annotate(orders=Sum('order_count'), units=Sum('quantity'), total=Sum('revenue'))
+    )
+
+
+def sales_point(row):
+    return SalesPointType(
+        period=row['period'],
+        order_count=row['orders'],
+        quantity=row['units'],
+        revenue=row['total'].quantize(Decimal('0.01')),
+    )
+
+
 class Query(graphene.ObjectType):
     # Filtered queries using DjangoFilterConnectionField
-    all_customers = DjangoFilterConnectionField(CustomerType)
-    all_products = DjangoFilterConnectionField(ProductType)
-    all_orders = DjangoFilterConnectionField(OrderType)
+    all_customers = BatchedFilterConnectionField(CustomerType)
+    all_products = BatchedFilterConnectionField(ProductType)
+    all_orders = BatchedFilterConnectionField(OrderType)
+
+    # Keyset-paginated variants: cursors carry the sort key, no COUNT(*)
+    all_customers_keyset = KeysetFilterConnectionField(CustomerType)
+    all_products_keyset = KeysetFilterConnectionField(ProductType)
+    all_orders_keyset = KeysetFilterConnectionField(OrderType)
     
-    # Legacy list queries (non-filtered, for backward compatibility)
+    # Legacy list queries (non-filtered, for backward compatibility); like a
+    # connection page they return at most RELAY_CONNECTION_MAX_LIMIT rows
     customers_list = graphene.List(
         CustomerType,
+        first=graphene.Int(),
         name=graphene.String(),
         email=graphene.String(),
         phone_starts_with=graphene.String(),
@@ -341,6 +810,7 @@ class Query(graphene.ObjectType):
     
     products_list = graphene.List(
         ProductType,
+        first=graphene.Int(),
         name=graphene.String(),
         price_gte=graphene.Float(),
         price_lte=graphene.Float(),
@@ -351,6 +821,7 @@ class Query(graphene.ObjectType):
     
     orders_list = graphene.List(
         OrderType,
+        first=graphene.Int(),
         customer_name=graphene.String(),
         customer_email=graphene.String(),
         product_name=graphene.String(),
@@ -366,91 +837,104 @@ class Query(graphene.ObjectType):
     product = graphene.Field(ProductType, id=graphene.ID(required=True))
     order = graphene.Field(OrderType, id=graphene.ID(required=True))
     
+    # Aggregates (orders and new customers can be limited to a date range)
+    crm_stats = graphene.Field(
+        CRMStatsType,
+        date_from=graphene.DateTime(),
+        date_to=graphene.DateTime()
+    )
+
+    # Revenue over time, read from the DailySales rollups only
+    sales_series = graphene.List(
+        graphene.NonNull(SalesPointType),
+        granularity=SalesGranularity(default_value='day'),
+        date_from=graphene.Date(required=True, name='from'),
+        date_to=graphene.Date(required=True, name='to'),
+        product_id=graphene.ID(),
+        customer_id=graphene.ID()
+    )
+
+    # Ranked full-text search over customers and products (prefix matching)
+    search = graphene.List(
+        SearchResult,
+        query=graphene.String(required=True),
+        first=graphene.Int(default_value=20)
+    )
+
     # Hello field for heartbeat verification
     hello = graphene.String()
 
     def resolve_hello(self, info):
         return "Hello from GraphQL CRM!"
 
+    def resolve_crm_stats(self, info, date_from=None, date_to=None):
+        """Resolve all figures with one aggregate over customers LEFT JOIN orders"""
+        stats = Customer.objects.order_by().aggregate(**crm_stats_aggregates(date_from, date_to))
+        return crm_stats_result(stats)
+
+    def resolve_sales_series(self, info, date_from, date_to, granularity='day', **kwargs):
+        """Resolve one point per period with a single GROUP BY over the rollups"""
+        queryset = sales_series_queryset(granularity, date_from, date_to, **kwargs)
+        return [sales_point(row) for row in queryset]
+
+    def resolve_search(self, info, query, first=20):
+        """Resolve search hits from the full-text index, best match first"""
+        limit = min(first, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+        try:
+            matches = crm_search.search(query, limit=limit)
+        except crm_search.SearchNotSupported as e:
+            raise GraphQLError(str(e))
+
+        rows = {
+            'customer': Customer.objects.in_bulk(
+                [id for kind, id in matches if kind == 'customer']
+            ),
+            'product': Product.objects.in_bulk(
+                [id for kind, id in matches if kind == 'product']
+            ),
+        }
+        results = [rows[kind][id] for kind, id in matches if id in rows[kind]]
+        get_loaders(info).prime(results)
+        return results
+
     def resolve_customers_list(self, info, **kwargs):
         """Resolve customers with filters"""
-        queryset = Customer.objects.all()
-        
-        # Apply filters
-        if 'name' in kwargs:
-            queryset = queryset.filter(name__icontains=kwargs['name'])
-        if 'email' in kwargs:
-            queryset = queryset.filter(email__icontains=kwargs['email'])
-        if 'phone_starts_with' in kwargs:
-            queryset = queryset.filter(phone__startswith=kwargs['phone_starts_with'])
-        if 'created_at_gte' in kwargs:
-            queryset = queryset.filter(created_at__gte=kwargs['created_at_gte'])
-        if 'created_at_lte' in kwargs:
-            queryset = queryset.filter(created_at__lte=kwargs['created_at_lte'])
-        
-        return queryset
+        queryset = optimize_queryset(Customer.objects.all(), info)
+        return prime_list(info, filter_customers_list(queryset, kwargs), kwargs.get('first'))
 
     def resolve_products_list(self, info, **kwargs):
         """Resolve products with filters"""
-        queryset = Product.objects.all()
-        
-        # Apply filters
-        if 'name' in kwargs:
-            queryset = queryset.filter(name__icontains=kwargs['name'])
-        if 'price_gte' in kwargs:
-            queryset = queryset.filter(price__gte=kwargs['price_gte'])
-        if 'price_lte' in kwargs:
-            queryset = queryset.filter(price__lte=kwargs['price_lte'])
-        if 'stock_gte' in kwargs:
-            queryset = queryset.filter(stock__gte=kwargs['stock_gte'])
-        if 'stock_lte' in kwargs:
-            queryset = queryset.filter(stock__lte=kwargs['stock_lte'])
-        if 'low_stock' in kwargs:
-            queryset = queryset.filter(stock__lt=kwargs['low_stock'])
-        
-        return queryset
+        queryset = optimize_queryset(Product.objects.all(), info)
+        return prime_list(info, filter_products_list(queryset, kwargs), kwargs.get('first'))
 
     def resolve_orders_list(self, info, **kwargs):
         """Resolve orders with filters"""
-        queryset = Order.objects.all()
-        
-        # Apply filters
-        if 'customer_name' in kwargs:
-            queryset = queryset.filter(customer__name__icontains=kwargs['customer_name'])
-        if 'customer_email' in kwargs:
-            queryset = queryset.filter(customer__email__icontains=kwargs['customer_email'])
-        if 'product_name' in kwargs:
-            queryset = queryset.filter(products__name__icontains=kwargs['product_name']).distinct()
-        if 'product_id' in kwargs:
-            queryset = queryset.filter(products__id=kwargs['product_id']).distinct()
-        if 'total_amount_gte' in kwargs:
-            queryset = queryset.filter(total_amount__gte=kwargs['total_amount_gte'])
-        if 'total_amount_lte' in kwargs:
-            queryset = queryset.filter(total_amount__lte=kwargs['total_amount_lte'])
-        if 'order_date_gte' in kwargs:
-            queryset = queryset.filter(order_date__gte=kwargs['order_date_gte'])
-        if 'order_date_lte' in kwargs:
-            queryset = queryset.filter(order_date__lte=kwargs['order_date_lte'])
-        
-        return queryset
+        queryset = optimize_queryset(Order.objects.all(), info)
+        return prime_list(info, filter_orders_list(queryset, kwargs), kwargs.get('first'))
 
     def resolve_customer(self, info, id):
         try:
-            return Customer.objects.get(pk=id)
+            customer = optimize_queryset(Customer.objects.all(), info).get(pk=id)
         except Customer.DoesNotExist:
             return None
+        get_loaders(info).prime([customer])
+        return customer
 
     def resolve_product(self, info, id):
         try:
-            return Product.objects.get(pk=id)
+            product = optimize_queryset(Product.objects.all(), info).get(pk=id)
         except Product.DoesNotExist:
             return None
+        get_loaders(info).prime([product])
+        return product
 
     def resolve_order(self, info, id):
         try:
-            return Order.objects.get(pk=id)
+            order = optimize_queryset(Order.objects.all(), info).get(pk=id)
         except Order.DoesNotExist:
             return None
+        get_loaders(info).prime([order])
+        return order
 
 
 # Mutation
@@ -459,7 +943,20 @@ class Mutation(graphene.ObjectType):
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
 
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
+class Schema(graphene.Schema):
+    """Executes with IdempotentExecutionContext, which idempotent mutations need"""
+
+    def execute(self, *args, **kwargs):
+        kwargs.setdefault('execution_context_class', IdempotentExecutionContext)
+        return super().execute(*args, **kwargs)
+
+    async def execute_async(self, *args, **kwargs):
+        kwargs.setdefault('execution_context_class', IdempotentExecutionContext)
+        return await super().execute_async(*args, **kwargs)
+
+
+schema = Schema(query=Query, mutation=Mutation)
\ No newline at end of file
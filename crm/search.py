@@ -0,0 +1,171 @@
+"""
+Full-text search over customers and products.
+
+SQLite uses external-content FTS5 tables kept in sync by triggers;
+PostgreSQL uses GIN expression indexes over to_tsvector(), which the
+database maintains itself. Both support prefix matching and ranking.
+"""
+import re
+from django.db import connections
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+SEARCHABLE = {
+    # kind: (table, indexed columns)
+    'customer': ('crm_customer', ('name', 'email')),
+    'product': ('crm_product', ('name',)),
+}
+
+
+class SearchNotSupported(Exception):
+    pass
+
+
+def _terms(query):
+    return WORD.findall(query.lower())
+
+
+class SQLiteSearch:
+    """FTS5 tables named <table>_search with the table's id as rowid"""
+
+    def install_sql(self):
+        statements = []
+        for table, columns in SEARCHABLE.values():
+            fts = f"{table}_search"
+            cols = ', '.join(columns)
+            new = ', '.join(f"new.{c}" for c in columns)
+            old = ', '.join(f"old.{c}" for c in columns)
+            statements += [
+                f"CREATE VIRTUAL TABLE {fts} USING fts5("
+                f"{cols}, content='{table}', content_rowid='id', "
+                f"tokenize='unicode61', prefix='2 3')",
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+                f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+                f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+                f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+            ]
+        return statements
+
+    def uninstall_sql(self):
+        statements = []
+        for table, _ in SEARCHABLE.values():
+            statements += [
+                f"DROP TRIGGER IF EXISTS {table}_search_{suffix}"
+                for suffix in ('ai', 'ad', 'au')
+            ]
+            statements.append(f"DROP TABLE IF EXISTS {table}_search")
+        return statements
+
+    def rebuild_sql(self):
+        return [
+            f"INSERT INTO {table}_search({table}_search) VALUES ('rebuild')"
+            for table, _ in SEARCHABLE.values()
+        ]
+
+    def search_sql(self, terms, kinds, limit):
+        # Every term must match; each one also matches as a prefix
+        match = ' '.join(f'"{term}"*' for term in terms)
+        parts, params = [], []
+        for kind in kinds:
+            fts = f"{SEARCHABLE[kind][0]}_search"
+            parts.append(
+                f"SELECT '{kind}' AS kind, rowid AS id, bm25({fts}) AS rank "
+                f"FROM {fts} WHERE {fts} MATCH %s"
+            )
+            params.append(match)
+        sql = ' UNION ALL '.join(parts) + ' ORDER BY rank, id LIMIT %s'
+        return sql, params + [limit]
+
+
+class PostgresSearch:
+    """GIN expression indexes named <table>_search_idx"""
+
+    def document(self, columns):
+        # Emails are also indexed split on '@' and '.' so each part matches
+        parts = []
+        for column in columns:
+            parts.append(f"coalesce({column}, '')")
+            if column == 'email':
+                parts.append(f"regexp_replace(coalesce({column}, ''), '[@.]', ' ', 'g')")
+        text = " || ' ' || ".join(parts)
+        return f"to_tsvector('simple'::regconfig, {text})"
+
+    def install_sql(self):
+        return [
+            f"CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} "
+            f"USING GIN (({self.document(columns)}))"
+            for table, columns in SEARCHABLE.values()
+        ]
+
+    def uninstall_sql(self):
+        return [f"DROP INDEX IF EXISTS {table}_search_idx" for table, _ in SEARCHABLE.values()]
+
+    def rebuild_sql(self):
+        return [f"REINDEX INDEX {table}_search_idx" for table, _ in SEARCHABLE.values()]
+
+    def search_sql(self, terms, kinds, limit):
+        tsquery = ' & '.join(f"{term}:*" for term in terms)
+        parts, params = [], []
+        for kind in kinds:
+            table, columns = SEARCHABLE[kind]
+            document = self.document(columns)
+            parts.append(
+                f"SELECT '{kind}' AS kind, id, "
+                f"-ts_rank({document}, to_tsquery('simple', %s)) AS rank "
+                f"FROM {table} WHERE {document} @@ to_tsquery('simple', %s)"
+            )
+            params += [tsquery, tsquery]
+        sql = ' UNION ALL '.join(parts) + ' ORDER BY rank, id LIMIT %s'
+        return sql, params + [limit]
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearch(),
+    'postgresql': PostgresSearch(),
+}
+
+
+def get_backend(connection):
+    try:
+        return BACKENDS[connection.vendor]
+    except KeyError:
+        raise SearchNotSupported(f"Full-text search is not available on {connection.vendor}")
+
+
+def install(schema_editor):
+    backend = BACKENDS.get(schema_editor.connection.vendor)
+    if backend is not None:
+        for statement in backend.install_sql():
+            schema_editor.execute(statement)
+
+
+def uninstall(schema_editor):
+    backend = BACKENDS.get(schema_editor.connection.vendor)
+    if backend is not None:
+        for statement in backend.uninstall_sql():
+            schema_editor.execute(statement)
+
+
+def rebuild(using='default'):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for statement in get_backend(connection).rebuild_sql():
+            cursor.execute(statement)
+
+
+def search(query, kinds=None, limit=20, using='default'):
+    """Return ranked (kind, id) pairs, best match first"""
+    terms = _terms(query)
+    kinds = [kind for kind in (kinds or SEARCHABLE) if kind in SEARCHABLE]
+    if not terms or not kinds or limit <= 0:
+        return []
+
+    connection = connections[using]
+    sql, params = get_backend(connection).search_sql(terms, kinds, limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(kind, id) for kind, id, _ in cursor.fetchall()]
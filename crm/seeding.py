@@ -0,0 +1,219 @@
+"""
+Synthetic CRM data at production scale.
+
+Product popularity follows a Zipf distribution, baskets are mostly small with
+a long tail, and orders spread over the last `days` days with volume growing
+towards today. Every value is drawn from one random.Random(seed), so the same
+arguments always produce the same rows.
+
+Rows are written with multi-row INSERTs in chunks, with primary keys assigned up
+front so order lines reference their orders without reading ids back; no
+model instance is built per row.
+"""
+import math
+import random
+from bisect import bisect
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+from . import rollups
+from .models import Customer, Product, Order, OrderLine, DailySales
+from .result_cache import invalidate
+
+CENTS = Decimal('0.01')
+# Units per line: mostly one
+QUANTITIES = (1, 2, 3, 4, 6)
+QUANTITY_WEIGHTS = tuple(accumulate((70, 18, 7, 3, 2)))
+
+
+def zipf_cum_weights(count, exponent):
+    """Cumulative weights of ranks 1..count under Zipf's law"""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class Generator:
+    def __init__(self, seed=0, days=365, product_exponent=1.1, customer_exponent=0.6,
+                 basket_mean=2.5, max_basket=20):
+        self.rng = random.Random(seed)
+        self.days = days
+        self.product_exponent = product_exponent
+        self.customer_exponent = customer_exponent
+        self.basket_mean = basket_mean
+        self.max_basket = max_basket
+        self.now = timezone.now()
+
+    def moment(self):
+        """A point in the last `days` days; density grows linearly towards now"""
+        age = self.days * (1 - math.sqrt(self.rng.random()))
+        return self.now - timedelta(days=age)
+
+    def price(self):
+        # Log-normal around $30, between $0.99 and $5,000
+        value = math.exp(self.rng.gauss(3.4, 0.9))
+        return Decimal(min(max(value, 0.99), 5000)).quantize(CENTS)
+
+    def basket_size(self):
+        # 1 plus an exponential tail, so the mean is about basket_mean
+        extra = self.rng.expovariate(1 / max(self.basket_mean - 1, 0.01))
+        return min(self.max_basket, 1 + int(extra))
+
+    def quantity(self):
+        return QUANTITIES[bisect(QUANTITY_WEIGHTS, self.rng.random() * QUANTITY_WEIGHTS[-1])]
+
+    def popularity(self, ids, exponent):
+        """ids in a random popularity order with their Zipf cumulative weights"""
+        ranked = list(ids)
+        self.rng.shuffle(ranked)
+        return ranked, zipf_cum_weights(len(ranked), exponent)
+
+    def pick(self, ranked, cum_weights):
+        return ranked[bisect(cum_weights, self.rng.random() * cum_weights[-1])]
+
+
+def _next_id(model, using):
+    return (model.objects.using(using).aggregate(top=Max('pk'))['top'] or 0) + 1
+
+
+def _insert(connection, model, columns, rows):
+    """Multi-row INSERTs of as many rows as the backend takes parameters for"""
+    qn = connection.ops.quote_name
+    fields = [model._meta.get_field(column) for column in columns]
+    batch_size = connection.ops.bulk_batch_size(fields, rows) or len(rows)
+    row_sql = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f"INSERT INTO {qn(model._meta.db_table)} ({', '.join(qn(c) for c in columns)}) "
+                f"VALUES {', '.join([row_sql] * len(batch))}",
+                [value for row in batch for value in row],
+            )
+
+
+def _chunks(count, size):
+    for start in range(0, count, size):
+        yield start, min(count, start + size)
+
+
+def seed(customers, products, orders, seed=0, days=365, chunk_size=10000,
+         progress=None, using=None, **distribution):
+    """
+    Append generated customers, products and orders and return the number
+    of order lines created. `distribution` is passed on to Generator.
+    """
+    using = using or router.db_for_write(Order)
+    connection = connections[using]
+    ops = connection.ops
+    generator = Generator(seed=seed, days=days, **distribution)
+    rng = generator.rng
+    report = progress or (lambda label, done, total: None)
+
+    # Customers joined over the whole period, most with a phone number
+    first_customer = _next_id(Customer, using)
+    for start, stop in _chunks(customers, chunk_size):
+        with transaction.atomic(using=using):
+            _insert(connection, Customer, ('id', 'name', 'email', 'phone', 'created_at'), [
+                (
+                    pk,
+                    f"Customer {pk}",
+                    f"customer{pk}@example.com",
+                    f"+1{rng.randrange(10 ** 9, 10 ** 10)}" if rng.random() < 0.8 else None,
+                    ops.adapt_datetimefield_value(generator.moment()),
+                )
+                for pk in range(first_customer + start, first_customer + stop)
+            ])
+        report('customers', stop, customers)
+
+    first_product = _next_id(Product, using)
+    prices = {}
+    for start, stop in _chunks(products, chunk_size):
+        rows = []
+        for pk in range(first_product + start, first_product + stop):
+            prices[pk] = generator.price()
+            rows.append((
+                pk, f"Product {pk}", ops.adapt_decimalfield_value(prices[pk]),
+                rng.randrange(0, 200), ops.adapt_datetimefield_value(generator.now),
+            ))
+        with transaction.atomic(using=using):
+            _insert(connection, Product, ('id', 'name', 'price', 'stock', 'created_at'), rows)
+        report('products', stop, products)
+
+    if not orders:
+        invalidate(Customer, Product, using=using)
+        return 0
+
+    # Orders also go to rows that existed before this run
+    prices.update(
+        Product.objects.using(using).filter(pk__lt=first_product).values_list('pk', 'price')
+    )
+    if first_customer == 1:
+        customer_ids = range(1, customers + 1)
+    else:
+        customer_ids = list(Customer.objects.using(using).values_list('pk', flat=True))
+    if not (prices and customer_ids):
+        raise ValueError("Orders need at least one customer and one product")
+    ranked_products, product_weights = generator.popularity(
+        sorted(prices), generator.product_exponent
+    )
+    ranked_customers, customer_weights = generator.popularity(
+        customer_ids, generator.customer_exponent
+    )
+
+    # Ids follow order_date, as they would in production
+    moments = sorted(generator.moment() for _ in range(orders))
+    first_order = _next_id(Order, using)
+    next_line = _next_id(OrderLine, using)
+    first_line = next_line
+    for start, stop in _chunks(orders, chunk_size):
+        order_rows, line_rows = [], []
+        for offset in range(start, stop):
+            order_id = first_order + offset
+            basket = {}
+            for _ in range(generator.basket_size()):
+                product_id = generator.pick(ranked_products, product_weights)
+                basket[product_id] = basket.get(product_id, 0) + generator.quantity()
+            total = Decimal('0.00')
+            for product_id, quantity in basket.items():
+                total += quantity * prices[product_id]
+                line_rows.append((
+                    next_line, order_id, product_id, quantity,
+                    ops.adapt_decimalfield_value(prices[product_id]),
+                ))
+                next_line += 1
+            order_rows.append((
+                order_id,
+                generator.pick(ranked_customers, customer_weights),
+                ops.adapt_decimalfield_value(total),
+                ops.adapt_datetimefield_value(moments[offset]),
+            ))
+        with transaction.atomic(using=using):
+            _insert(connection, Order, ('id', 'customer_id', 'total_amount', 'order_date'), order_rows)
+            _insert(connection, OrderLine, ('id', 'order_id', 'product_id', 'quantity', 'unit_price'), line_rows)
+        report('orders', stop, orders)
+
+    # Explicit ids leave PostgreSQL sequences behind
+    with connection.cursor() as cursor:
+        for sql in ops.sequence_reset_sql(no_style(), [Customer, Product, Order, OrderLine]):
+            cursor.execute(sql)
+
+    rollups.rebuild_range(
+        timezone.localdate(moments[0]), timezone.localdate(moments[-1]), using=using
+    )
+    report('daily sales', orders, orders)
+    invalidate(Customer, Product, Order, OrderLine, using=using)
+    return next_line - first_line
+
+
+def clear(using=None):
+    """Delete every CRM row with one DELETE per table, bypassing signals"""
+    using = using or router.db_for_write(Order)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for model in (DailySales, OrderLine, Order, Customer, Product):
+            cursor.execute(f"DELETE FROM {qn(model._meta.db_table)}")
+    invalidate(Customer, Product, Order, OrderLine, DailySales, using=using)
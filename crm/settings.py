@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'crm.db_router.DatabaseRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +86,48 @@ DATABASES = {
     }
 }
 
+# journal_mode is stored in the database file rather than the connection, and
+# WAL keeps db.sqlite3-wal/-shm files next to it, so it is opt-in: set
+# CRM_SQLITE_WAL=1 for a database that is not tracked in git.
+CRM_SQLITE_WAL = os.environ.get('CRM_SQLITE_WAL') == '1'
+
+# Pragmas for every SQLite connection, applied in order (crm.sqlite_tuning).
+# None keeps SQLite's default for that pragma. A negative cache_size is in KiB.
+# synchronous=normal is only safe in WAL mode.
+CRM_SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'wal' if CRM_SQLITE_WAL else None,
+    'synchronous': 'normal' if CRM_SQLITE_WAL else None,
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+}
+# How transaction.atomic begins on SQLite; IMMEDIATE takes the write lock at
+# BEGIN, where busy_timeout waits for it. None keeps Django's DEFERRED.
+CRM_SQLITE_TRANSACTION_MODE = 'IMMEDIATE'
+
+# Read replicas as alias -> weight; each alias needs an entry in DATABASES.
+# Reads go to a healthy replica, writes, mutations and atomic blocks to
+# 'default', and clients read from 'default' for CRM_PRIMARY_STICKY_SECONDS
+# after a write. To try it locally, copy db.sqlite3 and point
+# CRM_REPLICA_DB at the copy.
+DATABASE_ROUTERS = ['crm.db_router.ReplicaRouter']
+CRM_DATABASE_REPLICAS = {}
+CRM_REPLICA_HEALTH_INTERVAL = 5
+# Replicas further behind than this are skipped (PostgreSQL only; None disables)
+CRM_REPLICA_MAX_LAG_SECONDS = None
+CRM_PRIMARY_STICKY_SECONDS = 5
+CRM_PRIMARY_STICKY_COOKIE = 'crm_primary'
+
+CRM_REPLICA_DB = os.environ.get('CRM_REPLICA_DB')
+
+if CRM_REPLICA_DB:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': CRM_REPLICA_DB,
+        'TEST': {'MIRROR': 'default'},
+    }
+    CRM_DATABASE_REPLICAS = {'replica': 1}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,6 +174,122 @@ GRAPHENE = {
     'SCHEMA': 'alx_backend_graphql_crm.schema.schema'
 }
 
+# Rows per INSERT statement used by bulk mutations
+CRM_BULK_CREATE_CHUNK_SIZE = 500
+
+# Parsed + validated GraphQL documents kept per process
+CRM_GRAPHQL_DOCUMENT_CACHE_SIZE = 256
+
+# Seconds an automatic persisted query stays registered in the cache
+CRM_APQ_TIMEOUT = 60 * 60 * 24
+
+# Rows fetched per round trip (and per order-products query) by /export/<kind>
+CRM_EXPORT_CHUNK_SIZE = 2000
+
+# Orders per UPDATE when crm.tasks.recalculate_order_totals repairs totals
+CRM_TOTALS_BATCH_SIZE = 1000
+
+# salesSeries range limit, and the DailySales days crm.tasks.rebuild_daily_sales
+# repairs by default and rebuilds per transaction
+CRM_SALES_SERIES_MAX_DAYS = 731
+CRM_SALES_REPAIR_DAYS = 2
+CRM_SALES_REBUILD_CHUNK_DAYS = 31
+
+# Threads (and so database connections) the async GraphQL view uses for
+# resolvers that have no async ORM equivalent
+CRM_ASYNC_THREAD_POOL_SIZE = 8
+
+# Operations are rejected before execution above this many objects (page
+# sizes multiplied through nested lists) or nested object levels
+CRM_QUERY_MAX_COST = 20000
+CRM_QUERY_MAX_DEPTH = 6
+
+# Per-operation and per-field timings, SQL counts and errors of GraphQL
+# requests, served on /metrics. Requests sending the debug header get them in
+# extensions.timing when DEBUG is on or the user is staff. At most
+# CRM_METRICS_MAX_OPERATIONS operation names become labels; later ones are
+# counted as "other".
+CRM_INSTRUMENTATION_ENABLED = True
+CRM_INSTRUMENTATION_DEBUG_HEADER = 'X-CRM-Debug'
+CRM_METRICS_MAX_OPERATIONS = 200
+
+# Operations taking at least CRM_SLOW_OPERATION_MS (None disables the log)
+# are written as JSON lines with their CRM_SLOW_OPERATION_TOP_SQL slowest
+# statements to CRM_SLOW_OPERATION_LOG, rotated every 10 MB. Needs
+# CRM_INSTRUMENTATION_ENABLED, but not DEBUG.
+CRM_SLOW_OPERATION_MS = 500
+CRM_SLOW_OPERATION_TOP_SQL = 5
+CRM_SLOW_OPERATION_LOG = os.environ.get('CRM_SLOW_OPERATION_LOG', '/tmp/crm_slow_operations.log')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_operations': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': CRM_SLOW_OPERATION_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'crm.slow_operations': {
+            'handlers': ['slow_operations'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Query results cached per document, variables and model versions. Every
+# worker has to share the version counters, or the others keep serving
+# results a write made stale, so the cache is only on with CRM_CACHE_URL
+# (e.g. redis://localhost:6379/1); locmem is only coherent per process.
+CRM_CACHE_URL = os.environ.get('CRM_CACHE_URL')
+
+CRM_RESULT_CACHE_ENABLED = bool(CRM_CACHE_URL)
+CRM_RESULT_CACHE_ALIAS = 'default'
+CRM_RESULT_CACHE_TIMEOUT = 300
+
+if CRM_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CRM_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'crm',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+
+# Idempotency keys for createOrder, bulkCreateCustomers and bulkCreateOrders
+# (crm.idempotency): first responses are kept in this cache for
+# CRM_IDEMPOTENCY_TTL seconds, and duplicates arriving meanwhile wait up to
+# CRM_IDEMPOTENCY_WAIT seconds for them
+CRM_IDEMPOTENCY_CACHE_ALIAS = 'default'
+CRM_IDEMPOTENCY_TTL = 24 * 60 * 60
+CRM_IDEMPOTENCY_WAIT = 10
+CRM_IDEMPOTENCY_LOCK_TIMEOUT = 30
+# Keys on a process-local cache (locmem) only deduplicate within one process,
+# so they are refused unless this is set; fine for a single runserver
+CRM_IDEMPOTENCY_ALLOW_LOCAL_CACHE = DEBUG
+
+# How cron jobs and Celery tasks run their GraphQL documents: 'inprocess'
+# executes them against the schema directly, 'http' posts to CRM_GRAPHQL_URL
+CRM_JOB_GRAPHQL_MODE = 'inprocess'
+CRM_GRAPHQL_URL = 'http://localhost:8000/graphql'
+
 
 # Cron job configurations
 CRONJOBS = [
@@ -160,4 +320,12 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm.tasks.generate_crm_report',
         'schedule': crontab(day_of_week=0, hour=6, minute=0),  # Monday at 6:00 AM
     },
+    'repair-daily-sales': {
+        'task': 'crm.tasks.rebuild_daily_sales',
+        'schedule': crontab(hour=1, minute=0),  # Daily at 1:00 AM
+    },
+    'repair-order-totals': {
+        'task': 'crm.tasks.recalculate_order_totals',
+        'schedule': crontab(hour=1, minute=30),  # Daily at 1:30 AM
+    },
 }
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+Bump the result cache version of a model whenever one of its rows changes,
+rebuild the DailySales rollups of the days whose orders changed, and
+recalculate total_amount of orders whose lines changed once the transaction
+commits.
+
+bulk_create(), queryset.update() and raw SQL send no signals; code paths that
+write that way call crm.result_cache.invalidate(), crm.rollups and
+Order.objects.recalculate_totals() themselves. The nightly
+recalculate_order_totals task repairs totals any of them missed.
+"""
+from functools import partial
+from threading import local
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Customer, Order, OrderLine, Product
+from .result_cache import invalidate
+from .rollups import rebuild_on_commit
+
+# Orders waiting for their total_amount to be recalculated, per database
+_pending_totals = local()
+
+
+def recalculate_on_commit(order_ids, using):
+    """Recalculate total_amount of these orders after commit, once each"""
+    _pending_totals.__dict__.setdefault(using, set()).update(order_ids)
+    # Every call schedules a flush; the first one to run takes all the orders
+    transaction.on_commit(partial(_recalculate_totals, using), using=using)
+
+
+def _recalculate_totals(using):
+    order_ids = _pending_totals.__dict__.pop(using, set())
+    if order_ids:
+        Order.objects.using(using).filter(pk__in=order_ids).recalculate_totals()
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def invalidate_model(sender, using, **kwargs):
+    invalidate(sender, using=using)
+
+
+@receiver(post_save, sender=OrderLine)
+@receiver(post_delete, sender=OrderLine)
+def invalidate_order_line(sender, instance, using, raw=False, **kwargs):
+    invalidate(OrderLine, Order, Product, using=using)
+    if not raw:
+        rebuild_on_commit(order_ids=[instance.order_id], using=using)
+        recalculate_on_commit([instance.order_id], using=using)
+
+
+@receiver(m2m_changed, sender=OrderLine)
+def invalidate_order_products(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # Only the product knows which orders lose it
+        order_ids = list(instance.order_lines.values_list('order_id', flat=True))
+        rebuild_on_commit(order_ids=order_ids, using=using)
+        recalculate_on_commit(order_ids, using=using)
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate(OrderLine, Order, Product, using=using)
+        order_ids = (pk_set or ()) if reverse else [instance.pk]
+        rebuild_on_commit(order_ids=order_ids, using=using)
+        recalculate_on_commit(order_ids, using=using)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_day(sender, instance, raw, using, **kwargs):
+    # A changed order_date moves the order's sales to another day
+    if instance.pk is not None and not raw:
+        instance._previous_order_date = (
+            Order.objects.using(using).filter(pk=instance.pk)
+            .values_list('order_date', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def rebuild_order_days(sender, instance, created, raw, using, **kwargs):
+    if created or raw:
+        return
+    dates = [instance.order_date, getattr(instance, '_previous_order_date', None)]
+    rebuild_on_commit(
+        days={timezone.localdate(date) for date in dates if date is not None}, using=using
+    )
+
+
+@receiver(post_delete, sender=Order)
+def rebuild_deleted_order_day(sender, instance, using, **kwargs):
+    rebuild_on_commit(days=[timezone.localdate(instance.order_date)], using=using)
@@ -0,0 +1,94 @@
+"""
+JSON log of GraphQL operations slower than CRM_SLOW_OPERATION_MS.
+
+Each record names the operation, the sha256 of its document and a
+fingerprint of its variables (never the values), with the total, SQL and
+per-field timings from crm.instrumentation and the slowest SQL statements
+together with the resolver path that issued each. Statements are logged
+without their parameters, and IN lists shortened.
+
+Records go to the 'crm.slow_operations' logger, one JSON object per line;
+settings.LOGGING writes them to a size-rotated file. The analyze_slow_ops
+command reads them back.
+"""
+import json
+import logging
+import re
+from hashlib import sha256
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger('crm.slow_operations')
+
+WHITESPACE = re.compile(r'\s+')
+# IN lists of any length log as one statement, so analyze_slow_ops groups them
+PLACEHOLDER_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+
+def variables_fingerprint(variables):
+    """Short stable hash of the variables; equal values give equal fingerprints"""
+    if not variables:
+        return None
+    encoded = json.dumps(variables, sort_keys=True, separators=(',', ':'), default=str)
+    return sha256(encoded.encode('utf-8')).hexdigest()[:16]
+
+
+def threshold_seconds():
+    threshold = getattr(settings, 'CRM_SLOW_OPERATION_MS', None)
+    return None if threshold is None else threshold / 1000
+
+
+def build_record(trace):
+    top = getattr(settings, 'CRM_SLOW_OPERATION_TOP_SQL', 5)
+    fields = sorted(trace.fields.values(), key=lambda stats: -stats.seconds)[:top]
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'operation': trace.name,
+        'type': trace.kind,
+        'document': trace.document_hash,
+        'variables': variables_fingerprint(trace.variables),
+        'duration_ms': round(trace.seconds * 1000, 3),
+        'sql_queries': trace.queries,
+        'sql_ms': round(trace.sql_seconds * 1000, 3),
+        'errors': trace.errors,
+        'slowest_sql': [
+            {
+                'duration_ms': round(seconds * 1000, 3),
+                'sql': PLACEHOLDER_LIST.sub('(%s, ...)', WHITESPACE.sub(' ', sql or '').strip()),
+                'path': path,
+            }
+            for seconds, _, sql, path in sorted(trace.slowest_sql, reverse=True)
+        ],
+        'slowest_fields': [
+            {
+                'path': stats.path,
+                'calls': stats.calls,
+                'duration_ms': round(stats.seconds * 1000, 3),
+                'sql_queries': stats.queries,
+            }
+            for stats in fields
+        ],
+    }
+
+
+def log_if_slow(trace):
+    """Log a finished trace that took at least the threshold; returns the record"""
+    threshold = threshold_seconds()
+    if threshold is None or trace.seconds < threshold:
+        return None
+    record = build_record(trace)
+    logger.warning(json.dumps(record, separators=(',', ':')))
+    return record
+
+
+def read_records(paths):
+    """Records from JSON-lines log files, skipping lines that are not records"""
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and 'duration_ms' in record:
+                    yield record
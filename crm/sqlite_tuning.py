@@ -0,0 +1,50 @@
+"""
+Pragmas for SQLite under concurrent writers, applied by a connection_created
+receiver to every new SQLite connection.
+
+CRM_SQLITE_PRAGMAS maps pragma names to values and is applied in order, so
+busy_timeout comes first and later pragmas wait for locks too. A value of
+None keeps SQLite's default. journal_mode=wal lets readers run alongside the
+single writer and synchronous=normal only syncs at checkpoints, which is safe
+in WAL mode. Unlike the others, journal_mode is written into the database
+file, so settings only ask for WAL when CRM_SQLITE_WAL is set.
+
+CRM_SQLITE_TRANSACTION_MODE sets how transaction.atomic begins on SQLite.
+With IMMEDIATE the write lock is taken at BEGIN, where busy_timeout applies.
+A deferred transaction that reads and then writes fails at once with
+"database is locked" when another connection is writing, without waiting.
+An explicit OPTIONS['transaction_mode'] in DATABASES takes precedence.
+
+Other database vendors are left alone.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+def pragmas():
+    return getattr(settings, 'CRM_SQLITE_PRAGMAS', None) or {}
+
+
+def pragma_statements():
+    return [
+        f"PRAGMA {name} = {value}"
+        for name, value in pragmas().items() if value is not None
+    ]
+
+
+def configure(sender=None, connection=None, **kwargs):
+    """connection_created receiver: apply the pragmas and transaction mode"""
+    if connection.vendor != 'sqlite':
+        return
+    # On the raw connection, so the pragmas are not counted as queries
+    for statement in pragma_statements():
+        connection.connection.execute(statement).fetchall()
+
+    mode = getattr(settings, 'CRM_SQLITE_TRANSACTION_MODE', None)
+    if mode and connection.settings_dict['OPTIONS'].get('transaction_mode') is None:
+        if mode.upper() not in connection.transaction_modes:
+            raise ImproperlyConfigured(
+                f"CRM_SQLITE_TRANSACTION_MODE must be one of "
+                f"{', '.join(sorted(connection.transaction_modes))}, not {mode!r}"
+            )
+        connection.transaction_mode = mode.upper()
@@ -1,52 +1,44 @@
-import os
-import requests
 from celery import shared_task
-from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from datetime import date, datetime, timedelta
+from django.conf import settings
+from django.utils import timezone
+from crm import graphql_executor, rollups
+from crm.models import Order
 
-GRAPHQL_URL = "http://localhost:8000/graphql"
 REPORT_LOG = "/tmp/crm_report_log.txt"
 
+# Counts and revenue are aggregated server-side, so the response
+# size does not grow with the number of customers or orders
+REPORT_QUERY = """
+    query {
+        crmStats {
+            totalCustomers
+            totalOrders
+            totalRevenue
+        }
+    }
+"""
+
 
 @shared_task
 def generate_crm_report():
     """
     Celery task to generate a weekly CRM report.
-    Fetches total customers, orders, and revenue via GraphQL.
+    Fetches total customers, orders, and revenue via the crmStats aggregate.
     Logs report to /tmp/crm_report_log.txt with timestamp.
     """
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
     try:
-        # Query GraphQL endpoint for CRM stats
-        transport = RequestsHTTPTransport(url=GRAPHQL_URL)
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        
-        query = gql("""
-            query {
-                customersList {
-                    id
-                }
-                ordersList {
-                    id
-                    totalAmount
-                }
-            }
-        """)
-        
-        result = client.execute(query)
+        # Run the stats query in-process (or over HTTP, see CRM_JOB_GRAPHQL_MODE)
+        result = graphql_executor.execute(REPORT_QUERY)
         
         # Extract data
-        customers = result.get('customersList', [])
-        orders = result.get('ordersList', [])
+        stats = result.get('crmStats') or {}
         
-        total_customers = len(customers)
-        total_orders = len(orders)
-        total_revenue = sum(
-            float(order.get('totalAmount', 0)) 
-            for order in orders
-        )
+        total_customers = stats.get('totalCustomers', 0)
+        total_orders = stats.get('totalOrders', 0)
+        total_revenue = float(stats.get('totalRevenue') or 0)
         
         # Format and log report
         report_msg = f"{timestamp} - Report: {total_customers} customers, {total_orders} orders, {total_revenue} revenue.\n"
@@ -70,4 +62,43 @@ def generate_crm_report():
         return {
             'status': 'error',
             'message': str(e)
-        }
\ No newline at end of file
+        }
+
+
+@shared_task
+def recalculate_order_totals(order_ids=None, batch_size=None):
+    """
+    Bring total_amount back in line with the order lines.
+
+    Only orders whose stored total differs from the Sum over their lines are
+    touched, one UPDATE per batch of CRM_TOTALS_BATCH_SIZE orders.
+    """
+    batch_size = batch_size or getattr(settings, 'CRM_TOTALS_BATCH_SIZE', 1000)
+    orders = Order.objects.all() if order_ids is None else Order.objects.filter(pk__in=order_ids)
+    stale = list(orders.order_by('pk').stale_totals().values_list('pk', flat=True))
+    for start in range(0, len(stale), batch_size):
+        Order.objects.filter(pk__in=stale[start:start + batch_size]).recalculate_totals()
+    return {
+        'status': 'success',
+        'updated': len(stale)
+    }
+
+
+@shared_task
+def rebuild_daily_sales(date_from=None, date_to=None):
+    """
+    Repair or backfill the DailySales rollups for date_from..date_to (ISO
+    dates, inclusive). Without dates the last CRM_SALES_REPAIR_DAYS days are
+    rebuilt; each CRM_SALES_REBUILD_CHUNK_DAYS days commit separately.
+    """
+    last = date.fromisoformat(date_to) if date_to else timezone.localdate()
+    if date_from:
+        first = date.fromisoformat(date_from)
+    else:
+        first = last - timedelta(days=getattr(settings, 'CRM_SALES_REPAIR_DAYS', 2) - 1)
+    rows = rollups.rebuild_range(first, last)
+    return {
+        'status': 'success',
+        'days': (last - first).days + 1 if first <= last else 0,
+        'rows': rows
+    }
@@ -1,3 +1,1833 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from importlib.util import find_spec
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.core.cache import cache
+from asgiref.sync import sync_to_async
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphene_django.settings import graphene_settings
+from graphql import ExecutionResult, get_operation_ast, parse
+from graphql_relay import from_global_id
+from crm import (
+    benchmarks, db_router, graphql_executor, idempotency, instrumentation, rollups, seeding,
+    sqlite_tuning,
+)
+from crm.async_schema import async_schema
+from crm.cron import update_low_stock
+from crm.cost import operation_cost
+from crm.loaders import CRMLoaders, RelationLoader
+from crm.models import Customer, Product, Order, OrderLine, DailySales
+from crm.optimizer import optimize_queryset
+from crm.schema import schema
+from crm.tasks import generate_crm_report, rebuild_daily_sales, recalculate_order_totals
+from crm.result_cache import result_stats
+from crm.views import (
+    AsyncCRMGraphQLView,
+    CRMGraphQLView,
+    document_cache,
+    metrics_view,
+    query_hash,
+)
 
-# Create your tests here.
+
+def execute(query, variables=None):
+    """Run a document in-process with a fresh request-like context"""
+    return schema.execute(query, variables=variables, context_value=SimpleNamespace())
+
+
+def seed_orders(customer_count, product_count, order_count, prefix="c"):
+    customers = [
+        Customer.objects.create(name=f"Customer {prefix}{i}", email=f"{prefix}{i}@example.com")
+        for i in range(customer_count)
+    ]
+    products = [
+        Product.objects.create(name=f"Product {i}", price=Decimal('10.00') + i, stock=i)
+        for i in range(product_count)
+    ]
+    for i in range(order_count):
+        order = Order.objects.create(customer=customers[i % customer_count])
+        OrderLine.objects.bulk_create(
+            OrderLine(order=order, product=product, unit_price=product.price)
+            for product in products[i % product_count:i % product_count + 3]
+        )
+    return customers, products
+
+
+class RelationBatchingTests(TestCase):
+    """Relations resolve in one query per nesting level, independent of page size"""
+
+    ALL_ORDERS = """
+        query {
+            allOrders(first: 100) {
+                edges { node {
+                    id
+                    customer { name }
+                    products { edges { node { name } } }
+                } }
+            }
+        }
+    """
+
+    def test_all_orders_query_count_is_constant(self):
+        seed_orders(customer_count=5, product_count=8, order_count=10)
+        # COUNT, page joined to customers, products
+        with self.assertNumQueries(3):
+            result = execute(self.ALL_ORDERS)
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(result.data['allOrders']['edges']), 10)
+
+        seed_orders(customer_count=5, product_count=8, order_count=40, prefix="d")
+        with self.assertNumQueries(3):
+            result = execute(self.ALL_ORDERS)
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(result.data['allOrders']['edges']), 50)
+
+    def test_nested_lists_batch_per_level(self):
+        customers, _ = seed_orders(customer_count=4, product_count=6, order_count=20)
+        query = """
+            query {
+                customersList {
+                    name
+                    orders { edges { node {
+                        totalAmount
+                        products { edges { node { name } } }
+                    } } }
+                }
+            }
+        """
+        # customers, orders by customer, products by order
+        with self.assertNumQueries(3):
+            result = execute(query)
+        self.assertIsNone(result.errors)
+        by_name = {c['name']: c for c in result.data['customersList']}
+        self.assertEqual(len(by_name[customers[0].name]['orders']['edges']), 5)
+
+    def test_batched_relations_match_orm(self):
+        seed_orders(customer_count=3, product_count=5, order_count=6)
+        result = execute("""
+            query {
+                ordersList {
+                    id
+                    customer { email }
+                    products { edges { node { name } } }
+                }
+            }
+        """)
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(result.data['ordersList']), Order.objects.count())
+        for order, row in zip(Order.objects.all(), result.data['ordersList']):
+            self.assertEqual(row['customer']['email'], order.customer.email)
+            self.assertEqual(
+                [edge['node']['name'] for edge in row['products']['edges']],
+                [product.name for product in order.products.all()],
+            )
+
+    def test_filtered_relation_falls_back_to_queryset(self):
+        seed_orders(customer_count=2, product_count=5, order_count=2)
+        result = execute("""
+            query {
+                ordersList {
+                    products(name: "Product 1") { edges { node { name } } }
+                }
+            }
+        """)
+        self.assertIsNone(result.errors)
+        names = {
+            edge['node']['name']
+            for row in result.data['ordersList']
+            for edge in row['products']['edges']
+        }
+        self.assertEqual(names, {'Product 1'})
+
+    def test_threads_sharing_a_loader_fetch_each_key_once(self):
+        fetched = []
+
+        def fetch(keys):
+            fetched.extend(keys)
+            time.sleep(0.01)
+            return {key: key * 10 for key in keys}
+
+        loader = RelationLoader(fetch)
+        barrier = threading.Barrier(8, timeout=5)
+
+        def resolve(key):
+            # Every key is queued before any thread loads
+            loader.queue([key])
+            barrier.wait()
+            return loader.load(key)
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(resolve, range(8)))
+        self.assertEqual(results, [key * 10 for key in range(8)])
+        self.assertEqual(sorted(fetched), list(range(8)))
+
+    def test_keys_without_rows_get_their_own_empty_list(self):
+        loader = RelationLoader(lambda keys: {}, default_factory=list)
+        loader.queue([1, 2])
+        loader.load(1).append('mutated')
+        self.assertEqual(loader.load(2), [])
+        self.assertIsNone(RelationLoader(lambda keys: {}).load(3))
+
+    def test_views_create_the_loaders_before_execution(self):
+        request = RequestFactory().post('/graphql')
+        context = CRMGraphQLView(schema=schema).get_context(request)
+        self.assertIsInstance(context.crm_loaders, CRMLoaders)
+
+
+class QueryOptimizerTests(TestCase):
+    """Root querysets are shaped by the requested selection set"""
+
+    def test_forward_relation_is_joined_and_columns_projected(self):
+        seed_orders(customer_count=2, product_count=3, order_count=5)
+        query = """
+            fragment buyer on CustomerType { email }
+            query { ordersList { id customer { ...buyer } } }
+        """
+        with CaptureQueriesContext(connection) as captured:
+            result = execute(query)
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(captured), 1)
+        sql = captured[0]['sql']
+        self.assertIn('JOIN "crm_customer"', sql)
+        self.assertIn('"crm_customer"."email"', sql)
+        self.assertNotIn('total_amount', sql)
+        self.assertNotIn('"crm_customer"."phone"', sql)
+
+    def test_nested_connection_filters_become_prefetch(self):
+        seed_orders(customer_count=2, product_count=5, order_count=4)
+        query = """
+            query($name: String) {
+                allOrders {
+                    edges { node {
+                        products(name: $name) { edges { node { name } } }
+                    } }
+                }
+            }
+        """
+        # COUNT, page, filtered products
+        with self.assertNumQueries(3):
+            result = execute(query, variables={'name': 'Product 2'})
+        self.assertIsNone(result.errors)
+        for edge in result.data['allOrders']['edges']:
+            names = [p['node']['name'] for p in edge['node']['products']['edges']]
+            self.assertTrue(all(name == 'Product 2' for name in names))
+
+    def test_single_object_fields_are_optimized(self):
+        customers, _ = seed_orders(customer_count=1, product_count=3, order_count=3)
+        query = """
+            query($id: ID!) {
+                customer(id: $id) {
+                    name
+                    orders { edges { node { products { edges { node { price } } } } } }
+                }
+            }
+        """
+        with self.assertNumQueries(3):
+            result = execute(query, variables={'id': customers[0].pk})
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(result.data['customer']['orders']['edges']), 3)
+
+
+class CRMStatsTests(TestCase):
+    """crmStats is answered by a single aggregate query"""
+
+    QUERY = """
+        query($from: DateTime, $to: DateTime) {
+            crmStats(dateFrom: $from, dateTo: $to) {
+                totalCustomers newCustomers totalOrders totalRevenue
+                averageOrderValue distinctPurchasers
+            }
+        }
+    """
+
+    def test_stats_match_python_totals(self):
+        seed_orders(customer_count=4, product_count=5, order_count=6)
+        Customer.objects.create(name="No orders", email="idle@example.com")
+        for order in Order.objects.all():
+            order.calculate_total()
+
+        with self.assertNumQueries(1):
+            result = execute(self.QUERY)
+        self.assertIsNone(result.errors)
+        stats = result.data['crmStats']
+        orders = list(Order.objects.all())
+        revenue = sum(order.total_amount for order in orders)
+        self.assertEqual(stats['totalCustomers'], 5)
+        self.assertEqual(stats['newCustomers'], 5)
+        self.assertEqual(stats['totalOrders'], 6)
+        self.assertEqual(Decimal(stats['totalRevenue']), revenue)
+        self.assertEqual(
+            Decimal(stats['averageOrderValue']),
+            (revenue / len(orders)).quantize(Decimal('0.01')),
+        )
+        self.assertEqual(stats['distinctPurchasers'], 4)
+
+    def test_date_range_limits_orders(self):
+        seed_orders(customer_count=2, product_count=3, order_count=3)
+        result = execute(self.QUERY, variables={'from': '2000-01-01T00:00:00+00:00',
+                                                'to': '2000-12-31T00:00:00+00:00'})
+        self.assertIsNone(result.errors)
+        stats = result.data['crmStats']
+        self.assertEqual(stats['totalCustomers'], 2)
+        self.assertEqual(stats['newCustomers'], 0)
+        self.assertEqual(stats['totalOrders'], 0)
+        self.assertEqual(Decimal(stats['totalRevenue']), Decimal('0'))
+        self.assertEqual(stats['distinctPurchasers'], 0)
+
+
+class BulkCreateCustomersTests(TestCase):
+    """bulkCreateCustomers validates in memory and inserts with bulk_create"""
+
+    MUTATION = """
+        mutation($input: [CustomerInput]!) {
+            bulkCreateCustomers(input: $input) {
+                customers { id email }
+                errors
+                successCount
+            }
+        }
+    """
+
+    def test_reports_per_row_errors_in_order(self):
+        Customer.objects.create(name="Existing", email="taken@example.com")
+        rows = [
+            {'name': "Ann", 'email': "ann@example.com", 'phone': "+1234567890"},
+            {'name': "Taken", 'email': "taken@example.com"},
+            {'name': "Bad phone", 'email': "bad@example.com", 'phone': "nope"},
+            {'name': "Ann again", 'email': "ann@example.com"},
+            {'name': "Ben", 'email': "ben@example.com"},
+        ]
+        result = execute(self.MUTATION, variables={'input': rows})
+        self.assertIsNone(result.errors)
+        payload = result.data['bulkCreateCustomers']
+        self.assertEqual(payload['successCount'], 2)
+        self.assertEqual(
+            [c['email'] for c in payload['customers']],
+            ["ann@example.com", "ben@example.com"],
+        )
+        self.assertEqual(len(payload['errors']), 3)
+        self.assertEqual(payload['errors'][0], "Row 2: Email 'taken@example.com' already exists")
+        self.assertTrue(payload['errors'][1].startswith("Row 3: "))
+        self.assertEqual(payload['errors'][2], "Row 4: Email 'ann@example.com' already exists")
+        self.assertTrue(all(c['id'] for c in payload['customers']))
+
+    def test_null_rows_fail_alone(self):
+        rows = [
+            {'name': "Ann", 'email': "ann@example.com"},
+            None,
+            {'name': "Ben", 'email': "ben@example.com"},
+        ]
+        result = execute(self.MUTATION, variables={'input': rows})
+        self.assertIsNone(result.errors)
+        payload = result.data['bulkCreateCustomers']
+        self.assertEqual(payload['successCount'], 2)
+        self.assertEqual(payload['errors'], ["Row 2: Error - Row is null"])
+        self.assertEqual(Customer.objects.count(), 2)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        rows = [{'name': f"C{i}", 'email': f"bulk{i}@example.com"} for i in range(50)]
+        with self.settings(CRM_BULK_CREATE_CHUNK_SIZE=20):
+            # email check, savepoint, three INSERTs, release
+            with self.assertNumQueries(6):
+                result = execute(self.MUTATION, variables={'input': rows})
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data['bulkCreateCustomers']['successCount'], 50)
+        self.assertEqual(Customer.objects.count(), 50)
+
+
+class CreateOrderTests(TestCase):
+    """createOrder resolves products in one query and inserts once"""
+
+    MUTATION = """
+        mutation($input: OrderInput!) {
+            createOrder(input: $input) {
+                success message
+                order { totalAmount }
+            }
+        }
+    """
+
+    def test_query_count_is_independent_of_line_items(self):
+        customers, products = seed_orders(customer_count=1, product_count=30, order_count=0)
+        variables = {'input': {
+            'customerId': customers[0].pk,
+            'productIds': [p.pk for p in products],
+        }}
+        # customer, products, savepoint, order INSERT, lines INSERT,
+        # DailySales upsert, release
+        with self.assertNumQueries(7):
+            result = execute(self.MUTATION, variables=variables)
+        self.assertIsNone(result.errors)
+        payload = result.data['createOrder']
+        self.assertTrue(payload['success'])
+        self.assertEqual(Decimal(payload['order']['totalAmount']), sum(p.price for p in products))
+        order = Order.objects.get()
+        self.assertEqual(order.products.count(), 30)
+
+    def test_reports_every_missing_product(self):
+        customers, products = seed_orders(customer_count=1, product_count=2, order_count=0)
+        variables = {'input': {
+            'customerId': customers[0].pk,
+            'productIds': [products[0].pk, 9998, 9999],
+        }}
+        result = execute(self.MUTATION, variables=variables)
+        payload = result.data['createOrder']
+        self.assertFalse(payload['success'])
+        self.assertEqual(payload['message'], "Products with IDs 9998, 9999 do not exist")
+        self.assertFalse(Order.objects.exists())
+
+    def test_lines_carry_quantities_and_price_snapshots(self):
+        customers, products = seed_orders(customer_count=1, product_count=2, order_count=0)
+        variables = {'input': {
+            'customerId': customers[0].pk,
+            'lines': [{'productId': products[0].pk, 'quantity': 3}],
+            'productIds': [products[1].pk, products[0].pk],
+        }}
+        result = execute(self.MUTATION, variables=variables)
+        self.assertTrue(result.data['createOrder']['success'])
+        order = Order.objects.get()
+        Product.objects.filter(pk=products[0].pk).update(price=Decimal('99.00'))
+        self.assertEqual(
+            sorted(order.lines.values_list('product_id', 'quantity', 'unit_price')),
+            [(products[0].pk, 4, products[0].price), (products[1].pk, 1, products[1].price)],
+        )
+        self.assertEqual(order.total_amount, 4 * products[0].price + products[1].price)
+        self.assertEqual(order.calculate_total(), order.total_amount)
+
+
+class OrderLineTests(TestCase):
+    """Order totals are one Sum(quantity * unit_price) over the lines"""
+
+    def setUp(self):
+        seed_orders(customer_count=2, product_count=4, order_count=6)
+        OrderLine.objects.filter(pk=OrderLine.objects.earliest('pk').pk).update(quantity=5)
+
+    def expected_totals(self):
+        return {
+            order.pk: sum((line.quantity * line.unit_price for line in order.lines.all()), Decimal('0.00'))
+            for order in Order.objects.prefetch_related('lines')
+        }
+
+    def test_recalculate_totals_is_one_update(self):
+        with self.assertNumQueries(1):
+            updated = Order.objects.all().recalculate_totals()
+        self.assertEqual(updated, 6)
+        self.assertEqual(dict(Order.objects.values_list('pk', 'total_amount')), self.expected_totals())
+        self.assertFalse(Order.objects.stale_totals().exists())
+
+    def test_task_updates_only_stale_orders(self):
+        Order.objects.all().recalculate_totals()
+        order = Order.objects.earliest('pk')
+        order.lines.update(quantity=2)
+        # stale ids, then one UPDATE per batch
+        with self.assertNumQueries(2):
+            result = recalculate_order_totals(batch_size=1)
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual(dict(Order.objects.values_list('pk', 'total_amount')), self.expected_totals())
+
+    def test_lines_resolve_in_one_query_per_level(self):
+        query = """
+            query {
+                ordersList { lines { quantity unitPrice product { name } } }
+            }
+        """
+        with self.assertNumQueries(2):
+            result = execute(query)
+        self.assertIsNone(result.errors)
+        quantities = sorted(
+            line['quantity'] for order in result.data['ordersList'] for line in order['lines']
+        )
+        self.assertEqual(quantities, sorted(OrderLine.objects.values_list('quantity', flat=True)))
+        self.assertIn(5, quantities)
+
+    def test_line_writes_recalculate_totals_on_commit(self):
+        Order.objects.all().recalculate_totals()
+        order = Order.objects.earliest('pk')
+        line = order.lines.earliest('pk')
+        with self.captureOnCommitCallbacks(execute=True):
+            line.quantity += 3
+            line.save()
+            OrderLine.objects.create(
+                order=order, product=Product.objects.exclude(orders=order).first(),
+                quantity=2, unit_price=Decimal('1.50'),
+            )
+        self.assertFalse(Order.objects.stale_totals().exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.lines.earliest('pk').delete()
+        self.assertFalse(Order.objects.stale_totals().exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.products.clear()
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('0.00'))
+
+
+class SalesRollupTests(TestCase):
+    """DailySales follows order writes and salesSeries reads only the rollups"""
+
+    MUTATION = """
+        mutation($input: OrderInput!) { createOrder(input: $input) { success } }
+    """
+
+    SERIES = """
+        query($g: SalesGranularity, $from: Date!, $to: Date!, $product: ID, $customer: ID) {
+            salesSeries(granularity: $g, from: $from, to: $to,
+                        productId: $product, customerId: $customer) {
+                period orderCount quantity revenue
+            }
+        }
+    """
+
+    def setUp(self):
+        self.customers, self.products = seed_orders(customer_count=2, product_count=3, order_count=0)
+        for i in range(4):
+            execute(self.MUTATION, variables={'input': {
+                'customerId': self.customers[i % 2].pk,
+                'lines': [{'productId': self.products[i % 3].pk, 'quantity': i + 1}],
+                'productIds': [self.products[2].pk] if i % 3 != 2 else [],
+            }})
+        self.today = timezone.localdate()
+
+    def snapshot(self):
+        return sorted(DailySales.objects.values_list(
+            'day', 'product_key', 'customer_key', 'order_count', 'quantity', 'revenue'
+        ))
+
+    def series(self, **variables):
+        variables.setdefault('from', str(self.today - timedelta(days=30)))
+        variables.setdefault('to', str(self.today))
+        result = execute(self.SERIES, variables=variables)
+        self.assertIsNone(result.errors)
+        return result.data['salesSeries']
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        incremental = self.snapshot()
+        self.assertTrue(incremental)
+        rebuild_daily_sales()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_migration_backfills_existing_orders(self):
+        Order.objects.filter(pk=Order.objects.earliest('pk').pk).update(
+            order_date=timezone.now() - timedelta(days=400)
+        )
+        rebuild_daily_sales(date_from=str(self.today - timedelta(days=400)))
+        expected = self.snapshot()
+        DailySales.objects.all().delete()
+        migration = import_module('crm.migrations.0007_backfill_daily_sales')
+        schema_editor = SimpleNamespace(
+            connection=connection,
+            execute=lambda sql, params=(): connection.cursor().execute(sql, params),
+        )
+        migration.backfill_daily_sales(django_apps, schema_editor)
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_series_reads_one_row_per_day(self):
+        with self.assertNumQueries(1):
+            points = self.series()
+        self.assertEqual(len(points), 1)
+        lines = OrderLine.objects.all()
+        self.assertEqual(points[0]['orderCount'], 4)
+        self.assertEqual(points[0]['quantity'], sum(line.quantity for line in lines))
+        self.assertEqual(
+            Decimal(points[0]['revenue']), sum(line.quantity * line.unit_price for line in lines)
+        )
+
+        product = self.products[2]
+        [point] = self.series(product=product.pk, customer=self.customers[0].pk, g='MONTH')
+        self.assertEqual(point['period'], str(self.today.replace(day=1)))
+        expected = OrderLine.objects.filter(product=product, order__customer=self.customers[0])
+        self.assertEqual(point['orderCount'], expected.count())
+        self.assertEqual(point['quantity'], sum(line.quantity for line in expected))
+
+    def test_changes_rebuild_the_affected_days(self):
+        order = Order.objects.earliest('pk')
+        yesterday = timezone.now() - timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            order.order_date = yesterday
+            order.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.exclude(pk=order.pk).earliest('pk').lines.first().delete()
+        incremental = self.snapshot()
+        self.assertEqual({row[0] for row in incremental}, {self.today, timezone.localdate(yesterday)})
+        rebuild_daily_sales()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_backfill_rebuilds_a_date_range(self):
+        DailySales.objects.all().delete()
+        result = rebuild_daily_sales(
+            date_from=str(self.today - timedelta(days=40)), date_to=str(self.today)
+        )
+        self.assertEqual(result['days'], 41)
+        self.assertEqual(len(self.series()), 1)
+
+    def test_series_range_is_bounded(self):
+        result = execute(self.SERIES, variables={'from': '2000-01-01', 'to': '2026-01-01'})
+        self.assertIn('at most', result.errors[0].message)
+
+class UpdateLowStockProductsTests(TestCase):
+    """Restocking is a set-based UPDATE, optionally in bounded batches"""
+
+    MUTATION = """
+        mutation($threshold: Int, $increment: Int, $batchSize: Int) {
+            updateLowStockProducts(threshold: $threshold, increment: $increment,
+                                   batchSize: $batchSize) {
+                success message
+                updatedProducts { name stock }
+            }
+        }
+    """
+
+    def setUp(self):
+        for i, stock in enumerate([0, 3, 9, 10, 25, 5, 1]):
+            Product.objects.create(name=f"P{i}", price=Decimal('1.00'), stock=stock)
+
+    def assert_restocked(self, payload, increment=10):
+        self.assertTrue(payload['success'], payload['message'])
+        self.assertEqual(
+            payload['updatedProducts'],
+            [{'name': n, 'stock': s + increment} for n, s in
+             [('P0', 0), ('P1', 3), ('P2', 9), ('P5', 5), ('P6', 1)]],
+        )
+        self.assertEqual(
+            dict(Product.objects.values_list('name', 'stock')),
+            {'P0': 0 + increment, 'P1': 3 + increment, 'P2': 9 + increment,
+             'P3': 10, 'P4': 25, 'P5': 5 + increment, 'P6': 1 + increment},
+        )
+
+    def test_single_update_statement(self):
+        # savepoint, UPDATE ... RETURNING, release
+        with self.assertNumQueries(3):
+            result = execute(self.MUTATION)
+        self.assertIsNone(result.errors)
+        self.assert_restocked(result.data['updateLowStockProducts'])
+
+    def test_batches_do_not_restock_twice(self):
+        # A small increment keeps rows below the threshold between batches
+        result = execute(self.MUTATION, variables={'increment': 1, 'batchSize': 2})
+        self.assertIsNone(result.errors)
+        self.assert_restocked(result.data['updateLowStockProducts'], increment=1)
+
+    def test_fallback_without_returning(self):
+        with mock.patch('crm.models.supports_update_returning', return_value=False):
+            result = execute(self.MUTATION, variables={'batchSize': 3})
+        self.assertIsNone(result.errors)
+        self.assert_restocked(result.data['updateLowStockProducts'])
+
+    def test_rejects_non_positive_increment(self):
+        result = execute(self.MUTATION, variables={'increment': 0})
+        self.assertFalse(result.data['updateLowStockProducts']['success'])
+
+
+class KeysetPaginationTests(TestCase):
+    """Keyset connections page by sort key and keep the filters working"""
+
+    QUERY = """
+        query($first: Int, $after: String, $last: Int, $before: String, $min: Decimal) {
+            allOrdersKeyset(first: $first, after: $after, last: $last, before: $before,
+                            totalAmountGte: $min) {
+                pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+                edges { node { id totalAmount } }
+            }
+        }
+    """
+
+    def setUp(self):
+        seed_orders(customer_count=3, product_count=4, order_count=25)
+        for order in Order.objects.all():
+            order.calculate_total()
+        # Ties on order_date must be broken by the primary key
+        tied = Order.objects.order_by('pk').values_list('pk', flat=True)[:10]
+        Order.objects.filter(pk__in=list(tied)).update(
+            order_date=Order.objects.earliest('order_date').order_date
+        )
+        self.expected = [
+            order.pk for order in Order.objects.order_by('-order_date', '-pk')
+        ]
+
+    def page_ids(self, data):
+        return [int(from_global_id(e['node']['id'])[1]) for e in data['edges']]
+
+    def test_forward_pages_cover_every_row_without_count(self):
+        seen, after = [], None
+        while True:
+            with CaptureQueriesContext(connection) as captured:
+                result = execute(self.QUERY, variables={'first': 7, 'after': after})
+            self.assertIsNone(result.errors)
+            self.assertFalse(any('COUNT(' in q['sql'] for q in captured))
+            data = result.data['allOrdersKeyset']
+            seen.extend(self.page_ids(data))
+            if not data['pageInfo']['hasNextPage']:
+                break
+            after = data['pageInfo']['endCursor']
+        self.assertEqual(seen, self.expected)
+
+    def test_backward_page(self):
+        result = execute(self.QUERY, variables={'first': 10})
+        cursor = result.data['allOrdersKeyset']['pageInfo']['endCursor']
+        result = execute(self.QUERY, variables={'last': 4, 'before': cursor})
+        self.assertIsNone(result.errors)
+        data = result.data['allOrdersKeyset']
+        self.assertEqual(self.page_ids(data), self.expected[5:9])
+        self.assertTrue(data['pageInfo']['hasPreviousPage'])
+        self.assertTrue(data['pageInfo']['hasNextPage'])
+
+    def test_filters_apply(self):
+        minimum = sorted(Order.objects.values_list('total_amount', flat=True))[12]
+        result = execute(self.QUERY, variables={'first': 100, 'min': str(minimum)})
+        self.assertIsNone(result.errors)
+        expected = [
+            order.pk for order in Order.objects.filter(total_amount__gte=minimum)
+            .order_by('-order_date', '-pk')
+        ]
+        self.assertEqual(self.page_ids(result.data['allOrdersKeyset']), expected)
+
+    def test_invalid_cursor(self):
+        result = execute(self.QUERY, variables={'first': 5, 'after': 'bm9wZQ=='})
+        self.assertIn('Invalid cursor', result.errors[0].message)
+
+
+class IndexPlanTests(TestCase):
+    """Every indexable filter is answered through an index"""
+
+    def test_explain_filters_finds_no_table_scans(self):
+        out = StringIO()
+        call_command('explain_filters', stdout=out)
+        self.assertIn("All indexable filters use an index", out.getvalue())
+        self.assertIn("OK    ProductFilter.out_of_stock=False", out.getvalue())
+
+    def test_only_plans_without_an_index_count_as_scans(self):
+        from crm.management.commands.explain_filters import SQLITE_SCAN
+
+        self.assertEqual(SQLITE_SCAN.findall("SCAN crm_product"), ['crm_product'])
+        self.assertEqual(SQLITE_SCAN.findall("SCAN TABLE crm_product"), ['crm_product'])
+        self.assertEqual(SQLITE_SCAN.findall("SCAN crm_product USING INDEX crm_product_stock_idx"), [])
+        self.assertEqual(
+            SQLITE_SCAN.findall("SCAN crm_product USING COVERING INDEX crm_product_name_idx"), []
+        )
+
+    def test_phone_prefix_filter(self):
+        Customer.objects.create(name="A", email="a@example.com", phone="+1234567890")
+        Customer.objects.create(name="B", email="b@example.com", phone="+4412345678")
+        Customer.objects.create(name="C", email="c@example.com", phone="123-456-7890")
+        result = execute("""
+            query {
+                allCustomers(phoneStartsWith: "+1") { edges { node { name } } }
+                customersList(phoneStartsWith: "12") { name }
+            }
+        """)
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            [e['node']['name'] for e in result.data['allCustomers']['edges']], ["A"]
+        )
+        self.assertEqual([c['name'] for c in result.data['customersList']], ["C"])
+
+
+class SearchTests(TestCase):
+    """search() reads the full-text index, which triggers keep in sync"""
+
+    QUERY = """
+        query($q: String!, $first: Int) {
+            search(query: $q, first: $first) {
+                __typename
+                ... on CustomerType { name email }
+                ... on ProductType { name }
+            }
+        }
+    """
+
+    def names(self, q, first=20):
+        result = execute(self.QUERY, variables={'q': q, 'first': first})
+        self.assertIsNone(result.errors)
+        return [(hit['__typename'], hit['name']) for hit in result.data['search']]
+
+    def test_prefix_matching_across_kinds(self):
+        Customer.objects.create(name="Alice Johnson", email="alice@example.com")
+        Customer.objects.create(name="Bob Smith", email="bob@johnsonco.com")
+        Product.objects.create(name="Johnson Mouse", price=Decimal('5.00'))
+        Product.objects.create(name="Keyboard", price=Decimal('5.00'))
+
+        self.assertEqual(
+            sorted(self.names("john")),
+            [('CustomerType', "Alice Johnson"), ('CustomerType', "Bob Smith"),
+             ('ProductType', "Johnson Mouse")],
+        )
+        self.assertEqual(self.names("ali jo"), [('CustomerType', "Alice Johnson")])
+        self.assertEqual(self.names("johnsonco"), [('CustomerType', "Bob Smith")])
+        self.assertEqual(len(self.names("john", first=1)), 1)
+        self.assertEqual(self.names("   "), [])
+
+    def test_index_follows_writes(self):
+        customer = Customer.objects.create(name="Carol", email="carol@example.com")
+        Product.objects.bulk_create([Product(name="Webcam", price=Decimal('1.00'))])
+        self.assertEqual(self.names("webc"), [('ProductType', "Webcam")])
+
+        customer.name = "Caroline Zed"
+        customer.save()
+        self.assertEqual(self.names("zed"), [('CustomerType', "Caroline Zed")])
+
+        Product.objects.filter(name="Webcam").update(name="Camera")
+        self.assertEqual(self.names("webcam"), [])
+        self.assertEqual(self.names("cam"), [('ProductType', "Camera")])
+
+        customer.delete()
+        self.assertEqual(self.names("carol"), [])
+
+    def test_rebuild_command(self):
+        Product.objects.create(name="Monitor", price=Decimal('1.00'))
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn("rebuilt", out.getvalue())
+        self.assertEqual(self.names("moni"), [('ProductType', "Monitor")])
+
+
+class GraphQLViewCacheTests(TestCase):
+    """The /graphql view reuses parsed documents and supports APQ"""
+
+    QUERY = "query { hello }"
+
+    def setUp(self):
+        document_cache.clear()
+        cache.clear()
+        self.view = CRMGraphQLView.as_view(schema=schema)
+
+    def post(self, body):
+        request = RequestFactory().post(
+            '/graphql', data=json.dumps(body), content_type='application/json'
+        )
+        response = self.view(request)
+        return json.loads(response.content)
+
+    def test_repeated_documents_are_parsed_once(self):
+        for _ in range(3):
+            self.assertEqual(self.post({'query': self.QUERY})['data']['hello'],
+                             "Hello from GraphQL CRM!")
+        stats = document_cache.stats()
+        self.assertEqual((stats['misses'], stats['hits'], stats['size']), (1, 2, 1))
+
+    def test_invalid_documents_are_cached_with_their_errors(self):
+        for _ in range(2):
+            body = self.post({'query': "query { nope }"})
+            self.assertIn("nope", body['errors'][0]['message'])
+        self.assertEqual(document_cache.stats()['hits'], 1)
+
+    def test_automatic_persisted_queries(self):
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': query_hash(self.QUERY)}}
+
+        body = self.post({'extensions': extensions})
+        self.assertEqual(body['errors'][0]['message'], "PersistedQueryNotFound")
+
+        body = self.post({'query': self.QUERY, 'extensions': extensions})
+        self.assertEqual(body['data']['hello'], "Hello from GraphQL CRM!")
+
+        body = self.post({'extensions': extensions})
+        self.assertEqual(body['data']['hello'], "Hello from GraphQL CRM!")
+        stats = document_cache.stats()
+        self.assertEqual((stats['persisted_hits'], stats['persisted_misses']), (1, 1))
+
+    def test_persisted_hash_must_match_query(self):
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': '0' * 64}}
+        body = self.post({'query': self.QUERY, 'extensions': extensions})
+        self.assertEqual(body['errors'][0]['message'], "provided sha does not match query")
+
+    def test_malformed_extensions_are_bad_requests(self):
+        for extensions in (
+            ['persistedQuery'],
+            'persistedQuery',
+            '[1]',
+            {'persistedQuery': 'abc'},
+            {'persistedQuery': {'sha256Hash': 123}},
+        ):
+            request = RequestFactory().post(
+                '/graphql', content_type='application/json',
+                data=json.dumps({'query': self.QUERY, 'extensions': extensions}),
+            )
+            with self.subTest(extensions=extensions):
+                self.assertEqual(self.view(request).status_code, 400)
+
+
+@override_settings(CRM_RESULT_CACHE_ENABLED=True)
+class ResultCacheTests(TestCase):
+    """Query results are cached until a model they read is written"""
+
+    CUSTOMERS = "query { allCustomers { edges { node { name } } } }"
+    PRODUCTS = "query { allProducts { edges { node { name stock } } } }"
+
+    def setUp(self):
+        cache.clear()
+        result_stats.clear()
+        self.view = CRMGraphQLView.as_view(schema=schema)
+        self.customer = Customer.objects.create(name="Ada", email="ada@example.com")
+        self.product = Product.objects.create(name="Widget", price=Decimal('5.00'), stock=1)
+
+    def post(self, query, variables=None):
+        request = RequestFactory().post(
+            '/graphql', data=json.dumps({'query': query, 'variables': variables}),
+            content_type='application/json'
+        )
+        return json.loads(self.view(request).content)
+
+    def names(self, body, field):
+        return [edge['node']['name'] for edge in body['data'][field]['edges']]
+
+    def test_repeated_queries_skip_execution(self):
+        self.post(self.CUSTOMERS)
+        with self.assertNumQueries(0):
+            body = self.post(self.CUSTOMERS)
+        self.assertEqual(self.names(body, 'allCustomers'), ["Ada"])
+        self.assertEqual(result_stats.stats()['hits'], 1)
+
+    def test_replica_reads_are_not_cached(self):
+        with mock.patch.object(db_router, 'read_from_replica', return_value=True):
+            self.post(self.CUSTOMERS)
+        with self.assertNumQueries(2):
+            self.post(self.CUSTOMERS)
+        self.assertEqual(result_stats.stats()['hits'], 0)
+
+    def test_variables_are_part_of_the_key(self):
+        query = "query ($name: String) { allCustomers(name: $name) { edges { node { name } } } }"
+        self.assertEqual(self.names(self.post(query, {'name': 'Ada'}), 'allCustomers'), ["Ada"])
+        self.assertEqual(self.names(self.post(query, {'name': 'Bob'}), 'allCustomers'), [])
+
+    def test_writes_invalidate_only_queries_reading_the_model(self):
+        self.post(self.CUSTOMERS)
+        self.post(self.PRODUCTS)
+        Customer.objects.create(name="Bob", email="bob@example.com")
+
+        body = self.post(self.CUSTOMERS)
+        self.assertEqual(sorted(self.names(body, 'allCustomers')), ["Ada", "Bob"])
+        with self.assertNumQueries(0):
+            self.post(self.PRODUCTS)
+
+    def test_nested_relations_are_tracked(self):
+        query = "query { allCustomers { edges { node { name orders { edges { node { id } } } } } } }"
+        self.post(query)
+        Order.objects.create(customer=self.customer)
+        body = self.post(query)
+        orders = body['data']['allCustomers']['edges'][0]['node']['orders']['edges']
+        self.assertEqual(len(orders), 1)
+
+    def test_bulk_writes_invalidate(self):
+        self.post(self.PRODUCTS)
+        self.post("""
+            mutation { updateLowStockProducts(threshold: 5, increment: 10) { success } }
+        """)
+        body = self.post(self.PRODUCTS)
+        self.assertEqual(body['data']['allProducts']['edges'][0]['node']['stock'], 11)
+
+        self.post(self.CUSTOMERS)
+        self.post("""
+            mutation { bulkCreateCustomers(input: [{name: "Cy", email: "cy@example.com"}]) {
+                successCount } }
+        """)
+        self.assertIn("Cy", self.names(self.post(self.CUSTOMERS), 'allCustomers'))
+
+    def test_mutations_are_not_cached(self):
+        mutation = """
+            mutation ($email: String!) {
+                createCustomer(input: {name: "Dee", email: $email}) { customer { id } }
+            }
+        """
+        self.post(mutation, {'email': 'dee@example.com'})
+        self.post(mutation, {'email': 'dee2@example.com'})
+        self.assertEqual(Customer.objects.filter(name="Dee").count(), 2)
+        self.assertEqual(result_stats.stats()['hits'], 0)
+
+
+class QueryCostTests(TestCase):
+    """Operations are priced before execution and rejected over budget"""
+
+    def setUp(self):
+        cache.clear()
+        self.view = CRMGraphQLView.as_view(schema=schema)
+
+    def post(self, query, variables=None):
+        request = RequestFactory().post(
+            '/graphql', data=json.dumps({'query': query, 'variables': variables}),
+            content_type='application/json'
+        )
+        return json.loads(self.view(request).content)
+
+    def cost(self, query, variables=None):
+        document = parse(query)
+        return operation_cost(
+            schema.graphql_schema, document, get_operation_ast(document), variables
+        )
+
+    def test_page_sizes_multiply_through_connections(self):
+        query = """
+            query ($n: Int) {
+                allOrders(first: 10) { edges { node { id customer { name }
+                    products(first: $n) { edges { node { name } } } } } }
+            }
+        """
+        # 10 orders + 10 customers + 10 * 5 products
+        self.assertEqual(self.cost(query, {'n': 5}), (70, 2))
+        # Without a page size the maximum one is assumed
+        self.assertEqual(self.cost(query), (1020, 2))
+
+    def test_lists_and_fragments_are_counted(self):
+        query = """
+            query { customersList(first: 3) { ...withOrders } hello }
+            fragment withOrders on CustomerType { orders(first: 2) { edges { node { id } } } }
+        """
+        self.assertEqual(self.cost(query), (9, 2))
+
+    def test_cost_is_reported_in_extensions(self):
+        body = self.post("query { allCustomers(first: 4) { edges { node { name } } } }")
+        self.assertEqual(body['extensions']['cost']['requested'], 4)
+
+    @override_settings(CRM_QUERY_MAX_COST=1000)
+    def test_over_budget_operations_do_not_execute(self):
+        query = """
+            query { allCustomers { edges { node {
+                orders { edges { node { id } } } } } } }
+        """
+        with self.assertNumQueries(0):
+            body = self.post(query)
+        self.assertNotIn('data', body)
+        self.assertEqual(body['errors'][0]['extensions']['code'], 'QUERY_TOO_COSTLY')
+        self.assertEqual(body['extensions']['cost']['requested'], 10100)
+
+    def test_depth_limit(self):
+        query = """
+            query { customersList(first: 1) { orders(first: 1) { edges { node {
+                products(first: 1) { edges { node { orders(first: 1) { edges { node {
+                    customer { orders(first: 1) { edges { node {
+                        customer { orders(first: 1) { edges { node { id } } } }
+            } } } } } } } } } } } } } } }
+        """
+        body = self.post(query)
+        self.assertEqual(body['errors'][0]['extensions']['code'], 'QUERY_TOO_DEEP')
+
+    def test_wrongly_typed_page_size_is_a_bad_request(self):
+        request = RequestFactory().post(
+            '/graphql', content_type='application/json', data=json.dumps({
+                'query': "query ($n: Int) { customersList(first: $n) { name } }",
+                'variables': {'n': 'abc'},
+            })
+        )
+        with self.assertNumQueries(0):
+            response = self.view(request)
+        self.assertEqual(response.status_code, 400)
+        body = json.loads(response.content)
+        self.assertIn("Variable '$n'", body['errors'][0]['message'])
+        # Priced as if no variables were given
+        self.assertEqual(
+            self.cost("query ($n: Int) { customersList(first: $n) { name } }", {'n': 'abc'}),
+            self.cost("query { customersList { name } }"),
+        )
+
+    def test_unbounded_lists_are_capped(self):
+        Customer.objects.bulk_create(
+            Customer(name=f"C{i}", email=f"cap{i}@example.com") for i in range(5)
+        )
+        with mock.patch.object(graphene_settings, 'RELAY_CONNECTION_MAX_LIMIT', 3):
+            result = execute("query { customersList { name } }")
+        self.assertEqual(len(result.data['customersList']), 3)
+        result = execute("query { customersList(first: 2) { name } }")
+        self.assertEqual(len(result.data['customersList']), 2)
+
+
+@override_settings(CRM_EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    """Exports stream filtered rows and load order lines per chunk"""
+
+    def setUp(self):
+        self.customers, self.products = seed_orders(2, 4, 5, prefix="x")
+        self.client.force_login(get_user_model().objects.create_user(
+            'staff', 'staff@example.com', is_staff=True
+        ))
+
+    def get(self, path):
+        response = self.client.get(path)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def order_lines(self, order):
+        return [
+            {'product_id': line.product_id, 'quantity': line.quantity, 'unit_price': line.unit_price}
+            for line in order.lines.order_by('pk')
+        ]
+
+    def test_orders_ndjson_with_lines(self):
+        # session, user, orders, lines per chunk of 2
+        with self.assertNumQueries(2 + 1 + 3):
+            response, body = self.get('/export/orders')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 5)
+        for row in rows:
+            order = Order.objects.get(pk=row['id'])
+            self.assertEqual(
+                sorted(row['product_ids']), sorted(order.products.values_list('pk', flat=True))
+            )
+            self.assertEqual(row['customer_email'], order.customer.email)
+            self.assertEqual(
+                [{**line, 'unit_price': Decimal(line['unit_price'])} for line in row['lines']],
+                self.order_lines(order),
+            )
+
+    def test_orders_csv_lines(self):
+        response, body = self.get('/export/orders?format=csv')
+        rows = list(csv.DictReader(body.splitlines()))
+        self.assertEqual(len(rows), 5)
+        for row in rows:
+            order = Order.objects.get(pk=row['id'])
+            self.assertEqual(row['lines'], ';'.join(
+                f"{line['product_id']}:{line['quantity']}:{line['unit_price']}"
+                for line in self.order_lines(order)
+            ))
+
+    def test_filters_and_csv(self):
+        response, body = self.get('/export/products?format=csv&stock_gte=2')
+        lines = body.splitlines()
+        self.assertEqual(lines[0], 'id,name,price,stock,created_at')
+        self.assertEqual(
+            sorted(line.split(',')[1] for line in lines[1:]), ["Product 2", "Product 3"]
+        )
+
+    def test_only_staff_may_export(self):
+        self.client.logout()
+        response = self.client.get('/export/customers')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/admin/login/', response['Location'])
+
+        self.client.force_login(get_user_model().objects.create_user('member'))
+        self.assertEqual(self.client.get('/export/customers').status_code, 302)
+
+    def test_invalid_arguments(self):
+        self.assertEqual(self.client.get('/export/orders?nope=1').status_code, 400)
+        self.assertEqual(self.client.get('/export/orders?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/export/invoices').status_code, 400)
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command('export_crm', 'customers', '--filter', 'email=x1@example.com', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['email'] for row in rows], ['x1@example.com'])
+
+
+@override_settings(CRM_RESULT_CACHE_ENABLED=False)
+class AsyncGraphQLViewTests(TransactionTestCase):
+    """The ASGI view runs root fields concurrently and matches the sync view"""
+
+    QUERY = """
+        query {
+            hello
+            crmStats { totalCustomers totalOrders totalRevenue }
+            customersList(first: 5) { name orders { edges { node { id } } } }
+            allProducts(first: 5) { edges { node { name } } }
+            order(id: 1) { id customer { name } products { edges { node { name } } } }
+        }
+    """
+
+    def setUp(self):
+        seed_orders(3, 4, 6, prefix="a")
+
+    def post_sync(self, query):
+        request = RequestFactory().post(
+            '/graphql', data=json.dumps({'query': query}), content_type='application/json'
+        )
+        return json.loads(CRMGraphQLView.as_view(schema=schema)(request).content)
+
+    async def post_async(self, query):
+        request = AsyncRequestFactory().post(
+            '/graphql/async', data=json.dumps({'query': query}), content_type='application/json'
+        )
+        response = await AsyncCRMGraphQLView.as_view(schema=async_schema)(request)
+        return json.loads(response.content)
+
+    async def test_matches_sync_view(self):
+        body = await self.post_async(self.QUERY)
+        self.assertNotIn('errors', body)
+        expected = await sync_to_async(self.post_sync)(self.QUERY)
+        self.assertEqual(body['data'], expected['data'])
+
+    async def test_sibling_root_fields_run_concurrently(self):
+        # Each root connection waits for the other; run one after the
+        # other, the barrier would time out
+        barrier = threading.Barrier(2, timeout=5)
+
+        def waiting(queryset, info):
+            barrier.wait()
+            return optimize_queryset(queryset, info)
+
+        with mock.patch('crm.fields.optimize_queryset', waiting):
+            body = await self.post_async("""
+                query { allCustomers { edges { node { name } } }
+                        allProducts { edges { node { name } } } }
+            """)
+        self.assertNotIn('errors', body)
+        self.assertEqual(len(body['data']['allProducts']['edges']), 4)
+
+    async def test_mutations(self):
+        body = await self.post_async("""
+            mutation { createCustomer(input: {name: "Async", email: "async@example.com"}) {
+                customer { name orders { edges { node { id } } } } } }
+        """)
+        self.assertEqual(body['data']['createCustomer']['customer']['name'], "Async")
+        self.assertTrue(await Customer.objects.filter(email="async@example.com").aexists())
+
+
+class GraphQLJobTests(TestCase):
+    """Cron jobs and tasks run pre-parsed documents against the schema"""
+
+    def setUp(self):
+        seed_orders(2, 3, 4, prefix="j")
+
+    def test_report_costs_one_query(self):
+        with tempfile.NamedTemporaryFile('r') as log, \
+                mock.patch('crm.tasks.REPORT_LOG', log.name):
+            with self.assertNumQueries(1), mock.patch('sys.stdout', new_callable=StringIO):
+                result = generate_crm_report()
+            self.assertIn("2 customers, 4 orders", log.read())
+        self.assertEqual((result['status'], result['customers'], result['orders']),
+                         ('success', 2, 4))
+
+    def test_low_stock_job(self):
+        with tempfile.NamedTemporaryFile('r') as log, \
+                mock.patch('crm.cron.LOW_STOCK_LOG', log.name):
+            update_low_stock()
+            self.assertIn("Product: Product 0, New Stock Level: 10", log.read())
+
+    def test_documents_are_parsed_once(self):
+        graphql_executor.prepare.cache_clear()
+        for _ in range(3):
+            graphql_executor.execute("query { hello }")
+        self.assertEqual(graphql_executor.prepare.cache_info().misses, 1)
+
+    def test_errors_raise(self):
+        with self.assertRaises(graphql_executor.GraphQLJobError):
+            graphql_executor.execute("query { nope }")
+
+    @skipUnless(find_spec('requests_toolbelt'), "the HTTP transport needs requests-toolbelt")
+    def test_http_mode_reuses_one_session_without_introspection(self):
+        from gql.transport.requests import RequestsHTTPTransport
+
+        executor = graphql_executor.HTTPExecutor('http://crm.invalid/graphql')
+        with mock.patch.object(RequestsHTTPTransport, 'execute',
+                               return_value=ExecutionResult(data={'hello': 'hi'})) as sent:
+            for _ in range(2):
+                self.assertEqual(executor.execute("query { hello }"), {'hello': 'hi'})
+        self.assertEqual(sent.call_count, 2)
+
+
+class BenchmarkCatalogTests(TestCase):
+    """The benchmark catalog covers the schema and its query counts hold at any size"""
+
+    def test_catalog_covers_every_root_field(self):
+        self.assertEqual(benchmarks.uncovered_fields(schema), [])
+
+    def test_query_counts_do_not_grow_with_data(self):
+        seeding.seed(customers=10, products=8, orders=30, seed=1)
+        small = benchmarks.run_catalog(schema, iterations=1, warmup=0)
+        for name, result in small.items():
+            self.assertEqual(result['errors'], [], name)
+
+        seeding.seed(customers=0, products=0, orders=300, seed=2)
+        large = benchmarks.run_catalog(schema, iterations=1, warmup=0)
+        self.assertEqual(
+            {name: result['queries'] for name, result in large.items()},
+            {name: result['queries'] for name, result in small.items()},
+        )
+
+    def test_compare_flags_slowdowns_and_extra_queries(self):
+        baseline = {'order': {'queries': 2, 'p50_ms': 10.0, 'p95_ms': 20.0}}
+        within = {'order': {'queries': 2, 'p50_ms': 12.0, 'p95_ms': 21.0}}
+        self.assertEqual(benchmarks.compare(within, baseline, tolerance=0.25), [])
+
+        slower = {'order': {'queries': 3, 'p50_ms': 14.0, 'p95_ms': 20.0}}
+        regressions = benchmarks.compare(slower, baseline, tolerance=0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertIn('3 queries', regressions[0])
+
+    def test_compare_only_checks_the_given_percentiles(self):
+        baseline = {'order': {'queries': 2, 'p50_ms': 10.0, 'p95_ms': 20.0}}
+        jittery = {'order': {'queries': 2, 'p50_ms': 11.0, 'p95_ms': 60.0}}
+        self.assertEqual(benchmarks.compare(jittery, baseline, keys=('p50_ms',)), [])
+        self.assertEqual(len(benchmarks.compare(jittery, baseline)), 1)
+
+
+class SeedingTests(TestCase):
+    """seed_crm data is reproducible and consistent with totals and rollups"""
+
+    def rows(self):
+        return (
+            list(Customer.objects.order_by('pk').values_list('pk', 'name', 'email', 'phone')),
+            list(Product.objects.order_by('pk').values_list('pk', 'price', 'stock')),
+            list(Order.objects.order_by('pk').values_list('pk', 'customer_id', 'total_amount')),
+            list(OrderLine.objects.order_by('pk').values_list(
+                'order_id', 'product_id', 'quantity', 'unit_price'
+            )),
+        )
+
+    def test_same_seed_produces_same_rows(self):
+        lines = seeding.seed(customers=40, products=20, orders=200, seed=7)
+        self.assertEqual(OrderLine.objects.count(), lines)
+        first = self.rows()
+
+        seeding.clear()
+        self.assertFalse(Order.objects.exists())
+        seeding.seed(customers=40, products=20, orders=200, seed=7)
+        self.assertEqual(self.rows(), first)
+
+        seeding.clear()
+        seeding.seed(customers=40, products=20, orders=200, seed=8)
+        self.assertNotEqual(self.rows(), first)
+
+    def test_totals_and_rollups_match_lines(self):
+        seeding.seed(customers=30, products=15, orders=300, seed=3, days=30)
+        self.assertFalse(Order.objects.stale_totals().exists())
+        # Ids follow order dates
+        dates = list(Order.objects.order_by('pk').values_list('order_date', flat=True))
+        self.assertEqual(dates, sorted(dates))
+
+        seeded = sorted(DailySales.objects.values_list(
+            'day', 'product_key', 'customer_key', 'order_count', 'quantity', 'revenue'
+        ))
+        today = timezone.localdate()
+        rollups.rebuild(today - timedelta(days=31), today)
+        self.assertEqual(seeded, sorted(DailySales.objects.values_list(
+            'day', 'product_key', 'customer_key', 'order_count', 'quantity', 'revenue'
+        )))
+        self.assertEqual(
+            DailySales.objects.filter(product_key=DailySales.ALL, customer_key=DailySales.ALL)
+            .aggregate(n=Sum('order_count'))['n'],
+            300,
+        )
+
+    def test_seed_appends_to_existing_data(self):
+        seeding.seed(customers=10, products=5, orders=20, seed=1)
+        seeding.seed(customers=5, products=0, orders=20, seed=2)
+        self.assertEqual(Customer.objects.count(), 15)
+        self.assertEqual(Order.objects.count(), 40)
+        self.assertFalse(Order.objects.stale_totals().exists())
+
+
+@override_settings(CRM_RESULT_CACHE_ENABLED=False)
+class InstrumentationTests(TestCase):
+    """Operation and field timings, SQL counts and errors reach /metrics and extensions"""
+
+    QUERY = """
+        query Orders {
+            ordersList(first: 5) { id customer { name } lines { quantity product { name } } }
+        }
+    """
+
+    def setUp(self):
+        instrumentation.registry.clear()
+        seed_orders(3, 4, 5, prefix="i")
+
+    def post(self, body, **headers):
+        request = RequestFactory().post(
+            '/graphql', data=json.dumps(body), content_type='application/json', headers=headers
+        )
+        return json.loads(CRMGraphQLView.as_view(schema=schema)(request).content)
+
+    @override_settings(DEBUG=True)
+    def test_debug_header_returns_timings(self):
+        self.assertNotIn('timing', self.post({'query': self.QUERY}).get('extensions', {}))
+
+        with CaptureQueriesContext(connection) as captured:
+            body = self.post({'query': self.QUERY}, **{'X-CRM-Debug': '1'})
+        timing = body['extensions']['timing']
+        self.assertEqual((timing['operation'], timing['type'], timing['errors']), ('Orders', 'query', 0))
+        self.assertEqual(timing['sqlQueries'], len(captured))
+        fields = {field['path']: field for field in timing['fields']}
+        self.assertEqual(fields['ordersList']['calls'], 1)
+        self.assertEqual(fields['ordersList.customer']['calls'], 5)
+        # Plain attribute reads are not timed
+        self.assertNotIn('ordersList.lines.product.name', fields)
+        # Every query is charged to the resolver that issued it
+        self.assertEqual(sum(field['sqlQueries'] for field in fields.values()), len(captured))
+
+    def test_debug_header_needs_debug_or_staff(self):
+        body = self.post({'query': self.QUERY}, **{'X-CRM-Debug': '1'})
+        self.assertNotIn('timing', body.get('extensions', {}))
+
+    def test_metrics_endpoint(self):
+        self.post({'query': self.QUERY})
+        self.post({'query': "mutation Fail { createCustomer(input: {name: \"x\", email: \"bad\"}) { success } }"})
+        self.post({'query': "query Boom { order(id: \"x\") { id } }"})
+
+        response = metrics_view(RequestFactory().get('/metrics'))
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn(
+            'crm_graphql_operation_duration_seconds_count{operation="Orders",type="query"} 1', text
+        )
+        self.assertIn(
+            'crm_graphql_operation_duration_seconds_bucket{operation="Orders",type="query",le="+Inf"} 1',
+            text,
+        )
+        self.assertIn('crm_graphql_operation_errors_total{operation="Boom",type="query"} 1', text)
+        self.assertIn('crm_graphql_field_errors_total{field="Query.order"} 1', text)
+        self.assertIn('crm_graphql_field_duration_seconds_count{field="OrderType.customer"} 1', text)
+        self.assertRegex(text, r'crm_graphql_field_sql_queries_total\{field="Query.ordersList"\} [1-9]')
+
+    @override_settings(CRM_METRICS_MAX_OPERATIONS=1)
+    def test_operation_labels_are_capped(self):
+        for name in ('First', 'Second', 'Third'):
+            self.post({'query': f"query {name} {{ hello }}"})
+        text = instrumentation.registry.render()
+        self.assertIn('operation="First"', text)
+        self.assertIn('crm_graphql_operation_duration_seconds_count{operation="other",type="query"} 2', text)
+
+    @override_settings(CRM_INSTRUMENTATION_ENABLED=False)
+    def test_disabled_adds_no_middleware_and_records_nothing(self):
+        body = self.post({'query': self.QUERY}, **{'X-CRM-Debug': '1'})
+        self.assertNotIn('timing', body.get('extensions', {}))
+        self.assertNotIn('Orders', instrumentation.registry.render())
+        self.assertEqual(metrics_view(RequestFactory().get('/metrics')).status_code, 404)
+
+    @override_settings(DEBUG=True)
+    async def test_async_view_charges_sql_to_fields(self):
+        request = AsyncRequestFactory().post(
+            '/graphql/async', data=json.dumps({'query': self.QUERY}),
+            content_type='application/json', headers={'X-CRM-Debug': '1'},
+        )
+        response = await AsyncCRMGraphQLView.as_view(schema=async_schema)(request)
+        timing = json.loads(response.content)['extensions']['timing']
+        fields = {field['path']: field for field in timing['fields']}
+        self.assertGreater(timing['sqlQueries'], 0)
+        self.assertGreater(fields['ordersList']['sqlQueries'], 0)
+        self.assertEqual(sum(field['sqlQueries'] for field in fields.values()), timing['sqlQueries'])
+
+
+@override_settings(CRM_RESULT_CACHE_ENABLED=False, CRM_SLOW_OPERATION_MS=0, CRM_SLOW_OPERATION_TOP_SQL=2)
+class SlowOperationLogTests(TestCase):
+    """Slow operations are logged as JSON with their slowest SQL and analyzed offline"""
+
+    QUERY = """
+        query Orders($first: Int) {
+            ordersList(first: $first) { id customer { name } products { edges { node { name } } } }
+        }
+    """
+
+    def setUp(self):
+        seed_orders(3, 4, 5, prefix="s")
+
+    def post(self, query, variables=None):
+        request = RequestFactory().post(
+            '/graphql', data=json.dumps({'query': query, 'variables': variables}),
+            content_type='application/json',
+        )
+        return json.loads(CRMGraphQLView.as_view(schema=schema)(request).content)
+
+    def logged(self, query, variables=None):
+        with self.assertLogs('crm.slow_operations', 'WARNING') as logs:
+            self.post(query, variables)
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_record_has_operation_hash_and_slowest_sql(self):
+        [record] = self.logged(self.QUERY, {'first': 5})
+        self.assertEqual(record['operation'], 'Orders')
+        self.assertEqual(record['document'], query_hash(self.QUERY))
+        self.assertEqual(record['errors'], 0)
+        self.assertEqual(len(record['slowest_sql']), min(2, record['sql_queries']))
+        durations = [statement['duration_ms'] for statement in record['slowest_sql']]
+        self.assertEqual(durations, sorted(durations, reverse=True))
+        for statement in record['slowest_sql']:
+            self.assertTrue(statement['sql'].startswith('SELECT'))
+            self.assertTrue(statement['path'].startswith('ordersList'))
+
+        # The fingerprint identifies the variables without containing them
+        [same] = self.logged(self.QUERY, {'first': 5})
+        [other] = self.logged(self.QUERY, {'first': 4})
+        self.assertEqual(same['variables'], record['variables'])
+        self.assertNotEqual(other['variables'], record['variables'])
+
+    @override_settings(CRM_SLOW_OPERATION_MS=60_000)
+    def test_fast_operations_are_not_logged(self):
+        with self.assertNoLogs('crm.slow_operations'):
+            self.post(self.QUERY)
+
+    def test_analyze_slow_ops_groups_by_document(self):
+        records = (
+            self.logged(self.QUERY, {'first': 5})
+            + self.logged(self.QUERY, {'first': 2})
+            + self.logged("query Hello { hello }")
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.log', delete=False) as f:
+            f.write('not json\n')
+            f.writelines(json.dumps(record) + '\n' for record in records)
+        out = StringIO()
+        call_command('analyze_slow_ops', f.name, '--sort', 'count', stdout=out)
+        output = out.getvalue()
+        self.assertIn("3 slow operations, 2 documents", output)
+        self.assertIn("Orders (query)\n  2 runs, 2 variable sets", output)
+        self.assertLess(output.index("Orders (query)"), output.index("Hello (query)"))
+        self.assertIn("ordersList", output)
+
+
+@override_settings(CRM_DATABASE_REPLICAS={'replica_a': 3, 'replica_b': 1, 'replica_c': 0})
+class ReplicaRouterTests(SimpleTestCase):
+    """Reads go to weighted healthy replicas, everything that must be fresh to the primary"""
+
+    def setUp(self):
+        self.router = db_router.ReplicaRouter()
+        self.unhealthy = set()
+        patcher = mock.patch.object(
+            db_router.health, 'is_healthy', side_effect=lambda alias: alias not in self.unhealthy
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_are_weighted_across_healthy_replicas(self):
+        reads = Counter(self.router.db_for_read(Order) for _ in range(2000))
+        self.assertEqual(set(reads), {'replica_a', 'replica_b'})
+        self.assertGreater(reads['replica_a'], reads['replica_b'] * 2)
+
+        self.unhealthy = {'replica_a'}
+        self.assertEqual({self.router.db_for_read(Order) for _ in range(50)}, {'replica_b'})
+        self.unhealthy = {'replica_a', 'replica_b'}
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    def test_writes_atomic_blocks_and_mutations_use_the_primary(self):
+        self.assertEqual(self.router.db_for_write(Order), 'default')
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Order), 'default')
+        with db_router.use_primary():
+            self.assertEqual(self.router.db_for_read(Order), 'default')
+        self.assertNotEqual(self.router.db_for_read(Order), 'default')
+        self.assertIs(self.router.allow_migrate('replica_a', 'crm'), False)
+        self.assertIsNone(self.router.allow_migrate('default', 'crm'))
+
+    def test_request_reads_one_replica_until_it_writes(self):
+        with db_router.routing() as state:
+            first = self.router.db_for_read(Order)
+            self.assertEqual({self.router.db_for_read(Customer) for _ in range(20)}, {first})
+            self.router.db_for_write(Customer)
+            self.assertTrue(state.wrote)
+            self.assertEqual(self.router.db_for_read(Customer), 'default')
+
+    @override_settings(CRM_PRIMARY_STICKY_SECONDS=7)
+    def test_middleware_pins_clients_after_a_write(self):
+        def view(request):
+            reads.append(self.router.db_for_read(Order))
+            if request.method == 'POST':
+                self.router.db_for_write(Order)
+            return HttpResponse()
+
+        reads = []
+        middleware = db_router.DatabaseRoutingMiddleware(view)
+        response = middleware(RequestFactory().get('/'))
+        self.assertNotIn('crm_primary', response.cookies)
+
+        response = middleware(RequestFactory().post('/'))
+        self.assertEqual(response.cookies['crm_primary']['max-age'], 7)
+
+        request = RequestFactory().get('/')
+        request.COOKIES['crm_primary'] = '1'
+        middleware(request)
+        self.assertNotEqual(reads[0], 'default')
+        self.assertEqual(reads[2], 'default')
+
+    def test_replica_reads_are_reported(self):
+        self.assertTrue(db_router.read_from_replica())
+        with db_router.routing():
+            self.assertFalse(db_router.read_from_replica())
+            self.router.db_for_read(Order)
+            self.assertTrue(db_router.read_from_replica())
+        with db_router.routing(pinned=True):
+            self.router.db_for_read(Order)
+            self.assertFalse(db_router.read_from_replica())
+        self.unhealthy = {'replica_a', 'replica_b'}
+        with db_router.routing():
+            self.router.db_for_read(Order)
+            self.assertFalse(db_router.read_from_replica())
+
+    @override_settings(CRM_DATABASE_REPLICAS={})
+    def test_no_replicas_leaves_routing_to_django(self):
+        self.assertFalse(db_router.read_from_replica())
+        self.assertIsNone(self.router.db_for_read(Order))
+        self.assertIsNone(self.router.db_for_write(Order))
+
+
+class SqliteTuningTests(TestCase):
+    """crm.sqlite_tuning configures each new SQLite connection"""
+
+    def connect(self):
+        wrapper = connections.create_connection('default')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        return wrapper.connection.execute(f"PRAGMA {name}").fetchone()[0]
+
+    @override_settings(
+        CRM_SQLITE_PRAGMAS={'busy_timeout': 1234, 'synchronous': 'normal', 'cache_size': None},
+        CRM_SQLITE_TRANSACTION_MODE='immediate',
+    )
+    def test_new_connections_get_the_pragmas_and_transaction_mode(self):
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 1234)
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        # None keeps SQLite's default
+        self.assertEqual(sqlite_tuning.pragma_statements(), [
+            "PRAGMA busy_timeout = 1234", "PRAGMA synchronous = normal",
+        ])
+        self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+
+    def test_default_pragmas_leave_the_database_file_alone(self):
+        # journal_mode persists in the file; WAL is opt-in via CRM_SQLITE_WAL
+        self.assertFalse(settings.CRM_SQLITE_WAL)
+        statements = sqlite_tuning.pragma_statements()
+        self.assertFalse([s for s in statements if 'journal_mode' in s or 'synchronous' in s])
+        self.assertIn("PRAGMA busy_timeout = 5000", statements)
+
+    @override_settings(CRM_SQLITE_TRANSACTION_MODE='sometimes')
+    def test_unknown_transaction_mode_is_rejected(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "CRM_SQLITE_TRANSACTION_MODE"):
+            self.connect()
+
+    @override_settings(CRM_SQLITE_PRAGMAS={}, CRM_SQLITE_TRANSACTION_MODE=None)
+    def test_disabled_tuning_keeps_django_defaults(self):
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 2)
+        self.assertIsNone(wrapper.transaction_mode)
+
+
+class IdempotencyTests(TestCase):
+    """Mutations with an idempotencyKey run once and replay their first response"""
+
+    CREATE_ORDER = """
+        mutation($input: OrderInput!, $key: String) {
+            createOrder(input: $input, idempotencyKey: $key) {
+                success message
+                order { id totalAmount customer { name } products { edges { node { name } } } }
+            }
+        }
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name="Retry", email="retry@example.com")
+        self.product = Product.objects.create(name="Widget", price=Decimal('2.50'), stock=5)
+
+    def create_order(self, key, quantity=2, customer_id=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = execute(self.CREATE_ORDER, {
+                'key': key,
+                'input': {
+                    'customerId': customer_id or self.customer.pk,
+                    'lines': [{'productId': self.product.pk, 'quantity': quantity}],
+                },
+            })
+        self.assertIsNone(result.errors)
+        return result.data['createOrder']
+
+    def test_retries_replay_the_first_response_without_queries(self):
+        first = self.create_order('order-1')
+        self.assertEqual(first['order']['products']['edges'], [{'node': {'name': "Widget"}}])
+        Product.objects.filter(pk=self.product.pk).update(name="Renamed")
+        with self.assertNumQueries(0):
+            replay = self.create_order('order-1')
+        # The response as it was sent, not re-resolved from the models
+        self.assertEqual(replay, first)
+        self.assertEqual(Order.objects.count(), 1)
+
+        self.create_order('order-2')
+        self.create_order(None)
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_key_reused_with_other_arguments_is_an_error(self):
+        self.create_order('order-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            result = execute(self.CREATE_ORDER, {
+                'key': 'order-1',
+                'input': {'customerId': self.customer.pk, 'productIds': [self.product.pk]},
+            })
+        self.assertIn("different request", result.errors[0].message)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_attempts_are_not_stored(self):
+        self.assertFalse(self.create_order('order-1', customer_id=999999)['success'])
+        key = idempotency.make_key('CreateOrder', 'order-1', SimpleNamespace(context=None))
+        self.assertIsNone(cache.get(idempotency.RESULT_PREFIX + key))
+        self.assertIsNone(cache.get(idempotency.LOCK_PREFIX + key))
+
+    def test_bulk_create_customers_replays(self):
+        mutation = """
+            mutation($input: [CustomerInput]!) {
+                bulkCreateCustomers(input: $input, idempotencyKey: "import-1") {
+                    successCount errors customers { email }
+                }
+            }
+        """
+        rows = [{'name': "A", 'email': "a@example.com"}, {'name': "B", 'email': "b@example.com"}]
+        with self.captureOnCommitCallbacks(execute=True):
+            first = execute(mutation, {'input': rows})
+        replay = execute(mutation, {'input': rows})
+        self.assertEqual(replay.data, first.data)
+        self.assertEqual(replay.data['bulkCreateCustomers']['successCount'], 2)
+        self.assertIsNone(replay.data['bulkCreateCustomers']['errors'])
+
+    def test_concurrent_duplicates_wait_for_the_first(self):
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'order': len(calls)}
+
+        responses = []
+        barrier = threading.Barrier(3, timeout=5)
+
+        def duplicate():
+            barrier.wait()
+            outcome = idempotency.run(
+                'CreateOrder', 'k', SimpleNamespace(context=None), slow, {'a': 1}
+            )
+            if isinstance(outcome, idempotency.Pending):
+                # What IdempotentExecutionContext does once the field completes
+                outcome.store(outcome.payload)
+                responses.append(outcome.payload)
+            else:
+                responses.append(outcome.data)
+
+        threads = [threading.Thread(target=duplicate) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(responses, [{'order': 1}] * 3)
+
+    @override_settings(CRM_IDEMPOTENCY_ALLOW_LOCAL_CACHE=False)
+    def test_keys_need_a_shared_cache(self):
+        result = execute(self.CREATE_ORDER, {
+            'key': 'order-1',
+            'input': {'customerId': self.customer.pk, 'productIds': [self.product.pk]},
+        })
+        self.assertIn("needs a cache shared by every worker", result.errors[0].message)
+        self.assertEqual(Order.objects.count(), 0)
+
+
+class BulkCreateOrdersTests(TestCase):
+    """bulkCreateOrders validates rows in memory and inserts orders and lines in bulk"""
+
+    MUTATION = """
+        mutation($input: [OrderInput]!) {
+            bulkCreateOrders(input: $input) {
+                successCount errors
+                orders { totalAmount customer { email } lines { quantity } }
+            }
+        }
+    """
+
+    def test_valid_rows_are_created_and_invalid_rows_reported(self):
+        customers, products = seed_orders(customer_count=2, product_count=3, order_count=0)
+        rows = [
+            {'customerId': customers[0].pk, 'lines': [
+                {'productId': products[0].pk, 'quantity': 2},
+                {'productId': products[1].pk, 'quantity': 1},
+            ]},
+            {'customerId': 999999, 'productIds': [products[0].pk]},
+            {'customerId': customers[1].pk, 'productIds': [products[2].pk, products[2].pk]},
+            {'customerId': customers[1].pk, 'productIds': [999998]},
+            {'customerId': customers[1].pk, 'lines': [{'productId': products[0].pk, 'quantity': 0}]},
+        ]
+        result = execute(self.MUTATION, variables={'input': rows})
+        self.assertIsNone(result.errors)
+        payload = result.data['bulkCreateOrders']
+        self.assertEqual(payload['successCount'], 2)
+        self.assertEqual(payload['errors'], [
+            "Row 2: Customer with ID 999999 does not exist",
+            "Row 4: Product with ID 999998 does not exist",
+            "Row 5: Quantity must be at least 1",
+        ])
+        self.assertEqual(
+            [(order['totalAmount'], order['customer']['email']) for order in payload['orders']],
+            [('31.00', customers[0].email), ('24.00', customers[1].email)],
+        )
+        self.assertEqual(payload['orders'][1]['lines'], [{'quantity': 2}])
+        self.assertFalse(Order.objects.stale_totals().exists())
+        self.assertEqual(
+            DailySales.objects.filter(product_key=0, customer_key=0).get().revenue,
+            Decimal('55.00'),
+        )
+
+    def test_query_count_does_not_grow_with_rows(self):
+        customers, products = seed_orders(customer_count=10, product_count=10, order_count=0)
+        rows = [
+            {'customerId': customers[i % 10].pk, 'lines': [
+                {'productId': products[(i + k) % 10].pk, 'quantity': k + 1} for k in range(3)
+            ]}
+            for i in range(60)
+        ]
+        with self.settings(CRM_BULK_CREATE_CHUNK_SIZE=500):
+            # customers, products, savepoint, orders INSERT, lines INSERT,
+            # DailySales upsert, release
+            with self.assertNumQueries(7):
+                result = execute("""
+                    mutation($input: [OrderInput]!) { bulkCreateOrders(input: $input) { successCount } }
+                """, variables={'input': rows})
+        self.assertEqual(result.data['bulkCreateOrders']['successCount'], 60)
+        self.assertEqual(OrderLine.objects.count(), 180)
+
+
+class BulkCreateOrdersConflictTests(TransactionTestCase):
+    """Rows whose customer or product disappears before the insert fail alone"""
+
+    def test_deleted_product_rejects_only_its_rows(self):
+        from crm import schema as crm_schema
+
+        customers, products = seed_orders(customer_count=1, product_count=2, order_count=0)
+        rows = [
+            {'customerId': customers[0].pk, 'productIds': [products[0].pk]},
+            {'customerId': customers[0].pk, 'productIds': [products[1].pk]},
+            {'customerId': customers[0].pk, 'productIds': [products[0].pk, products[1].pk]},
+        ]
+        real_order_lines = crm_schema.order_lines
+
+        def order_lines(quantities, found):
+            # Deleted after the lookup, before the INSERT references it
+            Product.objects.filter(pk=products[1].pk).delete()
+            return real_order_lines(quantities, found)
+
+        with mock.patch.object(crm_schema, 'order_lines', side_effect=order_lines):
+            result = execute("""
+                mutation($input: [OrderInput]!) {
+                    bulkCreateOrders(input: $input) { successCount errors orders { totalAmount } }
+                }
+            """, variables={'input': rows})
+        self.assertIsNone(result.errors)
+        payload = result.data['bulkCreateOrders']
+        self.assertEqual(payload['successCount'], 1)
+        self.assertEqual(payload['orders'], [{'totalAmount': '10.00'}])
+        self.assertEqual(
+            [error.split(':')[0] for error in payload['errors']], ["Row 2", "Row 3"]
+        )
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderLine.objects.count(), 1)
+        self.assertEqual(DailySales.objects.get(product_key=0, customer_key=0).order_count, 1)
@@ -1,3 +1,540 @@
-from django.shortcuts import render
+import asyncio
+import inspect
+import json
+from collections import OrderedDict, namedtuple
+from hashlib import sha256
+from threading import Lock
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import (
+    HttpResponse,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.http.response import HttpResponseBadRequest
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError, set_rollback
+from graphql import (
+    ExecutionResult,
+    MiddlewareManager,
+    OperationType,
+    execute,
+    get_operation_ast,
+    parse,
+    validate_schema,
+)
+from graphql.error import GraphQLError
+from graphql.validation import validate
+from crm import db_router, exports, instrumentation, result_cache, slow_operations
+from crm.async_schema import SyncResolverMiddleware
+from crm.cost import coerce_variables, cost_limit_validator
+from crm.idempotency import IdempotentExecutionContext
+from crm.loaders import CRMLoaders
 
-# Create your views here.
+APQ_CACHE_PREFIX = 'crm:apq:'
+
+PreparedRequest = namedtuple(
+    'PreparedRequest', 'schema document operation_ast extensions cache_key digest'
+)
+
+
+class DocumentCache:
+    """Thread-safe LRU of parsed and validated documents keyed by query hash"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.persisted_hits = 0
+        self.persisted_misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+            self.persisted_hits = self.persisted_misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'persisted_hits': self.persisted_hits,
+                'persisted_misses': self.persisted_misses,
+            }
+
+
+document_cache = DocumentCache(getattr(settings, 'CRM_GRAPHQL_DOCUMENT_CACHE_SIZE', 256))
+
+
+def query_hash(query):
+    return sha256(query.encode('utf-8')).hexdigest()
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView that parses and validates each distinct document once and
+    speaks the Automatic Persisted Queries protocol.
+
+    Clients may send only extensions.persistedQuery.sha256Hash; on a miss
+    they receive PersistedQueryNotFound and retry with the full query.
+    Operations over the cost or depth budget are rejected before execution
+    and every response reports the computed cost in extensions.cost.
+    """
+
+    # Idempotent mutations return values only this context can complete
+    execution_context_class = IdempotentExecutionContext
+
+    def get_document(self, schema, query, digest):
+        """Return (document, validation errors) from the LRU, parsing on a miss"""
+        entry = document_cache.get(digest)
+        if entry is None:
+            document = parse(query)
+            errors = validate(
+                schema,
+                document,
+                self.validation_rules,
+                graphene_settings.MAX_VALIDATION_ERRORS,
+            )
+            entry = (document, errors)
+            document_cache.put(digest, entry)
+        return entry
+
+    def get_persisted_query(self, request, data):
+        """Return the sha256Hash the client sent with the APQ extension, if any"""
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        if not extensions:
+            return None
+        if not isinstance(extensions, dict):
+            raise HttpError(HttpResponseBadRequest("Extensions must be an object."))
+        persisted = extensions.get('persistedQuery')
+        if persisted is None:
+            return None
+        if not isinstance(persisted, dict):
+            raise HttpError(HttpResponseBadRequest("persistedQuery must be an object."))
+        sha256_hash = persisted.get('sha256Hash')
+        if sha256_hash is not None and not isinstance(sha256_hash, str):
+            raise HttpError(HttpResponseBadRequest("persistedQuery.sha256Hash must be a string."))
+        return sha256_hash
+
+    def check_cost(self, schema, document, operation_ast, variables):
+        """
+        Run the cost rule with this request's variables and return
+        (errors, extensions). The cost is reported even when it passes.
+        """
+        if operation_ast is None:
+            return [], None
+        # Wrongly typed variables are a request error, reported before pricing
+        coerced = coerce_variables(schema, operation_ast, variables)
+        if isinstance(coerced, list):
+            return coerced, None
+        max_cost = getattr(settings, 'CRM_QUERY_MAX_COST', 20000)
+        max_depth = getattr(settings, 'CRM_QUERY_MAX_DEPTH', 6)
+        costs = {}
+        rule = cost_limit_validator(max_cost, max_depth, variables, costs.update)
+        errors = validate(schema, document, [rule])
+        name = operation_ast.name.value if operation_ast.name else ''
+        cost, depth = costs[name]
+        extensions = {'cost': {
+            'requested': cost, 'maximum': max_cost, 'depth': depth, 'maxDepth': max_depth,
+        }}
+        # Only the operation being executed has to fit the budget
+        errors = [
+            error for error in errors
+            if any(node is operation_ast for node in error.nodes or ())
+        ]
+        return errors, extensions
+
+    def get_response(self, request, data, show_graphiql=False):
+        """GraphQLView.get_response, also returning the result's extensions"""
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.build_response(request, execution_result, id, show_graphiql)
+
+    def build_response(self, request, execution_result, id=None, show_graphiql=False):
+        """Serialize an execution result; returns (body, status code)"""
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        result, prepared = self.prepare_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if prepared is None:
+            return result
+
+        trace = instrumentation.start(prepared.operation_ast, prepared.digest, variables)
+        try:
+            with instrumentation.tracing(trace):
+                result = self.run_operation(request, prepared, variables, operation_name)
+        except Exception as e:
+            return self.finish_trace(request, trace, ExecutionResult(errors=[e]))
+        return self.finish_trace(request, trace, self.finish_request(prepared, result))
+
+    def prepare_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        """
+        Everything before execution: persisted queries, the cached parse and
+        validation, the cost check and the result cache. Returns (result, None)
+        when the request is answered without executing, else (None, prepared).
+        """
+        persisted_hash = self.get_persisted_query(request, data)
+        if persisted_hash:
+            if query:
+                digest = query_hash(query)
+                if digest != persisted_hash:
+                    return ExecutionResult(errors=[GraphQLError(
+                        "provided sha does not match query",
+                        extensions={'code': 'PERSISTED_QUERY_HASH_MISMATCH'},
+                    )]), None
+                cache.set(
+                    APQ_CACHE_PREFIX + digest, query,
+                    getattr(settings, 'CRM_APQ_TIMEOUT', 60 * 60 * 24)
+                )
+            else:
+                query = cache.get(APQ_CACHE_PREFIX + persisted_hash)
+                if query is None:
+                    document_cache.persisted_misses += 1
+                    return ExecutionResult(errors=[GraphQLError(
+                        "PersistedQueryNotFound",
+                        extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'},
+                    )]), None
+                document_cache.persisted_hits += 1
+                digest = persisted_hash
+        elif query:
+            digest = query_hash(query)
+
+        if not query:
+            if show_graphiql:
+                return None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors), None
+
+        try:
+            document, validation_errors = self.get_document(schema, query, digest)
+        except Exception as e:
+            return ExecutionResult(errors=[e]), None
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None, None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors), None
+
+        cost_errors, extensions = self.check_cost(schema, document, operation_ast, variables)
+        if cost_errors:
+            return ExecutionResult(errors=cost_errors, extensions=extensions), None
+
+        cache_key = None
+        if (
+            result_cache.is_enabled()
+            and operation_ast is not None
+            and operation_ast.operation == OperationType.QUERY
+        ):
+            labels = result_cache.touched_models(schema, document, operation_name)
+            cache_key = result_cache.result_key(digest, variables, operation_name, labels)
+            data = result_cache.get_result(cache_key)
+            if data is not None:
+                return ExecutionResult(data=data, extensions=extensions), None
+
+        return None, PreparedRequest(
+            schema, document, operation_ast, extensions, cache_key, digest
+        )
+
+    def get_context(self, request):
+        context = super().get_context(request)
+        # Before execution, so root fields resolved on pool threads
+        # (crm.async_schema) share one set instead of racing to create it
+        context.crm_loaders = CRMLoaders()
+        return context
+
+    def get_execute_options(self, request, variables, operation_name):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        if instrumentation.is_enabled():
+            execute_options["middleware"] = with_middleware(
+                execute_options["middleware"], instrumentation.middleware
+            )
+        return execute_options
+
+    def run_operation(self, request, prepared, variables, operation_name):
+        execute_options = self.get_execute_options(request, variables, operation_name)
+        operation_ast = prepared.operation_ast
+        if operation_ast is None or operation_ast.operation != OperationType.MUTATION:
+            return execute(prepared.schema, prepared.document, **execute_options)
+
+        # Mutations validate against what they are about to change
+        with db_router.use_primary():
+            if (
+                graphene_settings.ATOMIC_MUTATIONS is True
+                or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+            ):
+                with transaction.atomic():
+                    result = execute(prepared.schema, prepared.document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            return execute(prepared.schema, prepared.document, **execute_options)
+
+    def finish_request(self, prepared, result):
+        result.extensions = prepared.extensions
+        # Partial results are not cached; the errors may be transient. Nor
+        # are replica reads: a lagging replica would cache pre-write rows
+        # under the post-write model versions
+        if (
+            prepared.cache_key is not None
+            and not result.errors
+            and not db_router.read_from_replica()
+        ):
+            result_cache.set_result(prepared.cache_key, result.data)
+        return result
+
+    def finish_trace(self, request, trace, result):
+        """
+        Record the operation's metrics, log it if it was slow and add
+        extensions.timing if asked for
+        """
+        if trace is None:
+            return result
+        trace.finish(result)
+        slow_operations.log_if_slow(trace)
+        if instrumentation.debug_requested(request):
+            result.extensions = {**(result.extensions or {}), 'timing': trace.as_extension()}
+        return result
+
+
+def with_middleware(middleware, extra):
+    """Append a middleware to a view's list or MiddlewareManager"""
+    if isinstance(middleware, MiddlewareManager):
+        return MiddlewareManager(*middleware.middlewares, extra)
+    return [*(middleware or []), extra]
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    CRMGraphQLView for the ASGI entry point, serving crm.async_schema.
+
+    Queries execute on the event loop, so sibling root fields run
+    concurrently; mutations, which must stay serial and atomic, run
+    synchronously on the request's thread. There is no GraphiQL page.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            if self.batch:
+                responses = await asyncio.gather(
+                    *(self.get_response_async(request, entry) for entry in data)
+                )
+                result = "[{}]".format(",".join(response[0] for response in responses))
+                status_code = max((response[1] for response in responses), default=200)
+            else:
+                result, status_code = await self.get_response_async(request, data)
+
+            return HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+    async def get_response_async(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = await self.execute_graphql_request_async(
+            request, data, query, variables, operation_name
+        )
+        return self.build_response(request, execution_result, id)
+
+    async def execute_graphql_request_async(self, request, data, query, variables, operation_name):
+        # Cache lookups may block (Redis), so preparation runs off the loop
+        result, prepared = await sync_to_async(self.prepare_request)(
+            request, data, query, variables, operation_name
+        )
+        if prepared is None:
+            return result
+
+        trace = instrumentation.start(prepared.operation_ast, prepared.digest, variables)
+        try:
+            operation_ast = prepared.operation_ast
+            with instrumentation.tracing(trace):
+                if operation_ast is not None and operation_ast.operation == OperationType.QUERY:
+                    execute_options = self.get_execute_options(request, variables, operation_name)
+                    execute_options["middleware"] = with_middleware(
+                        execute_options["middleware"], SyncResolverMiddleware()
+                    )
+                    result = execute(prepared.schema, prepared.document, **execute_options)
+                    if inspect.isawaitable(result):
+                        result = await result
+                else:
+                    result = await sync_to_async(self.run_operation)(
+                        request, prepared, variables, operation_name
+                    )
+        except Exception as e:
+            return self.finish_trace(request, trace, ExecutionResult(errors=[e]))
+        result = await sync_to_async(self.finish_request)(prepared, result)
+        return self.finish_trace(request, trace, result)
+
+
+def metrics_view(request):
+    """Operation and field metrics of this process in Prometheus text format"""
+    if not instrumentation.is_enabled():
+        return HttpResponse(status=404)
+    return HttpResponse(
+        instrumentation.registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+def graphql_cache_stats(request):
+    """Hit and miss counters of the document, persisted query and result caches"""
+    return JsonResponse({
+        'documents': document_cache.stats(),
+        'results': result_cache.result_stats.stats(),
+    })
+
+
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+@staff_member_required
+def export_view(request, kind):
+    """
+    Stream customers, products or orders as NDJSON (default) or CSV.
+
+    Query parameters other than `format` are the kind's filterset arguments,
+    e.g. /export/orders?format=csv&total_amount_gte=100. Exports carry every
+    customer's contact details, so only staff signed in to the admin may
+    download them; others are sent to the admin login.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    params = request.GET.copy()
+    fmt = params.pop('format', ['ndjson'])[-1]
+    try:
+        queryset = exports.export_queryset(kind, params)
+        if fmt not in EXPORT_CONTENT_TYPES:
+            raise exports.ExportError(
+                f"Unknown format '{fmt}'; choose from {', '.join(exports.FORMATS)}"
+            )
+    except exports.ExportError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response = StreamingHttpResponse(
+        exports.render(kind, exports.export_rows(kind, queryset), fmt),
+        content_type=EXPORT_CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response